@@ -0,0 +1,180 @@
+"""
+Server-side aggregations over the cleaned sales dataset.
+
+These mirror the reductions the dashboard used to run in the browser over
+every row (daily stats, monthly trends, location / pharmacist / payment
+breakdowns, top days), so the API can send small summary tables instead of
+the full dataset. Amounts are net: returns are already negative.
+"""
+
+import pandas as pd
+
+from sales_pipeline import return_mask
+
+
+def filter_sales(df, years=None, months=None, locations=None):
+    """Apply the dashboard's year / month / location filters"""
+    mask = pd.Series(True, index=df.index)
+    if years:
+        mask &= df['Year'].isin(years)
+    if months:
+        mask &= df['Month'].isin(months)
+    if locations:
+        mask &= df['LOCATIONNAME'].isin(locations)
+    return df if mask.all() else df[mask]
+
+
+DIMENSIONS = ['Date', 'Year', 'Month', 'LOCATIONNAME', 'PHARMACISTNAME']
+# Column behind each ?dimension= of the ranking and returns breakdowns
+BREAKDOWN_DIMENSIONS = {
+    'pharmacist': 'PHARMACISTNAME',
+    'location': 'LOCATIONNAME',
+    'day': 'Date',
+}
+MEASURES = ['revenue', 'grossSales', 'returns', 'transactions', 'salesTransactions', 'returnTransactions', 'cash', 'credit']
+
+
+def measure_frame(df):
+    """
+    Dimension columns plus per-row measures. Every aggregate is a sum of these
+    measures, so a frame of already summed rows (the rollup cube) can be
+    aggregated the same way as raw rows.
+    """
+    amount = df['NETREVENUEAMOUNT']
+    # Returns are the '-R' invoices, as in the dataset metadata and the returns analysis
+    is_return = return_mask(df['INVOICENUMBER'])
+    measures = pd.DataFrame({
+        **{column: df[column] for column in DIMENSIONS},
+        'revenue': amount,
+        'grossSales': amount.where(~is_return, 0.0),
+        'returns': (-amount).where(is_return, 0.0),
+        'transactions': 1,
+        'salesTransactions': (~is_return).astype(int),
+        'returnTransactions': is_return.astype(int),
+        'cash': pd.to_numeric(df['CASHREVENUE'], errors='coerce').fillna(0.0) if 'CASHREVENUE' in df else 0.0,
+        'credit': pd.to_numeric(df['CREDITREVENUE'], errors='coerce').fillna(0.0) if 'CREDITREVENUE' in df else 0.0,
+    }, index=df.index)
+    return measures
+
+
+def _records(grouped, key_name):
+    """Turn a grouped sum frame into a list of JSON-friendly dicts"""
+    table = grouped.round(2).reset_index().rename(columns={grouped.index.name or 'index': key_name})
+    return table.to_dict('records')
+
+
+def summarize(totals, unique_days, active_pharmacists):
+    """Headline metrics from a row of summed measures"""
+    sales_transactions = int(totals['salesTransactions'])
+    return {
+        'totalRevenue': round(float(totals['revenue']), 2),
+        'grossSales': round(float(totals['grossSales']), 2),
+        'totalReturns': round(float(totals['returns']), 2),
+        'totalTransactions': int(totals['transactions']),
+        'salesTransactions': sales_transactions,
+        'returnTransactions': int(totals['returnTransactions']),
+        'averageOrderValue': round(float(totals['grossSales']) / sales_transactions, 2) if sales_transactions else 0.0,
+        'uniqueDays': int(unique_days),
+        'averageDailyRevenue': round(float(totals['revenue']) / unique_days, 2) if unique_days else 0.0,
+        'averageDailyTransactions': round(sales_transactions / unique_days, 2) if unique_days else 0.0,
+        'activePharmacists': int(active_pharmacists),
+        'paymentMethods': {
+            'cash': round(float(totals['cash']), 2),
+            'credit': round(float(totals['credit']), 2),
+        },
+    }
+
+
+def top_days(daily):
+    """Best day by net revenue and by transaction count from a daily table"""
+    if daily.empty:
+        return {'topDaySales': None, 'topDayTransactions': None}
+
+    def describe(date):
+        row = daily.loc[date]
+        return {
+            'date': date.strftime('%Y-%m-%d'),
+            'dayName': date.strftime('%A'),
+            'revenue': round(float(row['revenue']), 2),
+            'grossSales': round(float(row['grossSales']), 2),
+            'returns': round(float(row['returns']), 2),
+            'transactions': int(row['transactions']),
+        }
+
+    return {
+        'topDaySales': describe(daily['revenue'].idxmax()),
+        'topDayTransactions': describe(daily['transactions'].idxmax()),
+    }
+
+
+def aggregate_measures(rows):
+    """
+    All dashboard summary tables for an already filtered measure frame:
+    summary, dailyStats, monthlyStatsByYear, locationStats, pharmacistStats,
+    paymentMethods and top days
+    """
+    daily_columns = ['revenue', 'grossSales', 'returns', 'transactions', 'salesTransactions', 'returnTransactions']
+
+    daily = rows[daily_columns].groupby(rows['Date']).sum()
+    monthly = rows[['revenue', 'grossSales', 'returns', 'transactions', 'salesTransactions']].groupby(
+        [rows['Year'], rows['Month']]).sum()
+    by_location = rows[['revenue', 'transactions', 'salesTransactions', 'returns']].groupby(
+        rows['LOCATIONNAME'], observed=True).sum().sort_values('revenue', ascending=False)
+    by_pharmacist = rows[['revenue', 'transactions', 'salesTransactions', 'returns', 'returnTransactions']].groupby(
+        rows['PHARMACISTNAME'], observed=True).sum().sort_values('revenue', ascending=False)
+
+    summary = summarize(rows[MEASURES].sum(), len(daily), by_pharmacist.index.dropna().nunique())
+
+    monthly_by_year = {}
+    for record in monthly.round(2).reset_index().to_dict('records'):
+        year = record.pop('Year')
+        record['month'] = int(record.pop('Month'))
+        monthly_by_year.setdefault(str(int(year)), []).append(record)
+
+    daily_table = daily.round(2)
+    daily_table.index = daily_table.index.strftime('%Y-%m-%d')
+    daily_table.index.name = 'date'
+
+    return {
+        'summary': summary,
+        'paymentMethods': summary['paymentMethods'],
+        'dailyStats': _records(daily_table, 'date'),
+        'monthlyStatsByYear': monthly_by_year,
+        'locationStats': _records(by_location.rename_axis('location'), 'location'),
+        'pharmacistStats': _records(by_pharmacist.rename_axis('name'), 'name'),
+        **top_days(daily),
+    }
+
+
+def _distinct(column):
+    return sorted(str(value) for value in column.dropna().unique())
+
+
+def dataset_metadata(df):
+    """
+    Summary of the whole cleaned dataset (row count, exact date range, years,
+    locations, pharmacists, totals and return counts), computed once per
+    dataset version
+    """
+    amount = df['NETREVENUEAMOUNT']
+    is_return = return_mask(df['INVOICENUMBER'])
+    dates = df['Date']
+    locations = _distinct(df['LOCATIONNAME']) if 'LOCATIONNAME' in df else []
+    return {
+        'total_rows': int(len(df)),
+        'date_range': {
+            'min': dates.min().strftime('%Y-%m-%d') if len(df) else None,
+            'max': dates.max().strftime('%Y-%m-%d') if len(df) else None,
+        },
+        'available_years': sorted((int(year) for year in df['Year'].unique()), reverse=True),
+        'locations': locations,
+        # Older clients read the location list from this key
+        'sample_locations': locations,
+        'pharmacists': _distinct(df['PHARMACISTNAME']) if 'PHARMACISTNAME' in df else [],
+        'unique_days': int(dates.nunique()),
+        'total_revenue': round(float(amount.sum()), 2),
+        'gross_sales': round(float(amount[~is_return].sum()), 2),
+        'return_amount': round(float(-amount[is_return].sum()), 2),
+        'total_returns': int(is_return.sum()),
+        'sales_transactions': int((~is_return).sum()),
+    }
@@ -1,17 +1,47 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, g, jsonify, request, send_from_directory
 from flask_cors import CORS
 import pandas as pd
 import os
+import json
 import requests
-import io
+import logging
+import signal
+import time
+from itertools import chain
 from dotenv import load_dotenv
+from dataset_cache import Dataset, DatasetCache, SourcePayload, hash_file
+from sources import MultiSource, download_to_spool, get_google_drive_download_url, parse_csv_urls
+from sales_pipeline import memory_report, merge_date_counts, read_clean_csv
+from ingest import append_check, append_sorted, dedupe_invoices, ingest_state, key_set, read_appended_rows
+from analytics import dataset_metadata
+from rollup import RollupCube
+from timeseries import time_series
+from rankings import rank
+from comparison import compare_periods
+from returns import ReturnsAnalysis
+from sales_index import PartitionIndex, decode_cursor, encode_cursor, sort_for_index
+from snapshot import load_snapshot, snapshot_dir, write_snapshot
+from sales_store import build_store, configured_backend
+from streaming import (ARROW_MIMETYPE, HAS_PYARROW, NDJSON_MIMETYPE, iter_arrow_ipc, iter_columnar_json,
+                       iter_json_array, iter_json_object, iter_ndjson, negotiate_format)
+from compression import compress_response
+from response_cache import ResponseCache
+from instrumentation import (PROMETHEUS_MIMETYPE, configure_logging, get_logger, observe_request, render_prometheus,
+                             record_stage, timed, timed_iter)
 
 # Load environment variables from .env file (for local development)
 load_dotenv()
 
+# Leveled logging configured by LOG_LEVEL / LOG_FORMAT
+configure_logging()
+logger = get_logger('app')
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Compress API responses with gzip/brotli when the client accepts it
+app.after_request(lambda response: compress_response(request, response))
+
 # Set static folder to React build output for production
 REACT_BUILD_DIR = os.path.join(os.path.dirname(__file__), 'client', 'build')
 if os.path.exists(REACT_BUILD_DIR):
@@ -25,191 +55,473 @@ else:
 # You must set this as an environment variable in production
 GOOGLE_DRIVE_CSV_URL = os.getenv('GOOGLE_DRIVE_CSV_URL')
 
-def get_google_drive_download_url(share_url):
+LOCAL_CSV_PATH = os.path.join(os.path.dirname(__file__), 'sales.csv')
+
+def configured_multi_source():
     """
-    Convert a Google Drive share URL to a direct download URL
-    Supports both file/d/ and open?id= formats
+    A multi-file source when several Drive URLs (GOOGLE_DRIVE_CSV_URLS, comma separated) or a
+    directory of CSVs (SALES_CSV_DIR) are configured, otherwise None (single CSV)
     """
-    if 'drive.google.com' not in share_url:
-        return share_url
-    
-    # Extract file ID from different Google Drive URL formats
-    file_id = None
-    
-    if '/file/d/' in share_url:
-        # Format: https://drive.google.com/file/d/FILE_ID/view?usp=sharing
-        file_id = share_url.split('/file/d/')[1].split('/')[0]
-    elif 'open?id=' in share_url:
-        # Format: https://drive.google.com/open?id=FILE_ID
-        file_id = share_url.split('open?id=')[1].split('&')[0]
-    elif 'id=' in share_url:
-        # Format: https://drive.google.com/uc?id=FILE_ID
-        file_id = share_url.split('id=')[1].split('&')[0]
-    
-    if file_id:
-        return f"https://drive.google.com/uc?export=download&id={file_id}"
-    
-    return share_url
+    workers = int(os.getenv('INGEST_WORKERS', 0)) or None
+    urls = parse_csv_urls(os.getenv('GOOGLE_DRIVE_CSV_URLS'))
+    if urls:
+        return MultiSource(urls=urls, workers=workers)
+    directory = os.getenv('SALES_CSV_DIR')
+    if directory:
+        return MultiSource(directory=directory, workers=workers)
+    return None
+
+multi_source = configured_multi_source()
+
+# Append-only ingestion of the single CSV: only rows added since the last build are parsed,
+# and repeated invoices (same number, date and amount) are dropped (see ingest.py)
+INCREMENTAL_INGEST = os.getenv('INCREMENTAL_INGEST', '').lower() in ('1', 'true', 'yes')
+
+# Where the filtered / aggregate / metadata queries run: the in-memory frame (pandas) or an
+# embedded database file (sqlite / duckdb) in DATASET_STORE_DIR
+DATASET_BACKEND = configured_backend()
+DATASET_STORE_DIR = os.getenv('DATASET_STORE_DIR') or snapshot_dir()
+
+# Rows per page of /api/sales-data-filtered when no limit is given, and the most a page may hold
+DEFAULT_PAGE_SIZE = 10000
+MAX_PAGE_SIZE = 50000
 
-def load_csv_data():
+def fetch_sales_csv(validators=None):
     """
-    Load CSV data from Google Drive or local file (for development)
-    Tries Google Drive first if GOOGLE_DRIVE_CSV_URL is set, falls back to local sales.csv
+    Fetch the raw CSV from Google Drive or the local file (for development).
+    Tries Google Drive first if GOOGLE_DRIVE_CSV_URL is set, falls back to local sales.csv.
+    When `validators` from a previous fetch of the same source are passed in, returns a
+    payload without content if the source reports that nothing changed.
     """
-    print("Loading CSV data...")
-    
+    validators = validators or {}
+
     # Try Google Drive first if URL is configured
     if GOOGLE_DRIVE_CSV_URL:
         try:
-            print(f"Attempting to load from Google Drive: {GOOGLE_DRIVE_CSV_URL}")
+            logger.info("Loading from Google Drive", extra={'url': GOOGLE_DRIVE_CSV_URL})
             download_url = get_google_drive_download_url(GOOGLE_DRIVE_CSV_URL)
-            print(f"Download URL: {download_url}")
-            
-            # Download the file
-            response = requests.get(download_url, timeout=30)
-            response.raise_for_status()
-            
-            # Read CSV from the downloaded content
-            csv_content = io.StringIO(response.text)
-            df = pd.read_csv(csv_content)
-            print(f"✅ Successfully loaded {len(df)} rows from Google Drive")
-            return df
-            
+
+            headers = {}
+            if validators.get('source') == 'Google Drive':
+                if validators.get('etag'):
+                    headers['If-None-Match'] = validators['etag']
+                if validators.get('last_modified'):
+                    headers['If-Modified-Since'] = validators['last_modified']
+
+            with requests.get(download_url, headers=headers, timeout=30, stream=True) as response:
+                if response.status_code == 304:
+                    logger.info("Google Drive file not modified since last load")
+                    return SourcePayload(None, 'Google Drive', validators.get('etag'), validators.get('last_modified'))
+                response.raise_for_status()
+                with timed('download'):
+                    path, digest, size = download_to_spool(response)
+
+            logger.info("Downloaded from Google Drive", extra={'bytes': size})
+            return SourcePayload(
+                None,
+                'Google Drive',
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+                path=path,
+                digest=digest,
+                temporary=True,
+            )
+
         except Exception as e:
-            print(f"❌ Failed to load from Google Drive: {str(e)}")
-            print("🔄 Falling back to local CSV file...")
-    
+            logger.error("Failed to load from Google Drive, falling back to local CSV file", extra={'error': str(e)})
+
     # Fallback to local CSV file (for development)
     try:
-        local_csv_path = os.path.join(os.path.dirname(__file__), 'sales.csv')
-        if os.path.exists(local_csv_path):
-            df = pd.read_csv(local_csv_path)
-            print(f"✅ Successfully loaded {len(df)} rows from local CSV file")
-            return df
-        else:
+        if not os.path.exists(LOCAL_CSV_PATH):
             raise FileNotFoundError("Local sales.csv file not found")
-            
+
+        stat = os.stat(LOCAL_CSV_PATH)
+        last_modified = f"{stat.st_mtime_ns}-{stat.st_size}"
+        if validators.get('source') == 'Local CSV' and validators.get('last_modified') == last_modified:
+            return SourcePayload(None, 'Local CSV', last_modified=last_modified)
+
+        return SourcePayload(
+            None,
+            'Local CSV',
+            last_modified=last_modified,
+            path=LOCAL_CSV_PATH,
+            digest=hash_file(LOCAL_CSV_PATH),
+        )
+
     except Exception as e:
-        print(f"❌ Failed to load from local CSV: {str(e)}")
+        logger.error("Failed to load from local CSV", extra={'error': str(e)})
         raise Exception(f"Failed to load data from both Google Drive and local CSV. Please check your configuration or local sales.csv file. Error: {str(e)}")
 
+def fetch_dataset_source(validators=None):
+    """Fetch the configured source: several files if configured, the single CSV otherwise"""
+    if multi_source is not None:
+        return multi_source.fetch(validators)
+    return fetch_sales_csv(validators)
+
+def append_to_dataset(payload):
+    """
+    The current dataset plus the rows appended to the CSV since it was built, or None when
+    earlier rows changed (or there is nothing to append to) and a full build is needed
+    """
+    previous = sales_cache.peek()
+    if previous is None or previous.source != payload.source:
+        return None
+    size = os.path.getsize(payload.path)
+    reason = append_check(getattr(previous, 'ingest', None), payload.path, size)
+    if reason:
+        logger.info("Rebuilding the dataset instead of appending", extra={'reason': reason})
+        return None
+
+    with timed('append'):
+        new_rows = read_appended_rows(payload.path, previous.ingest)
+        date_counts = new_rows.attrs.get('invoice_dates')
+        # Read back from the store once if a SQL backend released it
+        frame = previous.frame
+        known = getattr(previous, 'invoice_keys', None)
+        if known is None:
+            # Restored from a snapshot without the key set: hashed once, then extended
+            known = key_set(frame)
+        new_rows, duplicates, keys = dedupe_invoices(new_rows, known)
+        if len(new_rows):
+            df, boundary = append_sorted(frame, new_rows)
+        else:
+            df, boundary = frame.copy(deep=False), len(frame)
+            df.attrs = {}
+    df.attrs['invoice_dates'] = merge_date_counts([getattr(previous, 'date_parsing', None), date_counts])
+    df.attrs['ingest'] = ingest_state(payload.path, payload.version(), size)
+    df.attrs['invoice_keys'] = keys
+    df.attrs['appended'] = {
+        'previous_version': previous.version,
+        'boundary': boundary,
+        'rows': len(new_rows),
+        'duplicates': duplicates,
+    }
+    logger.info("Appended rows to the dataset", extra={'rows': len(new_rows), 'duplicates': duplicates,
+                                                        'resorted_rows': len(df) - boundary})
+    return df
+
+def build_sales_dataset(payload):
+    """Parse and clean the fetched CSV(s), chunk by chunk, into the frame shared by all routes"""
+    single_file = getattr(payload, 'source_files', None) is None
+    if not single_file:
+        df = multi_source.build(payload)
+    else:
+        if INCREMENTAL_INGEST:
+            appended = append_to_dataset(payload)
+            if appended is not None:
+                return appended
+        df = read_clean_csv(payload.path)
+    date_counts = df.attrs.get('invoice_dates') or {}
+    logger.info("Invoice dates parsed", extra={
+        'rows': date_counts.get('rows'),
+        'parsed': date_counts.get('parsed'),
+        'unparseable': date_counts.get('unparseable'),
+        'missing': date_counts.get('missing'),
+        'new_strings': date_counts.get('learned'),
+    })
+    if INCREMENTAL_INGEST and single_file:
+        # First occurrence wins, as on appends
+        df, duplicates, keys = dedupe_invoices(df)
+        if duplicates:
+            logger.info("Dropped duplicate invoices", extra={'duplicates': duplicates})
+    with timed('sort'):
+        df = sort_for_index(df)
+    # Full-frame breakdowns are only worth computing when someone reads them
+    if logger.isEnabledFor(logging.DEBUG):
+        by_year = df.groupby('Year')['NETREVENUEAMOUNT'].agg(['count', 'sum']).round(2)
+        logger.debug("Cleaned dataset breakdown", extra={
+            'total_revenue': round(float(df['NETREVENUEAMOUNT'].sum()), 2),
+            'date_min': df['Date'].min(),
+            'date_max': df['Date'].max(),
+            'by_year': by_year.to_dict('index'),
+        })
+    if INCREMENTAL_INGEST and single_file:
+        df.attrs['ingest'] = ingest_state(payload.path, payload.version(), os.path.getsize(payload.path))
+        df.attrs['invoice_keys'] = keys
+    return df
+
+def derive_dataset_structures(dataset, previous):
+    """Precompute per-version structures; the rollup cube is updated incrementally when possible"""
+    # Taken off the frame first: pandas deep-copies attrs into every frame derived from it
+    dataset.invoice_keys = dataset.frame.attrs.pop('invoice_keys', None)
+    if previous is not None and getattr(previous, 'rollup', None) is not None:
+        dataset.rollup = previous.rollup.updated(dataset.frame)
+    else:
+        dataset.rollup = RollupCube.build(dataset.frame)
+    logger.info("Rollup cube ready", extra=dataset.rollup.info())
+    dataset.ingest = dataset.frame.attrs.get('ingest')
+    # Returns joined to their sales once per version
+    with timed('returns'):
+        dataset.returns = ReturnsAnalysis.build(dataset.frame)
+    logger.info("Returns matched to sales", extra=dataset.returns.info())
+    # Per-format INVOICEDATE parse counts (not kept in snapshots)
+    dataset.date_parsing = dataset.frame.attrs.get('invoice_dates')
+    dataset.appended = appended = dataset.frame.attrs.get('appended')
+    dataset.store = build_store(dataset, DATASET_BACKEND, DATASET_STORE_DIR, getattr(previous, 'store', None))
+    # A database store pages and describes the rows itself, so the partition index and the
+    # in-memory metadata are only built for the pandas path
+    dataset.index = dataset.metadata = None
+    if dataset.store.backend == 'pandas':
+        previous_index = getattr(previous, 'index', None)
+        if appended and previous_index is not None and previous.version == appended['previous_version']:
+            # Rows before the boundary kept their positions
+            dataset.index = previous_index.appended(dataset.frame, appended['boundary'])
+        else:
+            dataset.index = PartitionIndex(dataset.frame)
+        dataset.metadata = dataset_metadata(dataset.frame)
+
+def release_frame_to_store(dataset):
+    """With a SQL backend the store holds the rows: stop keeping the frame in memory as well"""
+    if dataset.store.backend != 'pandas':
+        dataset.release_frame(dataset.store.read_frame)
+
+def persist_dataset(dataset):
+    """Snapshot a fresh build, then let its store (if any) be the only copy of the rows"""
+    write_snapshot(dataset)
+    release_frame_to_store(dataset)
+
+# Cleaned dataset shared by every route; revalidated against the source after the TTL,
+# or every DATASET_REFRESH_INTERVAL seconds by the background refresher once it is started
+sales_cache = DatasetCache(
+    fetch_dataset_source,
+    build_sales_dataset,
+    ttl_seconds=int(os.getenv('DATASET_CACHE_TTL', 300)),
+    derive=derive_dataset_structures,
+    persist=persist_dataset,
+)
+
+def restore_dataset_snapshot():
+    """Serve the last snapshot at startup instead of re-downloading and parsing the CSV"""
+    restored = load_snapshot()
+    if restored is None:
+        return False
+    frame, meta = restored
+    # Lets the next change of the CSV be appended instead of rebuilt
+    frame.attrs['ingest'] = meta.get('ingest')
+    dataset = Dataset(
+        frame,
+        meta['version'],
+        meta['source'],
+        etag=meta.get('etag'),
+        last_modified=meta.get('last_modified'),
+        loaded_at=meta.get('written_at'),
+        files=meta.get('files'),
+    )
+    sales_cache.seed(dataset)
+    release_frame_to_store(dataset)
+    logger.info("Restored dataset snapshot", extra={'rows': len(frame), 'format': meta['format'], 'version': meta['version']})
+    return True
+
+restore_dataset_snapshot()
+
+def preload_dataset():
+    """
+    Load the cleaned dataset and its derived structures up front. Under gunicorn this runs in
+    the master before forking, so every worker shares the same frame copy-on-write.
+    """
+    try:
+        dataset = sales_cache.get()
+        logger.info("Dataset preloaded", extra={'rows': dataset.rows, 'version': dataset.version})
+    except Exception as e:
+        # Not fatal: requests will retry the load
+        logger.warning("Dataset preload failed", extra={'error': str(e)})
+
+def start_background_refresh(on_new_version=None):
+    """
+    Revalidate the source in a background thread so requests never wait on Google Drive.
+    Under gunicorn this runs in the master, which replaces its workers after each new version
+    (`on_new_version`, see gunicorn.conf.py).
+    """
+    interval = int(os.getenv('DATASET_REFRESH_INTERVAL', sales_cache.ttl_seconds))
+    sales_cache.start_refresher(interval, on_new_version=on_new_version)
+    logger.info("Background dataset refresh started", extra={'interval_seconds': interval})
+
+def follow_parent_refresh():
+    """
+    In a gunicorn worker: serve the dataset forked from the master and never rebuild it here.
+    A refresh request (/api/cache/invalidate) is passed on to the master with SIGHUP.
+    """
+    parent = os.getppid()
+    sales_cache.follow(lambda: os.kill(parent, signal.SIGHUP))
+
+# Set by the ASGI adapter (asgi.py): the dataset load the request already awaited
+DATASET_LOAD_ENVIRON_KEY = 'pharmacy.dataset_load'
+
+def current_dataset():
+    """
+    The shared dataset for this request, fixed for the whole request even if a refresh swaps in a
+    new one meanwhile; its version and age are reported in the response headers
+    """
+    if g.get('dataset') is None:
+        load = request.environ.get(DATASET_LOAD_ENVIRON_KEY)
+        # A load that failed raises its error again here instead of being retried
+        g.dataset = load.result() if load is not None else sales_cache.get()
+    return g.dataset
+
+# Serialized responses keyed on (endpoint, query, dataset version), answered with 304 when unchanged
+response_cache = ResponseCache(max_bytes=int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024)))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_timing(response):
+    started = g.get('request_started')
+    if started is not None:
+        observe_request(request.endpoint, response.status_code, time.perf_counter() - started)
+    return response
+
+@app.after_request
+def add_dataset_headers(response):
+    """Tell clients which dataset version answered the request and how old it is"""
+    dataset = g.get('dataset')
+    if dataset is not None:
+        response.headers['X-Dataset-Version'] = dataset.version
+        response.headers['X-Dataset-Age'] = str(int(dataset.age_seconds()))
+    return response
+
 @app.route('/api/sales-data')
+@response_cache.cached(current_dataset)
 def get_sales_data():
     try:
-        print("API endpoint called: /api/sales-data")
-        
-        # Load data from Google Drive or local file
-        df = load_csv_data()
-        print(f"CSV loaded: {len(df)} rows")
-        
-        # Log initial data sample
-        print("Sample of original data:")
-        print(df[['INVOICENUMBER', 'INVOICEDATE', 'NETREVENUEAMOUNT', 'PHARMACISTNAME']].head(3))
-          # Handle returned transactions using correct uppercase column names
-        original_revenue_sum = df['NETREVENUEAMOUNT'].sum()
-        print(f"Original total revenue (before return handling): {original_revenue_sum:,.2f} ﷼")
-        
-        # Apply return logic: negate revenue for invoices with '-R' in the number
-        return_mask = df['INVOICENUMBER'].astype(str).str.contains('-R', na=False)
-        returns_count = return_mask.sum()
-        print(f"Found {returns_count} return transactions (invoices with '-R')")
-        
-        df['NETREVENUEAMOUNT'] = df.apply(lambda row: -row['NETREVENUEAMOUNT'] if '-R' in str(row['INVOICENUMBER']) else row['NETREVENUEAMOUNT'], axis=1)
-        
-        adjusted_revenue_sum = df['NETREVENUEAMOUNT'].sum()
-        print(f"Adjusted total revenue (after return handling): {adjusted_revenue_sum:,.2f} ﷼")
-        print(f"Revenue difference due to returns: {adjusted_revenue_sum - original_revenue_sum:,.2f} ﷼")# Convert 'INVOICEDATE' column to datetime with correct format (DD/MM/YYYY)
-        print("Processing dates...")
-        print("Sample date formats from raw data:")
-        print(df['INVOICEDATE'].head(10).tolist())
-        
-        # The CSV uses DD/MM/YYYY format, so we need to specify dayfirst=True
-        df['Date'] = pd.to_datetime(df['INVOICEDATE'], format='%d/%m/%Y', errors='coerce')
-        
-        # Check for any dates that failed to parse
-        null_dates_count = df['Date'].isnull().sum()
-        print(f"Dates that failed to parse with DD/MM/YYYY format: {null_dates_count:,} out of {len(df):,}")
-        
-        if null_dates_count > 0:
-            print("Sample of failed date parsing:")
-            failed_dates = df[df['Date'].isnull()]['INVOICEDATE'].head(10)
-            print(failed_dates.tolist())
-            
-            # Try alternative format for any remaining failed dates
-            print("Attempting alternative date parsing for failed dates...")
-            failed_mask = df['Date'].isnull()
-            df.loc[failed_mask, 'Date'] = pd.to_datetime(
-                df.loc[failed_mask, 'INVOICEDATE'], 
-                errors='coerce',
-                dayfirst=True
-            )
-            
-            # Final count after alternative parsing
-            final_null_count = df['Date'].isnull().sum()
-            print(f"Final dates that failed to parse: {final_null_count:,} out of {len(df):,}")
-        
-        # Only drop rows where the date conversion completely failed
-        original_count = len(df)
-        df.dropna(subset=['Date'], inplace=True)
-        print(f"After date filtering: {len(df):,} rows (removed {original_count - len(df):,} rows)")
-        
-        if len(df) == original_count:
-            print("✅ SUCCESS: All dates parsed successfully!")
-        elif len(df) > original_count * 0.95:
-            print("✅ GOOD: Successfully parsed over 95% of dates")
-        else:
-            print(f"⚠️ WARNING: Lost {original_count - len(df):,} rows ({(original_count - len(df))/original_count*100:.1f}%) due to date parsing issues!")
-        
-        # Extract year and month
-        df['Year'] = df['Date'].dt.year
-        df['Month'] = df['Date'].dt.month
-        
-        # Ensure numeric columns are properly typed
-        df['NETREVENUEAMOUNT'] = pd.to_numeric(df['NETREVENUEAMOUNT'], errors='coerce')
-        df['Year'] = df['Year'].astype(int)
-        df['Month'] = df['Month'].astype(int)
-          # Drop rows with invalid revenue amounts
-        df.dropna(subset=['NETREVENUEAMOUNT'], inplace=True)
-        print(f"After revenue filtering: {len(df)} rows")
-        
-        # Additional validation - remove any infinite or extremely large values
-        df = df[df['NETREVENUEAMOUNT'].between(-1000000, 1000000)]  # Reasonable range for pharmacy transactions
-        print(f"After range validation: {len(df)} rows")
-        
-        # Log revenue statistics by year
-        yearly_stats = df.groupby('Year')['NETREVENUEAMOUNT'].agg(['count', 'sum', 'mean']).round(2)
-        print("Revenue statistics by year:")
-        print(yearly_stats)
-        
-        # Log monthly statistics for verification
-        monthly_stats = df.groupby(['Year', 'Month'])['NETREVENUEAMOUNT'].agg(['count', 'sum']).round(2)
-        print("Sample monthly statistics:")
-        print(monthly_stats.head(10))
+        df = current_dataset().frame
+        logger.debug("Sending full dataset", extra={'rows': len(df)})
 
         # Rename columns to match what the frontend expects
-        df.rename(columns={'NETREVENUEAMOUNT': 'NetRevenueAmount', 'PHARMACISTNAME': 'Pharmacist'}, inplace=True)
-          # Final validation before sending to frontend
-        final_total = df['NetRevenueAmount'].sum()
-        print(f"Final total revenue being sent to frontend: {final_total:,.2f} ﷼")
-        print(f"Total records being sent: {len(df)}")
-        
-        print("Data processing complete, returning JSON")
-        return df.to_json(orient='records')
+        df = df.rename(columns={'NETREVENUEAMOUNT': 'NetRevenueAmount', 'PHARMACISTNAME': 'Pharmacist'})
+        return stream_rows(df)
         
     except Exception as e:
-        print(f"ERROR in get_sales_data: {str(e)}")
+        logger.exception("get_sales_data failed")
         return jsonify({"error": str(e)}), 500
 
+def jsonify_dumps(value):
+    """Encode `value` exactly as jsonify() does outside debug mode (the app's JSON provider, compact)"""
+    return app.json.dumps(value, separators=(',', ':'))
+
+def stream_rows(df, headers=None, dumps=None):
+    """
+    Stream rows in the layout the client negotiated: JSON array (default), NDJSON,
+    columnar JSON with dictionary-encoded names, or an Arrow IPC stream. With `dumps`
+    the JSON and NDJSON records are encoded by it instead of `to_json` with epoch dates.
+    """
+    wire_format = negotiate_format(request)
+
+    if wire_format == 'arrow':
+        if not HAS_PYARROW:
+            return jsonify({"error": "Arrow output is not available on this server (pyarrow is not installed)"}), 406
+        return Response(timed_iter('serialize', iter_arrow_ipc(df)), mimetype=ARROW_MIMETYPE, headers=headers)
+    if wire_format == 'columnar':
+        dictionary_columns = [column for column in ('LOCATIONNAME', 'PHARMACISTNAME', 'Pharmacist') if column in df]
+        return Response(timed_iter('serialize', iter_columnar_json(df, dictionary_columns)), mimetype='application/json', headers=headers)
+
+    # Date goes out as epoch milliseconds, which is what the frontend has always parsed
+    def epoch_dates(chunk):
+        return chunk.assign(Date=(chunk['Date'] - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1))
+
+    transform = epoch_dates if dumps is None else None
+    if wire_format == 'ndjson':
+        return Response(timed_iter('serialize', iter_ndjson(df, transform=transform, dumps=dumps)),
+                        mimetype=NDJSON_MIMETYPE, headers=headers)
+    return Response(timed_iter('serialize', iter_json_array(df, transform=transform, dumps=dumps)),
+                    mimetype='application/json', headers=headers)
+
+@app.route('/api/cache/stats')
+def get_cache_stats():
+    """Hit/miss counters and build timings of the shared dataset cache"""
+    stats = sales_cache.stats()
+    dataset = sales_cache.peek()
+    stats['rollup'] = dataset.rollup.info() if dataset is not None else None
+    stats['store'] = dataset.store.info() if dataset is not None else None
+    stats['invoice_dates'] = dataset.date_parsing if dataset is not None else None
+    stats['returns'] = dataset.returns.info() if dataset is not None else None
+    stats['ingest'] = {
+        'mode': 'incremental' if INCREMENTAL_INGEST else 'full',
+        'last_append': dataset.appended if dataset is not None else None,
+    }
+    stats['responses'] = response_cache.stats()
+    return jsonify(stats)
+
+@app.route('/api/metrics')
+def get_metrics():
+    """Stage and request timings plus cache counters in the Prometheus text format"""
+    dataset_stats = sales_cache.stats()
+    response_stats = response_cache.stats()
+    metrics = [
+        ('pharmacy_dataset_rows', 'gauge', 'Rows in the dataset being served', [({}, dataset_stats['rows'])]),
+        ('pharmacy_dataset_age_seconds', 'gauge', 'Seconds since the served dataset was built', [({}, dataset_stats['age_seconds'])]),
+        ('pharmacy_dataset_last_build_seconds', 'gauge', 'Duration of the last dataset build', [({}, dataset_stats['last_build_seconds'])]),
+        ('pharmacy_dataset_cache_events_total', 'counter', 'Dataset cache events by kind', [
+            ({'event': event}, dataset_stats[event])
+            for event in ('hits', 'misses', 'builds', 'not_modified', 'unchanged_content', 'refresh_failures')
+        ]),
+        ('pharmacy_response_cache_events_total', 'counter', 'Response cache events by kind', [
+            ({'event': event}, response_stats[event])
+            for event in ('hits', 'misses', 'not_modified', 'stores', 'evictions', 'too_large')
+        ]),
+        ('pharmacy_response_cache_bytes', 'gauge', 'Bytes held by the response cache', [({}, response_stats['bytes'])]),
+    ]
+    dataset = sales_cache.peek()
+    date_counts = getattr(dataset, 'date_parsing', None)
+    if date_counts:
+        metrics.append(('pharmacy_invoice_date_rows', 'gauge', 'INVOICEDATE values of the served dataset by format and outcome', [
+            ({'format': name, 'result': result}, date_counts[result][name])
+            for result in ('parsed', 'failed') for name in date_counts[result]
+        ] + [({'format': 'none', 'result': 'unparseable'}, date_counts['unparseable'])]))
+    return Response(render_prometheus(metrics), mimetype=PROMETHEUS_MIMETYPE)
+
+def dataset_memory(dataset):
+    """memory_report of a dataset's frame, computed on first use and kept for that version"""
+    # Not built with the dataset: a deep memory_usage is too slow for every refresh
+    if getattr(dataset, 'memory', None) is None:
+        dataset.memory = memory_report(dataset.frame)
+    return dataset.memory
+
+@app.route('/api/memory')
+def get_memory_report():
+    """Memory used by the cached dataset compared to the naive object/int64 representation"""
+    try:
+        dataset = current_dataset()
+        report = dict(dataset_memory(dataset))
+        report['rollup_bytes'] = dataset.rollup.info()['memory_bytes']
+        report['index_bytes'] = dataset.index.info()['memory_bytes'] if dataset.index is not None else 0
+        # False when a SQL backend holds the rows and the frame above was read back from it
+        report['frame_resident'] = dataset.frame_resident
+        return jsonify(report)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    """Revalidate the dataset against its source in the background; the current one is served meanwhile"""
+    sales_cache.invalidate()
+    sales_cache.request_refresh()
+    return jsonify({"success": True, "message": "Dataset cache invalidated, refresh scheduled"})
+
+def dataset_status():
+    """Version and age of the dataset being served, without triggering a load"""
+    dataset = sales_cache.peek()
+    return {
+        "loaded": dataset is not None,
+        "version": dataset.version if dataset else None,
+        "source": dataset.source if dataset else None,
+        "age_seconds": round(dataset.age_seconds(), 1) if dataset else None,
+        "last_refresh_error": sales_cache.last_error,
+    }
+
 @app.route('/api/health')
 def health_check():
-    return jsonify({"status": "healthy", "message": "Flask server is running"})
+    return jsonify({"status": "healthy", "message": "Flask server is running", "dataset": dataset_status()})
 
 @app.route('/api/config/google-drive-url', methods=['GET'])
 def get_google_drive_config():
     """Get current Google Drive URL configuration and data source status"""
     local_csv_exists = os.path.exists(os.path.join(os.path.dirname(__file__), 'sales.csv'))
     
-    if GOOGLE_DRIVE_CSV_URL:
+    if multi_source is not None:
+        data_source = multi_source.label
+    elif GOOGLE_DRIVE_CSV_URL:
         data_source = "Google Drive"
     elif local_csv_exists:
         data_source = "Local CSV (Development)"
@@ -219,60 +531,81 @@ def get_google_drive_config():
     return jsonify({
         "google_drive_url": GOOGLE_DRIVE_CSV_URL,
         "data_source": data_source,
-        "is_configured": bool(GOOGLE_DRIVE_CSV_URL) or local_csv_exists,
-        "local_csv_available": local_csv_exists
+        "is_configured": multi_source is not None or bool(GOOGLE_DRIVE_CSV_URL) or local_csv_exists,
+        "local_csv_available": local_csv_exists,
+        "multi_source": multi_source.describe() if multi_source is not None else None
     })
 
+# Where a gunicorn worker leaves a Google Drive URL change for the master, which applies it on
+# SIGHUP before forking the new workers (see gunicorn.conf.py)
+SOURCE_CHANGE_PATH = os.path.join(snapshot_dir(), 'source-change.json')
+
+def apply_google_drive_url(url):
+    """Load from `url` from now on (None clears it); the new data is loaded in the background"""
+    global GOOGLE_DRIVE_CSV_URL, multi_source
+    GOOGLE_DRIVE_CSV_URL = url
+    if url:
+        # A single URL replaces any multi-file source
+        multi_source = None
+    logger.info("Google Drive URL updated", extra={'url': url})
+    sales_cache.invalidate(refetch=True)
+    sales_cache.request_refresh()
+
+def hand_source_change_to_master(url):
+    """In a gunicorn worker: store the new URL where the master reads it on the SIGHUP that follows"""
+    os.makedirs(os.path.dirname(SOURCE_CHANGE_PATH), exist_ok=True)
+    pending = f"{SOURCE_CHANGE_PATH}.{os.getpid()}.tmp"
+    with open(pending, 'w') as f:
+        json.dump({'url': url}, f)
+    os.replace(pending, SOURCE_CHANGE_PATH)
+
+def apply_pending_source_change():
+    """In the gunicorn master: apply a URL change handed over by a worker; False if there is none"""
+    try:
+        with open(SOURCE_CHANGE_PATH) as f:
+            change = json.load(f)
+        os.remove(SOURCE_CHANGE_PATH)
+    except FileNotFoundError:
+        return False
+    apply_google_drive_url(change['url'])
+    return True
+
 @app.route('/api/config/google-drive-url', methods=['POST'])
 def set_google_drive_config():
-    """Set Google Drive URL configuration"""
-    global GOOGLE_DRIVE_CSV_URL
+    """Set Google Drive URL configuration (a single URL replaces any multi-file source)"""
     try:
         data = request.get_json()
         new_url = data.get('url', '').strip()
         
+        if new_url and 'drive.google.com' not in new_url:
+            return jsonify({"error": "Invalid Google Drive URL"}), 400
+        if sales_cache.follows:
+            # Under gunicorn the master owns the source and the workers are forked from it
+            hand_source_change_to_master(new_url or None)
+        # Loaded in the background; the current dataset is served until the new one is ready.
+        # Progress (or the load error) shows up in /api/health and /api/cache/stats.
+        apply_google_drive_url(new_url or None)
+        
         if new_url:
-            # Validate that it's a Google Drive URL
-            if 'drive.google.com' not in new_url:
-                return jsonify({"error": "Invalid Google Drive URL"}), 400
-            
-            GOOGLE_DRIVE_CSV_URL = new_url
-            print(f"Google Drive URL updated to: {new_url}")
-            
-            # Test the connection
-            try:
-                test_df = load_csv_data()
-                return jsonify({
-                    "success": True,
-                    "message": f"Google Drive URL updated successfully. Found {len(test_df)} records.",
-                    "google_drive_url": GOOGLE_DRIVE_CSV_URL
-                })
-            except Exception as e:
-                return jsonify({"error": f"Failed to load data from new URL: {str(e)}"}), 400
+            return jsonify({
+                "success": True,
+                "message": "Google Drive URL updated. The data is being reloaded in the background.",
+                "google_drive_url": GOOGLE_DRIVE_CSV_URL,
+                "dataset": dataset_status()
+            }), 202
         else:
-            GOOGLE_DRIVE_CSV_URL = None
             return jsonify({"success": True, "message": "Google Drive URL cleared. No data source configured."})
             
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/verify-totals')
+@response_cache.cached(current_dataset)
 def verify_totals():
     """Endpoint to verify total calculations without any frontend filtering"""
     try:
-        df = load_csv_data()
-        
-        # Apply same processing as main endpoint
-        df['NETREVENUEAMOUNT'] = df.apply(lambda row: -row['NETREVENUEAMOUNT'] if '-R' in str(row['INVOICENUMBER']) else row['NETREVENUEAMOUNT'], axis=1)
-        df['Date'] = pd.to_datetime(df['INVOICEDATE'], errors='coerce')
-        df.dropna(subset=['Date'], inplace=True)
-        df['Year'] = df['Date'].dt.year
-        df['Month'] = df['Date'].dt.month
-        df['NETREVENUEAMOUNT'] = pd.to_numeric(df['NETREVENUEAMOUNT'], errors='coerce')
-        df['Year'] = df['Year'].astype(int)
-        df['Month'] = df['Month'].astype(int)
-        df.dropna(subset=['NETREVENUEAMOUNT'], inplace=True)
-        df = df[df['NETREVENUEAMOUNT'].between(-1000000, 1000000)]
+        # Same cleaned dataset as the main endpoint
+        df = current_dataset().frame
         
         # Calculate totals
         grand_total = df['NETREVENUEAMOUNT'].sum()
@@ -285,75 +618,32 @@ def verify_totals():
             "grand_total": float(grand_total),
             "total_records": int(total_count),
             "year_breakdown": year_breakdown,
-            "sample_records": df[['INVOICENUMBER', 'INVOICEDATE', 'NETREVENUEAMOUNT', 'PHARMACISTNAME']].head(5).to_dict('records')        })
+            "sample_records": df[['INVOICENUMBER', 'Date', 'NETREVENUEAMOUNT', 'PHARMACISTNAME']].head(5)
+                .assign(INVOICEDATE=lambda sample: sample.pop('Date').dt.strftime('%d/%m/%Y'))
+                .to_dict('records')
+        })
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/sales-data-meta')
 def get_sales_data_meta():
-    """Get metadata about the sales data (counts, available years, etc.) for faster loading"""
+    """Metadata about the full dataset (counts, date range, years, locations, totals), precomputed at load time"""
     try:
-        print("Getting sales data metadata...")
+        dataset = current_dataset()
         
-        # Load raw CSV without heavy processing for faster metadata
-        if GOOGLE_DRIVE_CSV_URL:
-            try:
-                download_url = get_google_drive_download_url(GOOGLE_DRIVE_CSV_URL)
-                response = requests.get(download_url, timeout=30)
-                response.raise_for_status()
-                csv_content = io.StringIO(response.text)
-                df = pd.read_csv(csv_content)
-            except Exception as e:
-                print(f"Failed to load from Google Drive: {e}")
-                df = pd.read_csv(os.path.join(os.path.dirname(__file__), 'sales.csv'))
-        else:
-            df = pd.read_csv(os.path.join(os.path.dirname(__file__), 'sales.csv'))
-        
-        print(f"Raw CSV loaded: {len(df)} rows")
-        
-        # Quick processing for metadata only
-        total_rows = len(df)
-        
-        # Sample first 10,000 rows for quick metadata extraction
-        sample_df = df.head(10000).copy()
-        
-        # Quick date processing for sample
-        sample_df['Date'] = pd.to_datetime(sample_df['INVOICEDATE'], format='%d/%m/%Y', errors='coerce')
-        sample_df.dropna(subset=['Date'], inplace=True)
-        sample_df['Year'] = sample_df['Date'].dt.year
-        
-        # Get available years from sample
-        available_years = sorted(sample_df['Year'].unique().tolist(), reverse=True)
-          # Get unique locations from sample (filter out NaN values)
-        unique_locations = df['LOCATIONNAME'].dropna().drop_duplicates().head(50).tolist()
-        
-        # Quick stats from sample
-        sample_revenue = sample_df['NETREVENUEAMOUNT'].sum() if 'NETREVENUEAMOUNT' in sample_df.columns else 0
-        return_transactions = sample_df[sample_df['INVOICENUMBER'].str.contains('-R', na=False)] if 'INVOICENUMBER' in sample_df.columns else []
-        
-        metadata = {
-            'total_rows': total_rows,
-            'date_range': {
-                'min': sample_df['Date'].min().strftime('%Y-%m-%d') if not sample_df['Date'].empty else None,
-                'max': sample_df['Date'].max().strftime('%Y-%m-%d') if not sample_df['Date'].empty else None
-            },
-            'available_years': available_years,
-            'sample_locations': unique_locations,
-            'total_revenue': float(sample_revenue),
-            'total_returns': len(return_transactions),
-            'data_source': 'Google Drive' if GOOGLE_DRIVE_CSV_URL else 'Local CSV',
-            'note': 'Metadata calculated from sample data for performance'
-        }
-        
-        print(f"Fast metadata generated: {total_rows} rows, {len(available_years)} years, {len(unique_locations)} locations")
-        return jsonify(metadata)
+        # Same dataset version, same metadata: let clients revalidate with If-None-Match
+        response = jsonify({**dataset.store.metadata(), 'data_source': dataset.source, 'version': dataset.version})
+        response.set_etag(f"meta-{dataset.version}")
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
         
     except Exception as e:
-        print(f"ERROR in get_sales_data_meta: {str(e)}")
+        logger.exception("get_sales_data_meta failed")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/sales-data-filtered')
+@response_cache.cached(current_dataset)
 def get_filtered_sales_data():
     """Get filtered sales data based on query parameters for better performance"""
     try:
@@ -361,14 +651,17 @@ def get_filtered_sales_data():
         years = request.args.getlist('years')
         months = request.args.getlist('months')
         locations = request.args.getlist('locations')
-        limit = request.args.get('limit', 10000, type=int)  # Default limit to prevent overload
-        offset = request.args.get('offset', 0, type=int)
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        offset = int(request.args.get('offset', 0))
+        cursor = request.args.get('cursor')
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+        if offset < 0:
+            return jsonify({"error": "offset must not be negative"}), 400
         
-        print(f"Filtering data: years={years}, months={months}, locations={locations[:3] if len(locations) > 3 else locations}, limit={limit}")
-        print(f"Request args: {dict(request.args)}")
+        logger.debug("Filtering data", extra={'years': years, 'months': months, 'locations': locations[:3], 'limit': limit})
         
         if not years and not months and not locations:
-            print("No filters provided, returning empty result")
             return jsonify({
                 'data': [],
                 'metadata': {
@@ -380,52 +673,181 @@ def get_filtered_sales_data():
                 }
             })
         
-        df = load_csv_data()
-        
-        # Process data similar to main endpoint
-        print("Processing dates for filtering...")
-        df['Date'] = pd.to_datetime(df['INVOICEDATE'], format='%d/%m/%Y', errors='coerce')
-        df.dropna(subset=['Date'], inplace=True)
-        
-        # Add Year and Month columns
-        df['Year'] = df['Date'].dt.year
-        df['Month'] = df['Date'].dt.month
-        
-        # Apply return logic
-        df['NetRevenueAmount'] = df.apply(
-            lambda row: -row['NETREVENUEAMOUNT'] if '-R' in str(row['INVOICENUMBER']) else row['NETREVENUEAMOUNT'], 
-            axis=1
-        )
+        dataset = current_dataset()
         
-        # Apply filters
-        if years:
-            df = df[df['Year'].isin([int(y) for y in years])]
-        
-        if months:
-            df = df[df['Month'].isin([int(m) for m in months])]
-        
-        if locations:
-            df = df[df['LOCATIONNAME'].isin(locations)]
-        
-        # Apply pagination
-        total_filtered = len(df)
-        df = df.iloc[offset:offset + limit]
+        # Keyset pagination when a cursor is given, offset pagination otherwise
+        after = None
+        if cursor:
+            try:
+                cursor_version, after = decode_cursor(cursor)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            if cursor_version != dataset.version:
+                return jsonify({"error": "Cursor belongs to an older version of the dataset; restart from the first page"}), 409
+        
+        # Only the matching (year, month, location) partitions or indexed rows are touched
+        started = time.perf_counter()
+        df, total_filtered, last_position, has_more = dataset.store.filtered_page(
+            [int(y) for y in years], [int(m) for m in months], locations, limit, offset=offset, after=after)
+        df = df.assign(NetRevenueAmount=lambda page: page['NETREVENUEAMOUNT'])
+        next_cursor = encode_cursor(dataset.version, last_position) if has_more else None
+        record_stage('filter', time.perf_counter() - started)
         
-        result = {
-            'data': df.to_dict('records'),
-            'metadata': {
-                'total_filtered': total_filtered,                'returned_count': len(df),
-                'offset': offset,
-                'limit': limit,
-                'has_more': offset + limit < total_filtered
-            }
+        metadata = {
+            'total_filtered': total_filtered,
+            'returned_count': len(df),
+            'offset': offset,
+            'limit': limit,
+            'has_more': has_more,
+            'next_cursor': next_cursor
         }
+        logger.debug("Filtered data", extra={'total_filtered': total_filtered, 'returned': len(df)})
+        
+        # Streamed rows are encoded like the buffered jsonify() response, so dates and numbers
+        # read the same whichever way the client asks. Streaming layouts (NDJSON, columnar
+        # JSON, Arrow) carry the metadata in headers.
+        if negotiate_format(request) != 'json':
+            headers = {'X-Total-Filtered': str(total_filtered), 'X-Has-More': str(has_more).lower()}
+            if next_cursor:
+                headers['X-Next-Cursor'] = next_cursor
+            return stream_rows(df, headers, dumps=jsonify_dumps)
+        if request.args.get('stream') in ('1', 'true'):
+            document = iter_json_object({'metadata': metadata}, 'data', df, dumps=jsonify_dumps)
+            return Response(timed_iter('serialize', chain(document, ['\n'])), mimetype='application/json')
+        
+        with timed('serialize'):
+            return jsonify({'data': df.to_dict('records'), 'metadata': metadata})
+        
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter value: {str(e)}"}), 400
+    except Exception as e:
+        logger.exception("get_filtered_sales_data failed")
+        return jsonify({"error": str(e)}), 500
+
+def get_filter_args():
+    """Read the year / month / location filters shared by the analytics endpoints ('all' means no filter)"""
+    years = [int(y) for y in request.args.getlist('years') if y != 'all']
+    months = [int(m) for m in request.args.getlist('months') if m != 'all']
+    locations = [l for l in request.args.getlist('locations') if l != 'all']
+    return years, months, locations
+
+@app.route('/api/aggregates')
+@response_cache.cached(current_dataset)
+def get_aggregates():
+    """Dashboard summary tables computed on the server for the given filters"""
+    try:
+        years, months, locations = get_filter_args()
+        # Answered from the pre-aggregated rollup cube (pandas) or grouped in SQL (sqlite / duckdb)
+        with timed('aggregate'):
+            result = current_dataset().store.aggregate(years, months, locations)
+        result['filters'] = {'years': years, 'months': months, 'locations': locations}
+        with timed('serialize'):
+            return jsonify(result)
+        
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter value: {str(e)}"}), 400
+    except Exception as e:
+        logger.exception("get_aggregates failed")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/timeseries')
+@response_cache.cached(current_dataset)
+def get_time_series():
+    """Revenue, transaction and return series for a date range at day/week/month/quarter granularity"""
+    try:
+        locations = [l for l in request.args.getlist('locations') if l != 'all']
+        with timed('aggregate'):
+            # The rollup cube is date-sorted, so the range is found by binary search
+            result = time_series(
+                current_dataset().rollup.cube,
+                start=request.args.get('start'),
+                end=request.args.get('end'),
+                granularity=request.args.get('granularity', 'day'),
+                locations=locations,
+            )
+        result['filters'] = {'locations': locations}
+        with timed('serialize'):
+            return jsonify(result)
         
-        print(f"Filtered data: {total_filtered} total, returning {len(df)} rows")
-        return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("get_time_series failed")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/rankings')
+@response_cache.cached(current_dataset)
+def get_rankings():
+    """Top or bottom N pharmacists, locations or days by revenue, transactions, average basket or return rate"""
+    try:
+        years, months, locations = get_filter_args()
+        with timed('aggregate'):
+            # Ranked from the rollup cube; only the first N rows are sorted
+            result = rank(
+                current_dataset().rollup.cube,
+                dimension=request.args.get('dimension', 'pharmacist'),
+                metric=request.args.get('metric', 'revenue'),
+                n=request.args.get('n', 10, type=int),
+                order=request.args.get('order', 'top'),
+                tiebreak=request.args.get('tiebreak'),
+                years=years,
+                months=months,
+                locations=locations,
+                min_transactions=request.args.get('min_transactions', 0, type=int),
+            )
+        result['filters'] = {'years': years, 'months': months, 'locations': locations}
+        with timed('serialize'):
+            return jsonify(result)
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("get_rankings failed")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/compare')
+@response_cache.cached(current_dataset)
+def get_period_comparison():
+    """Revenue, transactions, returns, payment mix, location / pharmacist stats and top days for two or more periods"""
+    try:
+        # ?periods=2024&periods=2025 or ?periods=2024,2025
+        periods = [p for value in request.args.getlist('periods') for p in value.split(',') if p.strip()]
+        _, months, locations = get_filter_args()
+        with timed('aggregate'):
+            # One grouped pass over the rollup cube rows of all periods
+            result = compare_periods(current_dataset().rollup.cube, periods, months=months, locations=locations)
+        result['filters'] = {'months': months, 'locations': locations}
+        with timed('serialize'):
+            return jsonify(result)
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("get_period_comparison failed")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/returns')
+@response_cache.cached(current_dataset)
+def get_returns():
+    """Return rates, amounts and time to return per pharmacist, location or day, with returns linked to their sales"""
+    try:
+        years, months, locations = get_filter_args()
+        with timed('aggregate'):
+            # Grouped from the per-version returns cube (day x location x pharmacist of the sale)
+            result = current_dataset().returns.breakdown(
+                dimension=request.args.get('dimension', 'pharmacist'),
+                years=years,
+                months=months,
+                locations=locations,
+            )
+        result['filters'] = {'years': years, 'months': months, 'locations': locations}
+        with timed('serialize'):
+            return jsonify(result)
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"ERROR in get_filtered_sales_data: {str(e)}")
+        logger.exception("get_returns failed")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/test-data')
@@ -485,19 +907,19 @@ def serve_react_assets(path):
         return send_from_directory(app.static_folder, 'index.html')
 
 if __name__ == '__main__':
-    print("Starting Flask server...")
-    print(f"Current working directory: {os.getcwd()}")
-    print(f"Google Drive CSV URL configured: {'Yes' if GOOGLE_DRIVE_CSV_URL else 'No'}")
+    logger.info("Starting Flask server", extra={'cwd': os.getcwd(), 'google_drive_configured': bool(GOOGLE_DRIVE_CSV_URL)})
     
     # Production vs Development configuration
     is_production = os.getenv('FLASK_ENV') == 'production'
     port = int(os.getenv('PORT', 5000))
     
+    # With the debug reloader only the child process (WERKZEUG_RUN_MAIN) serves requests
+    if is_production or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_refresh()
+    
     if is_production:
-        print("🚀 Running in PRODUCTION mode")
-        print(f"📂 Static folder: {app.static_folder}")
-        print(f"🌐 Port: {port}")
+        logger.info("Running in PRODUCTION mode", extra={'static_folder': app.static_folder, 'port': port})
         app.run(debug=False, host='0.0.0.0', port=port)
     else:
-        print("🔧 Running in DEVELOPMENT mode")
+        logger.info("Running in DEVELOPMENT mode", extra={'port': port})
         app.run(debug=True, host='0.0.0.0', port=port)
@@ -0,0 +1,154 @@
+"""
+ASGI entry point for the API, as an alternative to the threaded gunicorn setup.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+(needs `pip install uvicorn`; under gunicorn use `-k uvicorn.workers.UvicornWorker`.)
+
+The Flask app itself is unchanged. This adapter runs it on a bounded pool of
+`ASGI_THREADS` threads (default 8), so pandas work and streamed exports never
+run on the event loop and at most that many requests compute at once. The
+event loop only moves bytes and waits:
+
+- a request that needs the dataset while it is not loaded yet awaits the
+  dataset cache's single in-flight load (`DatasetCache.load()`) without
+  holding a pool thread, so any number of cold requests share one download
+  and parse, and `/api/health` and cached responses keep being answered
+  while it runs
+- streamed bodies are produced chunk by chunk in the pool and sent as they
+  are ready
+"""
+
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import app as server
+from instrumentation import get_logger
+
+logger = get_logger('asgi')
+
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', 8))
+# Answered without the dataset, so they never wait for a load
+DATASET_FREE_PATHS = {
+    '/api/health',
+    '/api/metrics',
+    '/api/cache/stats',
+    '/api/cache/invalidate',
+    '/api/config/google-drive-url',
+    '/api/test-data',
+}
+
+executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='asgi-wsgi')
+
+
+def needs_dataset(path):
+    return path.startswith('/api/') and path not in DATASET_FREE_PATHS
+
+
+def wsgi_environ(scope, body):
+    """The WSGI environ for an ASGI HTTP scope"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def start_wsgi(environ):
+    """Call the Flask app and produce the first body chunk (runs in the pool)"""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+    result = server.app(environ, start_response)
+    chunks = iter(result)
+    first = next(chunks, None)
+    return started['status'], started['headers'], result, chunks, first
+
+
+async def read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return bytes(body)
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return bytes(body)
+
+
+async def serve_http(scope, receive, send):
+    body = await read_body(receive)
+    loop = asyncio.get_running_loop()
+
+    environ = wsgi_environ(scope, body)
+    if needs_dataset(scope['path']):
+        load = server.sales_cache.load()
+        try:
+            # Waits on the event loop, not in a pool thread; concurrent cold requests join one load
+            await asyncio.wrap_future(load)
+        except Exception:
+            # The view reports the load failure the way it always has, without loading again
+            pass
+        environ[server.DATASET_LOAD_ENVIRON_KEY] = load
+
+    status, headers, result, chunks, chunk = await loop.run_in_executor(executor, start_wsgi, environ)
+    try:
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        while chunk is not None:
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            chunk = await loop.run_in_executor(executor, next, chunks, None)
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(result, 'close'):
+            await loop.run_in_executor(executor, result.close)
+
+
+async def serve_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Start loading right away (without waiting for it) and keep the dataset fresh in the background
+            server.sales_cache.load()
+            server.start_background_refresh()
+            logger.info("ASGI app started", extra={'threads': ASGI_THREADS})
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http':
+        await serve_http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await serve_lifespan(receive, send)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark the vectorized cleaning pipeline against the previous row-wise path
+(`df.apply(..., axis=1)` for return negation) on a synthetic CSV.
+
+Usage:
+    python benchmarks/bench_cleaning.py --rows 1000000
+    python benchmarks/bench_cleaning.py --csv sales.csv
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sales_pipeline import clean_sales_data  # noqa: E402
+from synthetic_sales import write_sales_csv  # noqa: E402
+
+
+def legacy_clean(df):
+    """The cleaning steps of the original /api/sales-data handler"""
+    df['NETREVENUEAMOUNT'] = df.apply(lambda row: -row['NETREVENUEAMOUNT'] if '-R' in str(row['INVOICENUMBER']) else row['NETREVENUEAMOUNT'], axis=1)
+    df['Date'] = pd.to_datetime(df['INVOICEDATE'], format='%d/%m/%Y', errors='coerce')
+    failed_mask = df['Date'].isnull()
+    if failed_mask.any():
+        df.loc[failed_mask, 'Date'] = pd.to_datetime(df.loc[failed_mask, 'INVOICEDATE'], errors='coerce', dayfirst=True)
+    df.dropna(subset=['Date'], inplace=True)
+    df['Year'] = df['Date'].dt.year.astype(int)
+    df['Month'] = df['Date'].dt.month.astype(int)
+    df['NETREVENUEAMOUNT'] = pd.to_numeric(df['NETREVENUEAMOUNT'], errors='coerce')
+    df.dropna(subset=['NETREVENUEAMOUNT'], inplace=True)
+    return df[df['NETREVENUEAMOUNT'].between(-1000000, 1000000)]
+
+
+def time_it(func, raw, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        frame = raw.copy()
+        started = time.perf_counter()
+        result = func(frame)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark sales data cleaning')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--csv', help='Use an existing CSV instead of generating one')
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = args.csv
+        if not csv_path:
+            csv_path = os.path.join(tmp, 'synthetic_sales.csv')
+            print(f"Generating {args.rows:,} synthetic rows...")
+            write_sales_csv(csv_path, args.rows)
+
+        raw = pd.read_csv(csv_path)
+        print(f"Benchmarking on {len(raw):,} rows from {csv_path}")
+
+        legacy_seconds, legacy = time_it(legacy_clean, raw, args.repeat)
+        vectorized_seconds, vectorized = time_it(clean_sales_data, raw, args.repeat)
+
+    print(f"{'pipeline':<12}{'seconds':>10}{'rows':>12}{'net revenue':>20}")
+    print(f"{'legacy':<12}{legacy_seconds:>10.3f}{len(legacy):>12,}{legacy['NETREVENUEAMOUNT'].sum():>20,.2f}")
+    print(f"{'vectorized':<12}{vectorized_seconds:>10.3f}{len(vectorized):>12,}{vectorized['NETREVENUEAMOUNT'].sum():>20,.2f}")
+    print(f"Speedup: {legacy_seconds / vectorized_seconds:.1f}x")
+
+    if len(legacy) != len(vectorized) or abs(legacy['NETREVENUEAMOUNT'].sum() - vectorized['NETREVENUEAMOUNT'].sum()) > 0.01:
+        print("❌ MISMATCH: vectorized pipeline disagrees with the legacy path")
+        return 1
+    print("✅ MATCH: both pipelines produce the same rows and totals")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark: cold start from CSV (parse + clean) versus loading
+the typed columnar snapshot written by snapshot.py.
+
+Usage:
+    python benchmarks/bench_snapshot.py --rows 1000000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import snapshot  # noqa: E402
+from dataset_cache import Dataset  # noqa: E402
+from sales_pipeline import clean_sales_data  # noqa: E402
+from synthetic_sales import write_sales_csv  # noqa: E402
+
+
+def best_of(func, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark CSV vs snapshot startup')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--csv', help='Use an existing CSV instead of generating one')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = args.csv
+        if not csv_path:
+            csv_path = os.path.join(tmp, 'synthetic_sales.csv')
+            print(f"Generating {args.rows:,} synthetic rows...")
+            write_sales_csv(csv_path, args.rows)
+
+        csv_seconds, frame = best_of(lambda: clean_sales_data(pd.read_csv(csv_path)), args.repeat)
+
+        snapshot_dir = os.path.join(tmp, 'snapshot')
+        data_path = snapshot.write_snapshot(Dataset(frame, 'bench', 'Local CSV'), snapshot_dir)
+        if data_path is None:
+            return 1
+        snapshot_seconds, restored = best_of(lambda: snapshot.load_snapshot(snapshot_dir), args.repeat)
+        restored_frame, meta = restored
+
+        print(f"{'startup path':<28}{'seconds':>10}{'MB on disk':>12}")
+        print(f"{'CSV parse + clean':<28}{csv_seconds:>10.3f}{os.path.getsize(csv_path) / 1e6:>12.1f}")
+        print(f"{'snapshot (' + meta['format'] + ')':<28}{snapshot_seconds:>10.3f}{os.path.getsize(data_path) / 1e6:>12.1f}")
+        print(f"Speedup: {csv_seconds / snapshot_seconds:.1f}x")
+
+        if len(restored_frame) != len(frame) or abs(restored_frame['NETREVENUEAMOUNT'].sum() - frame['NETREVENUEAMOUNT'].sum()) > 0.01:
+            print("❌ MISMATCH: snapshot does not round-trip the cleaned dataset")
+            return 1
+    print("✅ MATCH: snapshot round-trips the cleaned dataset")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Load test for the API: concurrent clients hammer a mix of endpoints and the
+script reports throughput and latency percentiles.
+
+Against a running server:
+    python benchmarks/load_test.py --url http://localhost:5000
+
+Or start the Flask dev server and gunicorn one after the other on the same
+data and compare them:
+    python benchmarks/load_test.py --compare --rows 300000
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_sales import write_sales_csv  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Weighted request mix: mostly dashboard summaries, some paging, a few full exports
+DEFAULT_PATHS = [
+    '/api/aggregates',
+    '/api/aggregates?years=2025',
+    '/api/aggregates?months=5',
+    '/api/sales-data-meta',
+    '/api/sales-data-filtered?years=2024&limit=500',
+    '/api/health',
+    '/api/sales-data',
+]
+
+SERVERS = {
+    'flask-dev': [sys.executable, 'app.py'],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_load(base_url, paths, clients, duration):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(offset):
+        nonlocal errors
+        session = requests.Session()
+        i = offset
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                response = session.get(base_url + path, timeout=120, headers={'Accept-Encoding': 'gzip'})
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / wall if wall else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'mean_ms': statistics.mean(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+def wait_until_ready(base_url, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(base_url + '/api/health', timeout=2).status_code == 200:
+                # Warm the dataset so the cold load is not part of the measurement
+                requests.get(base_url + '/api/aggregates', timeout=timeout)
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def start_server(name, port, workdir):
+    env = dict(os.environ, PORT=str(port), FLASK_ENV='production', GOOGLE_DRIVE_CSV_URL='',
+               DATASET_SNAPSHOT_DIR=os.path.join(workdir, f'snapshot-{name}'))
+    return subprocess.Popen(SERVERS[name], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def print_report(results):
+    print(f"{'server':<12}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, result in results.items():
+        print(f"{name:<12}{result['requests']:>10}{result['errors']:>8}{result['throughput']:>10.1f}"
+              f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}")
+
+
+def compare(args):
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        # Run against a copy of the app so the real sales.csv is never touched
+        for name in os.listdir(ROOT):
+            if name.endswith('.py'):
+                shutil.copy(os.path.join(ROOT, name), workdir)
+        print(f"Generating {args.rows:,} synthetic rows...")
+        write_sales_csv(os.path.join(workdir, 'sales.csv'), args.rows)
+
+        for offset, name in enumerate(SERVERS):
+            port = args.port + offset
+            process = start_server(name, port, workdir)
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                if not wait_until_ready(base_url):
+                    print(f"❌ {name} did not become ready")
+                    continue
+                print(f"Running {args.clients} clients for {args.duration}s against {name}...")
+                results[name] = run_load(base_url, DEFAULT_PATHS, args.clients, args.duration)
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+    print_report(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the pharmacy dashboard API')
+    parser.add_argument('--url', help='Base URL of a running server')
+    parser.add_argument('--compare', action='store_true', help='Start the dev server and gunicorn and compare them')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--rows', type=int, default=300_000)
+    parser.add_argument('--port', type=int, default=5100)
+    parser.add_argument('--path', action='append', help='Endpoint path to request (repeatable)')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args)
+        return 0
+    if not args.url:
+        parser.error('pass --url or --compare')
+
+    results = {'server': run_load(args.url.rstrip('/'), args.path or DEFAULT_PATHS, args.clients, args.duration)}
+    print_report(results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
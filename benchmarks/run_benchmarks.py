@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: pipeline stages, endpoints and peak memory on synthetic data
+of several sizes, compared against stored baselines.
+
+For every size a synthetic sales.csv is generated and loaded through the real
+app (download-free: the local CSV path). The suite records:
+- the per-stage timings (parse, clean, sort, derive, snapshot) reported by
+  the app's own instrumentation, best of `--repeat` builds, plus snapshot
+  restore time
+- every endpoint, best of `--repeat` runs with the response cache cleared,
+  plus a response-cache hit
+- the peak traced memory while building the dataset, and the dataset's size
+
+The results are compared with `benchmarks/baselines.json`. The run fails
+(exit code 1) when a metric is slower or bigger than its baseline by more
+than the tolerance; timings must also have grown by more than `--min-delta`
+seconds, so short stages at the small sizes do not fail on noise.
+
+Usage:
+    python benchmarks/run_benchmarks.py                      # 10K, 100K, 1M rows
+    python benchmarks/run_benchmarks.py --sizes 10000000     # 10M rows
+    python benchmarks/run_benchmarks.py --save-baseline      # record new baselines
+"""
+
+import argparse
+import atexit
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# The app reads these at import time
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ['DATASET_SNAPSHOT_DIR'] = tempfile.mkdtemp(prefix='bench-snapshot-')
+atexit.register(shutil.rmtree, os.environ['DATASET_SNAPSHOT_DIR'], ignore_errors=True)
+
+import pandas as pd  # noqa: E402
+
+import app as server  # noqa: E402
+from instrumentation import stage_seconds  # noqa: E402
+from snapshot import load_snapshot  # noqa: E402
+from synthetic_sales import write_sales_csv  # noqa: E402
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+PIPELINE_STAGES = ['parse', 'clean', 'sort', 'derive', 'snapshot']
+# Full exports are skipped above this size; they only measure JSON encoding of every row
+MAX_EXPORT_ROWS = 1_000_000
+
+# Regressions smaller than these are noise, whatever the ratio (the timing
+# floor can be changed with --min-delta)
+MIN_SECONDS_DELTA = 0.05
+MIN_MB_DELTA = 5.0
+
+
+def endpoints(rows):
+    """(name, url) pairs to time for a dataset of `rows` rows"""
+    cases = [
+        ('meta', '/api/sales-data-meta'),
+        ('aggregates', '/api/aggregates'),
+        ('aggregates_filtered', '/api/aggregates?years=2025&months=3&locations=Narjis%20Pharmacy'),
+        ('filtered_page', '/api/sales-data-filtered?years=2024&limit=1000'),
+        ('filtered_deep_page', '/api/sales-data-filtered?years=2024&limit=1000&offset=20000'),
+        ('verify_totals', '/api/verify-totals'),
+    ]
+    if rows <= MAX_EXPORT_ROWS:
+        cases += [
+            ('export_json', '/api/sales-data'),
+            ('export_columnar', '/api/sales-data?layout=columnar'),
+        ]
+    return cases
+
+
+def best_of(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def stage_totals():
+    return {labels[0]: values['sum'] for labels, values in stage_seconds.summary().items()}
+
+
+def load_dataset(csv_path):
+    """Point the app at `csv_path` and build the dataset from scratch"""
+    server.GOOGLE_DRIVE_CSV_URL = None
+    server.LOCAL_CSV_PATH = csv_path
+    server.sales_cache.invalidate(drop=True)
+    server.response_cache.clear()
+    return server.sales_cache.get()
+
+
+def run_size(rows, repeat, workdir):
+    csv_path = os.path.join(workdir, f'sales-{rows}.csv')
+    print(f"Generating {rows:,} synthetic rows...")
+    write_sales_csv(csv_path, rows)
+
+    metrics = {}
+
+    # Peak memory of a build, in a separate pass because tracing slows everything down
+    tracemalloc.start()
+    load_dataset(csv_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    metrics['memory.load_peak_mb'] = peak / 1e6
+
+    # Best of `repeat` full builds, per stage
+    for _ in range(repeat):
+        before = stage_totals()
+        started = time.perf_counter()
+        dataset = load_dataset(csv_path)
+        timings = {'load.total': time.perf_counter() - started}
+        after = stage_totals()
+        for stage in PIPELINE_STAGES:
+            timings[f'stage.{stage}'] = after.get(stage, 0.0) - before.get(stage, 0.0)
+        for metric, value in timings.items():
+            metrics[metric] = min(value, metrics.get(metric, value))
+    metrics['memory.dataset_mb'] = dataset.frame.memory_usage(deep=True).sum() / 1e6
+    metrics['stage.snapshot_restore'] = best_of(load_snapshot, repeat)
+
+    client = server.app.test_client()
+    headers = {'Accept-Encoding': 'gzip'}
+
+    def fetch(url):
+        response = client.get(url, headers=headers)
+        response.get_data()  # drain streamed bodies
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status_code}")
+
+    for name, url in endpoints(rows):
+        def uncached():
+            server.response_cache.clear()
+            fetch(url)
+        metrics[f'endpoint.{name}'] = best_of(uncached, repeat)
+    fetch('/api/aggregates')
+    metrics['endpoint.aggregates_cached'] = best_of(lambda: fetch('/api/aggregates'), repeat)
+
+    os.remove(csv_path)
+    return metrics
+
+
+def machine_info():
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, baselines, tolerance, memory_tolerance, min_delta=MIN_SECONDS_DELTA):
+    """List of human-readable regressions against the baselines"""
+    regressions = []
+    for size, metrics in results.items():
+        stored = baselines.get('sizes', {}).get(size, {})
+        for metric, value in metrics.items():
+            base = stored.get(metric)
+            if base is None:
+                continue
+            is_memory = metric.startswith('memory.')
+            allowed = base * (1 + (memory_tolerance if is_memory else tolerance))
+            floor = MIN_MB_DELTA if is_memory else min_delta
+            if value > allowed and value - base > floor:
+                regressions.append(f"{size} rows {metric}: {value:.4f} vs baseline {base:.4f} (+{(value / base - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_results(results, baselines):
+    for size, metrics in results.items():
+        stored = baselines.get('sizes', {}).get(size, {})
+        print(f"\n{int(size):,} rows")
+        print(f"  {'metric':<34}{'value':>12}{'baseline':>12}")
+        for metric, value in metrics.items():
+            base = stored.get(metric)
+            unit = 'MB' if metric.startswith('memory.') else 's'
+            base_text = f"{base:>11.4f}{unit}" if base is not None else f"{'-':>12}"
+            print(f"  {metric:<34}{value:>11.4f}{unit}{base_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the benchmark suite against stored baselines')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='Comma-separated row counts (10000 to 10000000)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed slowdown before a timing counts as a regression (0.5 = 50%%)')
+    parser.add_argument('--memory-tolerance', type=float, default=0.2)
+    parser.add_argument('--min-delta', type=float, default=MIN_SECONDS_DELTA,
+                        help='Seconds a timing must grow by before it can count as a regression')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baselines')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in sizes:
+            results[str(rows)] = {metric: round(value, 6) for metric, value in run_size(rows, args.repeat, workdir).items()}
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    print_results(results, baselines)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'machine': machine_info(), 'sizes': results}, f, indent=2)
+
+    if args.save_baseline:
+        stored = baselines.get('sizes', {})
+        stored.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump({'machine': machine_info(), 'sizes': stored}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\n✅ Baselines saved to {args.baseline}")
+        return 0
+
+    if not baselines:
+        print("\n⚠️ No baselines stored yet; run with --save-baseline to record them")
+        return 0
+    if baselines.get('machine', {}).get('platform') != machine_info()['platform']:
+        print("\n⚠️ Baselines were recorded on a different machine; timings may not be comparable")
+
+    regressions = compare(results, baselines, args.tolerance, args.memory_tolerance, args.min_delta)
+    if regressions:
+        print("\n❌ REGRESSIONS:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("\n✅ No regressions against the baselines")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Synthetic sales data matching the schema of the real sales.csv export.
+
+Sales invoices are numbered sequentially (INV-0000001), returns reuse the
+original invoice number with a '-R' suffix and are dated on or after the sale,
+INVOICEDATE is written as DD/MM/YYYY, and payments are split between
+CASHREVENUE and CREDITREVENUE. Generation is vectorized, so 10M rows is fine.
+
+Usage:
+    python benchmarks/synthetic_sales.py --rows 1000000
+
+Files go to benchmarks/data/ by default (ignored by git). Writing over the
+app's own sales.csv is refused: the app falls back to that file when Google
+Drive is unreachable, and the Docker image ships it.
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+LOCATIONS = [
+    'Narjis Pharmacy',
+    'Albustan pharmacy',
+    'Al Malqa Pharmacy',
+    'Al Yasmin Pharmacy',
+    'Hittin Pharmacy',
+    'Al Sahafa Pharmacy',
+    'Al Nakheel Pharmacy',
+    'Al Rawdah Pharmacy',
+]
+
+FIRST_NAMES = ['Ahmed', 'Sara', 'Mohammed', 'Fatimah', 'Khalid', 'Noura', 'Omar', 'Reem', 'Faisal', 'Lama']
+LAST_NAMES = ['Alharbi', 'Alqahtani', 'Alghamdi', 'Alzahrani', 'Aldossari', 'Alshehri', 'Almutairi']
+
+COLUMNS = [
+    'INVOICENUMBER',
+    'INVOICEDATE',
+    'NETREVENUEAMOUNT',
+    'PHARMACISTNAME',
+    'LOCATIONNAME',
+    'CASHREVENUE',
+    'CREDITREVENUE',
+]
+
+
+def pharmacist_names(count, rng):
+    names = [f"Dr. {first} {last}" for first in FIRST_NAMES for last in LAST_NAMES]
+    rng.shuffle(names)
+    return names[:count]
+
+
+def generate_sales(rows, start='2024-01-01', end='2025-06-30', return_rate=0.03,
+                   pharmacists=40, seed=42, compact=False):
+    """
+    Return a raw (uncleaned) sales DataFrame with `rows` rows. With `compact=True`
+    the repetitive text columns are categoricals (same values, far less memory),
+    which is what lets 10M rows be generated on a laptop.
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.date_range(start, end, freq='D')
+
+    return_count = int(rows * return_rate)
+    sale_count = rows - return_count
+
+    # Sales, in chronological order like the real export
+    sale_day = np.sort(rng.integers(0, len(days), sale_count))
+    sale_amount = np.round(rng.gamma(2.0, 60.0, sale_count) + 1.0, 2)
+    sale_location = rng.integers(0, len(LOCATIONS), sale_count)
+    pharmacist_pool = np.array(pharmacist_names(pharmacists, rng), dtype=object)
+    # Each pharmacist mostly works at one location
+    sale_pharmacist = (sale_location * 5 + rng.integers(0, 5, sale_count)) % len(pharmacist_pool)
+
+    # Returns point back at an earlier sale and refund part of it, a few days later
+    original = rng.integers(0, sale_count, return_count)
+    return_day = np.minimum(sale_day[original] + rng.integers(0, 30, return_count), len(days) - 1)
+    return_amount = np.round(sale_amount[original] * rng.uniform(0.1, 1.0, return_count), 2)
+
+    sale_numbers = pd.Series(np.arange(1, sale_count + 1)).astype(str).str.zfill(7)
+    invoice = np.concatenate([
+        ('INV-' + sale_numbers).to_numpy(dtype=object),
+        ('INV-' + sale_numbers.iloc[original] + '-R').to_numpy(dtype=object),
+    ])
+    day = np.concatenate([sale_day, return_day])
+    amount = np.concatenate([sale_amount, return_amount])
+    location = np.concatenate([sale_location, sale_location[original]])
+    pharmacist = np.concatenate([sale_pharmacist, sale_pharmacist[original]])
+
+    cash_share = rng.choice([0.0, 1.0, 0.5], size=rows, p=[0.45, 0.45, 0.10])
+    cash = np.round(amount * cash_share, 2)
+
+    order = np.argsort(day, kind='stable')
+
+    def labels(codes, values):
+        values = np.asarray(values, dtype=object)
+        return pd.Categorical.from_codes(codes, categories=values) if compact else values[codes]
+
+    df = pd.DataFrame({
+        'INVOICENUMBER': invoice[order],
+        'INVOICEDATE': labels(day[order], days.strftime('%d/%m/%Y')),
+        'NETREVENUEAMOUNT': amount[order],
+        'PHARMACISTNAME': labels(pharmacist[order], pharmacist_pool),
+        'LOCATIONNAME': labels(location[order], LOCATIONS),
+        'CASHREVENUE': cash[order],
+        'CREDITREVENUE': np.round(amount[order] - cash[order], 2),
+    })
+    return df[COLUMNS]
+
+
+DEFAULT_OUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'synthetic_sales.csv')
+APP_SALES_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sales.csv')
+
+
+def write_sales_csv(path, rows, **kwargs):
+    if os.path.abspath(path) == APP_SALES_CSV:
+        raise ValueError(f"Refusing to write synthetic data to the app's data file {APP_SALES_CSV}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    generate_sales(rows, compact=True, **kwargs).to_csv(path, index=False)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic sales.csv')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--out', default=DEFAULT_OUT)
+    parser.add_argument('--start', default='2024-01-01')
+    parser.add_argument('--end', default='2025-06-30')
+    parser.add_argument('--return-rate', type=float, default=0.03)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    write_sales_csv(args.out, args.rows, start=args.start, end=args.end,
+                    return_rate=args.return_rate, seed=args.seed)
+    print(f"Wrote {args.rows:,} rows to {args.out} ({os.path.getsize(args.out) / 1e6:.1f} MB)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Side-by-side comparison of two or more periods (year over year, month over
+month, or any date ranges).
+
+Each period is located in the date-sorted rollup cube with two binary
+searches, and the rows of all periods are stacked with a period code (so
+overlapping periods work). Every table (totals, days, locations,
+pharmacists) is then one group-by over that stack with the period as the
+first key, instead of one pass per period and metric: adding a period adds
+rows to the stack, not passes.
+
+Periods are written as a year (2025), a quarter (2025-Q1), a month
+(2025-03) or an inclusive date range (2025-01-01:2025-02-15).
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from analytics import MEASURES, filter_sales, summarize, top_days
+from timeseries import date_bounds
+
+MAX_COMPARED_PERIODS = 12
+PERIOD_FORMATS = [
+    (re.compile(r'\d{4}'), 'Y'),
+    (re.compile(r'\d{4}-Q[1-4]'), 'Q'),
+    (re.compile(r'\d{4}-\d{2}'), 'M'),
+]
+DAILY_COLUMNS = ['revenue', 'grossSales', 'returns', 'transactions', 'salesTransactions', 'returnTransactions']
+LOCATION_COLUMNS = ['revenue', 'transactions', 'salesTransactions', 'returns']
+PHARMACIST_COLUMNS = ['revenue', 'transactions', 'salesTransactions', 'returns', 'returnTransactions']
+# Metrics whose change against the first period is reported
+CHANGE_METRICS = ['totalRevenue', 'grossSales', 'totalReturns', 'totalTransactions', 'averageOrderValue', 'averageDailyRevenue']
+
+
+def parse_period(text):
+    """(start, end) Timestamps (inclusive) of a year, quarter, month or date range"""
+    text = text.strip()
+    if ':' in text:
+        start, end = (pd.Timestamp(part) for part in text.split(':', 1))
+        if start > end:
+            raise ValueError(f"Period '{text}' starts after it ends")
+        return start.normalize(), end.normalize()
+    for pattern, freq in PERIOD_FORMATS:
+        if pattern.fullmatch(text):
+            period = pd.Period(text.replace('-Q', 'Q'), freq=freq)
+            return period.start_time.normalize(), period.end_time.normalize()
+    raise ValueError(f"Unknown period '{text}'; use YYYY, YYYY-Qn, YYYY-MM or YYYY-MM-DD:YYYY-MM-DD")
+
+
+def stack_periods(cube, bounds):
+    """Rows of every period's [lo, hi) slice of `cube`, with a `period` code column"""
+    positions = np.concatenate([np.arange(lo, hi) for lo, hi in bounds])
+    rows = cube.take(positions).reset_index(drop=True)
+    rows['period'] = np.repeat(np.arange(len(bounds)), [hi - lo for lo, hi in bounds])
+    return rows
+
+
+def _by_period(table, count):
+    """Split a table grouped by (period, key) into one table per period code"""
+    parts = {code: part.droplevel(0) for code, part in table.groupby(level=0)}
+    empty = table.iloc[:0].droplevel(0)
+    return [parts.get(code, empty) for code in range(count)]
+
+
+def _records(table, key_name):
+    return table.round(2).rename_axis(key_name).reset_index().to_dict('records')
+
+
+def _change(current, baseline):
+    """Relative change in percent, or None when the baseline is zero"""
+    return round((current - baseline) / abs(baseline) * 100, 2) if baseline else None
+
+
+def _comparison(tables, labels):
+    """Revenue per name in every period, names ordered by revenue over all periods"""
+    revenue = pd.concat([table['revenue'] for table in tables], axis=1, keys=range(len(labels))).fillna(0.0)
+    revenue = revenue.loc[revenue.sum(axis=1).sort_values(ascending=False, kind='stable').index]
+    return [
+        {
+            'name': str(name),
+            'revenue': [round(float(value), 2) for value in values],
+            'change': _change(values[-1], values[0]),
+        }
+        for name, values in zip(revenue.index, revenue.to_numpy())
+    ]
+
+
+def compare_periods(cube, periods, months=None, locations=None):
+    """
+    Summary, payment mix, location and pharmacist stats and top days for each
+    period, plus changes against the first period. `months` limits every
+    period to those months (e.g. January-March of each year).
+    """
+    if len(periods) < 2:
+        raise ValueError("Give at least two periods to compare")
+    if len(periods) > MAX_COMPARED_PERIODS:
+        raise ValueError(f"At most {MAX_COMPARED_PERIODS} periods can be compared")
+    ranges = [parse_period(period) for period in periods]
+    dates = cube['Date'].to_numpy()
+    rows = stack_periods(cube, [date_bounds(dates, start, end) for start, end in ranges])
+    rows = filter_sales(rows, None, months, locations)
+
+    count = len(periods)
+    period = rows['period']
+    totals = rows[MEASURES].groupby(period).sum().reindex(range(count), fill_value=0)
+    daily = _by_period(rows[DAILY_COLUMNS].groupby([period, rows['Date']]).sum(), count)
+    by_location = _by_period(rows[LOCATION_COLUMNS].groupby([period, rows['LOCATIONNAME']], observed=True).sum(), count)
+    by_pharmacist = _by_period(
+        rows[PHARMACIST_COLUMNS].groupby([period, rows['PHARMACISTNAME']], observed=True).sum(), count)
+
+    results = []
+    for code, (label, (start, end)) in enumerate(zip(periods, ranges)):
+        locations_table = by_location[code].sort_values('revenue', ascending=False)
+        pharmacists_table = by_pharmacist[code].sort_values('revenue', ascending=False)
+        summary = summarize(totals.loc[code], len(daily[code]), pharmacists_table.index.dropna().nunique())
+        results.append({
+            'period': label,
+            'start': start.strftime('%Y-%m-%d'),
+            'end': end.strftime('%Y-%m-%d'),
+            'summary': summary,
+            'paymentMethods': summary['paymentMethods'],
+            'locationStats': _records(locations_table, 'location'),
+            'pharmacistStats': _records(pharmacists_table, 'name'),
+            **top_days(daily[code]),
+        })
+
+    baseline = results[0]['summary']
+    changes = [
+        {
+            'period': result['period'],
+            'baseline': results[0]['period'],
+            **{metric: _change(result['summary'][metric], baseline[metric]) for metric in CHANGE_METRICS},
+        }
+        for result in results[1:]
+    ]
+    return {
+        'periods': results,
+        'changes': changes,
+        'locationComparison': _comparison(by_location, periods),
+        'pharmacistComparison': _comparison(by_pharmacist, periods),
+    }
@@ -0,0 +1,98 @@
+"""
+Content-Encoding negotiation for API responses.
+
+Registered as an `after_request` hook: JSON, NDJSON and Arrow responses are
+compressed with brotli or gzip depending on the client's Accept-Encoding.
+Streamed responses are compressed incrementally, chunk by chunk, so they keep
+streaming. Brotli needs the optional `brotli` package; without it only gzip
+is offered.
+"""
+
+import zlib
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'application/vnd.apache.arrow.stream',
+    'text/plain',
+    'text/csv',
+}
+# Below this size compression costs more than it saves
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def choose_encoding(accept_encodings):
+    """Best supported encoding from a werkzeug Accept-Encoding header, or None"""
+    candidates = ['br', 'gzip'] if HAS_BROTLI else ['gzip']
+    best = accept_encodings.best_match(candidates)
+    if best is None or accept_encodings[best] == 0:
+        return None
+    return best
+
+
+def _compressor(encoding):
+    """(compress, flush, finish) of a new compressor; `flush` emits everything compressed so far"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def compress_bytes(data, encoding):
+    compress, _, finish = _compressor(encoding)
+    return compress(data) + finish()
+
+
+def iter_compressed(chunks, encoding):
+    """
+    Compress an iterable of str/bytes chunks. The compressor is flushed after
+    every chunk, so each one reaches the client as soon as it is produced
+    instead of waiting in the compressor's buffer
+    """
+    compress, flush, finish = _compressor(encoding)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if not chunk:
+            continue
+        output = compress(chunk) + flush()
+        if output:
+            yield output
+    yield finish()
+
+
+def compress_response(request, response):
+    """after_request hook: compress the response body if the client accepts it"""
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = iter_compressed(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_COMPRESS_BYTES:
+            return response
+        response.set_data(compress_bytes(data, encoding))
+
+    response.headers['Content-Encoding'] = encoding
+    return response
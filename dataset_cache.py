@@ -0,0 +1,394 @@
+"""
+Process-wide cache for the cleaned sales dataset.
+
+The raw CSV is downloaded and cleaned once, then shared by every route until
+the TTL expires or the cache is invalidated. On refresh the source is asked
+whether it changed (ETag / Last-Modified); if it was re-downloaded anyway, a
+content hash decides whether the expensive cleaning step has to run again.
+
+With a background refresher running, requests never wait on the source: the
+refresher thread revalidates on a schedule, builds the new dataset off the
+request path and swaps it in with a single reference assignment, while
+readers keep getting the last good dataset (even if a refresh failed).
+
+Loads are single-flight: callers that need a load while one is running join
+it (`load()` hands out the same Future) and share its result or its error,
+instead of queueing up and repeating it one after the other.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from instrumentation import get_logger, timed
+
+logger = get_logger('dataset_cache')
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """Short content hash of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+class SourcePayload:
+    """Result of fetching the CSV source.
+
+    The raw CSV is either in memory (`content`) or in a file (`path`, with its
+    `digest` already computed while it was written). Neither is set when the
+    source reported that nothing changed since the validators that were passed
+    in (HTTP 304 or unchanged local file). Temporary files are removed by
+    `discard()`. Sources made of several files also carry `files`, the
+    per-file validators ({name: {'digest', 'etag', 'last_modified'}}).
+    """
+
+    def __init__(self, content, source, etag=None, last_modified=None, path=None, digest=None, temporary=False,
+                 files=None):
+        self.content = content
+        self.source = source
+        self.etag = etag
+        self.last_modified = last_modified
+        self.path = path
+        self.digest = digest
+        self.temporary = temporary
+        self.files = files
+
+    @property
+    def not_modified(self):
+        return self.content is None and self.path is None
+
+    def version(self):
+        if self.digest is None:
+            self.digest = hashlib.sha256(self.content).hexdigest()[:16] if self.content is not None else hash_file(self.path)
+        return self.digest
+
+    def discard(self):
+        if self.temporary and self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Dataset:
+    """An immutable, cleaned snapshot of the sales data shared by all routes.
+
+    Structures derived from the frame (rollup cube, indexes, ...) are attached
+    as attributes by the cache's `derive` hook right after the build. Once
+    another copy of the rows exists (a database store), `release_frame()`
+    drops the in-memory frame; `frame` then reads it back on each access.
+    """
+
+    def __init__(self, frame, version, source, etag=None, last_modified=None, build_seconds=0.0, loaded_at=None,
+                 files=None):
+        self._frame = frame
+        self._load_frame = None
+        self.rows = len(frame)
+        self.version = version
+        self.source = source
+        self.etag = etag
+        self.last_modified = last_modified
+        self.files = files
+        self.build_seconds = build_seconds
+        self.loaded_at = loaded_at if loaded_at is not None else time.time()
+
+    @property
+    def frame(self):
+        frame = self._frame
+        return frame if frame is not None else self._load_frame()
+
+    @property
+    def frame_resident(self):
+        return self._frame is not None
+
+    def release_frame(self, load):
+        """Stop holding the frame; `load()` returns it again when a caller needs it"""
+        self._load_frame = load
+        self._frame = None
+
+    @property
+    def validators(self):
+        return {'etag': self.etag, 'last_modified': self.last_modified, 'source': self.source, 'files': self.files}
+
+    def age_seconds(self):
+        return time.time() - self.loaded_at
+
+
+class DatasetCache:
+    """Holds one cleaned Dataset and rebuilds it only when the source changes.
+
+    `fetch(validators)` must return a SourcePayload, and `build(payload)` must
+    turn it into the cleaned DataFrame. The optional
+    `derive(dataset, previous)` hook precomputes per-version structures and may
+    reuse the ones of the previous dataset; `persist(dataset)` is called after
+    every fresh build (e.g. to write an on-disk snapshot).
+
+    Once `start_refresher()` has been called, `get()` only loads when there
+    is no dataset at all; otherwise it returns the current one and leaves
+    revalidation to the refresher thread. After `follow()` the same holds,
+    but revalidation is left to another process.
+    """
+
+    def __init__(self, fetch, build, ttl_seconds=300, derive=None, persist=None):
+        self._fetch = fetch
+        self._build = build
+        self._derive = derive
+        self._persist = persist
+        self.ttl_seconds = ttl_seconds
+        self._dataset = None
+        self._checked_at = 0.0
+        self._refetch = False
+        self._lock = threading.Lock()
+        self._flight_lock = threading.Lock()
+        self._inflight = None
+        self._wake = threading.Event()
+        self._refresher = None
+        self._on_new_version = None
+        self._request_elsewhere = None
+        self.refresh_interval = None
+        self.last_error = None
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'joined_loads': 0,
+            'builds': 0,
+            'not_modified': 0,
+            'unchanged_content': 0,
+            'invalidations': 0,
+            'restored': 0,
+            'background_refreshes': 0,
+            'refresh_failures': 0,
+            'last_build_seconds': None,
+            'total_build_seconds': 0.0,
+        }
+
+    def _is_fresh(self):
+        return self._dataset is not None and (time.time() - self._checked_at) < self.ttl_seconds
+
+    def get(self):
+        """Return the current Dataset, refreshing it first if the TTL expired"""
+        return self.load().result()
+
+    def load(self):
+        """
+        A Future for the current Dataset: already resolved when no refresh is
+        needed, otherwise the Future of the single in-flight load (started
+        here if none is running), which async callers can await without
+        holding a thread
+        """
+        dataset = self._dataset
+        if self._is_fresh() or (dataset is not None and (self.refreshing_in_background or self.follows)):
+            self._stats['hits'] += 1
+            future = Future()
+            future.set_result(dataset)
+            return future
+
+        with self._flight_lock:
+            if self._inflight is not None:
+                self._stats['joined_loads'] += 1
+                return self._inflight
+            future = self._inflight = Future()
+        threading.Thread(target=self._run_load, args=(future,), name='dataset-load', daemon=True).start()
+        return future
+
+    def _run_load(self, future):
+        try:
+            with self._lock:
+                # A background refresh may have finished while we waited for the lock
+                if not self._is_fresh():
+                    self._stats['misses'] += 1
+                    self._refresh()
+                dataset = self._dataset
+        except BaseException as e:
+            result = (None, e)
+        else:
+            result = (dataset, None)
+        # Later callers start a new load; the ones that joined this one get its outcome
+        with self._flight_lock:
+            self._inflight = None
+        if result[1] is not None:
+            future.set_exception(result[1])
+        else:
+            future.set_result(result[0])
+
+    def seed(self, dataset):
+        """Install a dataset restored from elsewhere (e.g. a snapshot).
+
+        It is served right away but revalidated against the source on the next
+        request, so a stale snapshot is replaced as soon as the source changed.
+        """
+        with self._lock:
+            if self._derive is not None:
+                self._derive(dataset, None)
+            self._dataset = dataset
+            self._checked_at = 0.0
+            self._stats['restored'] += 1
+
+    def peek(self):
+        """The current Dataset (or None) without triggering a refresh"""
+        return self._dataset
+
+    @property
+    def refreshing_in_background(self):
+        return self._refresher is not None and self._refresher.is_alive()
+
+    @property
+    def follows(self):
+        return self._request_elsewhere is not None
+
+    def follow(self, request_refresh):
+        """Serve the current dataset without ever revalidating it in this process.
+
+        Another process keeps it fresh (the gunicorn master, which replaces its
+        workers after each new version); `request_refresh()` calls
+        `request_refresh` instead of refreshing here. Meant for a freshly
+        forked child, so the locks, possibly held by the parent's threads at
+        fork time, are replaced.
+        """
+        self._lock = threading.Lock()
+        self._flight_lock = threading.Lock()
+        self._inflight = None
+        self._wake = threading.Event()
+        self._refresher = None
+        self._request_elsewhere = request_refresh
+
+    def start_refresher(self, interval_seconds=None, on_new_version=None):
+        """
+        Revalidate the dataset every `interval_seconds` (default: the TTL) in a daemon thread.
+        `on_new_version(dataset)` is called from that thread after each refresh that swapped in a new dataset.
+        """
+        if self.refreshing_in_background:
+            return self._refresher
+        self._on_new_version = on_new_version
+        self.refresh_interval = interval_seconds or self.ttl_seconds
+        self._refresher = threading.Thread(target=self._refresh_loop, name='dataset-refresher', daemon=True)
+        self._refresher.start()
+        return self._refresher
+
+    def _refresh_loop(self):
+        while True:
+            # Sleep until the next scheduled check, or until request_refresh() wakes us
+            self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+            self._stats['background_refreshes'] += 1
+            previous = self._dataset
+            self.refresh()
+            if self._on_new_version is not None and self._dataset is not previous:
+                self._on_new_version(self._dataset)
+
+    def request_refresh(self):
+        """
+        Ask for a refresh without waiting for it: asks the process this one follows, wakes the
+        refresher, or runs one in a one-off thread
+        """
+        if self.follows:
+            self._request_elsewhere()
+        elif self.refreshing_in_background:
+            self._wake.set()
+        else:
+            threading.Thread(target=self.refresh, name='dataset-refresh', daemon=True).start()
+
+    def refresh(self):
+        """Revalidate now. On failure the last good dataset stays in place; returns True on success"""
+        with self._lock:
+            try:
+                self._refresh()
+                self.last_error = None
+                return True
+            except Exception as e:
+                self._stats['refresh_failures'] += 1
+                self.last_error = {'message': str(e), 'at': time.time()}
+                logger.exception("Dataset refresh failed, still serving the previous dataset")
+                return False
+
+    def _refresh(self):
+        current = self._dataset
+        validators = current.validators if current is not None and not self._refetch else None
+        payload = self._fetch(validators)
+        self._refetch = False
+        try:
+            self._apply(payload, current)
+        finally:
+            payload.discard()
+
+    def _apply(self, payload, current):
+        if payload.not_modified and current is not None:
+            self._stats['not_modified'] += 1
+            self._checked_at = time.time()
+            return
+
+        version = payload.version()
+        if current is not None and current.version == version and current.source == payload.source:
+            # Downloaded again but byte-identical: keep the cleaned frame
+            self._stats['unchanged_content'] += 1
+            current.etag = payload.etag
+            current.last_modified = payload.last_modified
+            current.files = payload.files
+            self._checked_at = time.time()
+            return
+
+        started = time.perf_counter()
+        frame = self._build(payload)
+        dataset = Dataset(
+            frame,
+            version,
+            payload.source,
+            etag=payload.etag,
+            last_modified=payload.last_modified,
+            files=payload.files,
+        )
+        if self._derive is not None:
+            with timed('derive'):
+                self._derive(dataset, current)
+        build_seconds = time.perf_counter() - started
+        dataset.build_seconds = build_seconds
+
+        # Atomic swap: readers see either the old or the new dataset, never a partial one
+        self._dataset = dataset
+        self._checked_at = time.time()
+        self._stats['builds'] += 1
+        self._stats['last_build_seconds'] = round(build_seconds, 4)
+        self._stats['total_build_seconds'] = round(self._stats['total_build_seconds'] + build_seconds, 4)
+
+        logger.info("Dataset built", extra={'version': version, 'source': payload.source, 'rows': len(frame),
+                                            'seconds': round(build_seconds, 3)})
+        if self._persist is not None:
+            with timed('snapshot'):
+                self._persist(dataset)
+
+    def invalidate(self, drop=False, refetch=False):
+        """Force a revalidation on the next request or `request_refresh()`.
+
+        With `refetch=True` the next fetch ignores the stored validators, which
+        is needed when the data source itself changed; with `drop=True` the
+        current dataset is discarded as well instead of being served meanwhile.
+        """
+        with self._lock:
+            self._checked_at = 0.0
+            self._refetch = self._refetch or refetch or drop
+            if drop:
+                self._dataset = None
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        lookups = self._stats['hits'] + self._stats['misses']
+        dataset = self._dataset
+        return {
+            **self._stats,
+            'hit_rate': round(self._stats['hits'] / lookups, 4) if lookups else None,
+            'ttl_seconds': self.ttl_seconds,
+            'loaded': dataset is not None,
+            'version': dataset.version if dataset else None,
+            'source': dataset.source if dataset else None,
+            'rows': int(dataset.rows) if dataset else 0,
+            'age_seconds': round(dataset.age_seconds(), 1) if dataset else None,
+            'checked_seconds_ago': round(time.time() - self._checked_at, 1) if self._checked_at else None,
+            'background_refresh': self.refreshing_in_background,
+            'refreshed_by_parent': self.follows,
+            'refresh_interval_seconds': self.refresh_interval,
+            'last_error': self.last_error,
+        }
@@ -0,0 +1,79 @@
+"""
+Gunicorn configuration for production serving.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master (`preload_app`) and the cleaned
+dataset is loaded there before any worker is forked, so all workers share the
+same frame pages copy-on-write instead of each downloading and parsing the CSV.
+Each worker serves several requests at once with threads, so one slow export
+no longer blocks other users.
+
+The master is also the only process that revalidates the source (in a
+background refresher thread), so no request waits on Google Drive and a new
+version is downloaded, parsed and snapshotted once, not once per worker.
+When a new version has been swapped in, the master recycles its workers
+(as on SIGHUP): fresh workers are forked from it and share the new frame,
+and the old ones finish their requests and exit. Workers never rebuild the
+dataset themselves; `/api/cache/invalidate` sends SIGHUP to the master,
+which revalidates (and recycles the workers once more if the data changed).
+
+A Google Drive URL set through the API is handed to the master the same way:
+the worker writes it to a small file next to the snapshot and sends SIGHUP,
+and the master applies it before forking the new workers, then loads from
+it. Like in the dev server, it lasts until the next restart;
+`GOOGLE_DRIVE_CSV_URL` is the permanent setting.
+"""
+
+import gc
+import multiprocessing
+import os
+import signal
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+preload_app = True
+# Large exports and cold loads can take a while
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+keepalive = 5
+accesslog = '-'
+
+
+def when_ready(server):
+    """Runs in the master after the app is imported and before workers are forked"""
+    import app
+
+    app.preload_dataset()
+    # Move everything allocated so far out of the GC's reach, so collections in
+    # the workers don't write to (and thereby copy) the shared pages
+    gc.freeze()
+    server.log.info("Dataset preloaded; forking workers")
+    app.start_background_refresh(on_new_version=lambda dataset: recycle_workers(server))
+
+
+def recycle_workers(server):
+    """Replace the workers so they fork from the master's new dataset (from the refresher thread)"""
+    server.dataset_recycle = True
+    os.kill(server.pid, signal.SIGHUP)
+
+
+def on_reload(server):
+    """Runs in the master on SIGHUP, before the new workers are forked"""
+    import app
+
+    if getattr(server, 'dataset_recycle', False):
+        # Sent by recycle_workers: the dataset was just refreshed
+        server.dataset_recycle = False
+    elif not app.apply_pending_source_change():
+        # From a worker (/api/cache/invalidate) or an operator: revalidate in the background
+        app.sales_cache.request_refresh()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Workers serve the master's dataset and leave revalidation to it"""
+    import app
+
+    app.follow_parent_refresh()
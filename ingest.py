@@ -0,0 +1,161 @@
+"""
+Incremental (append-only) ingestion of the single sales CSV.
+
+The sales export only grows: each day adds invoices and '-R' returns at the
+end. After every build the dataset remembers where the file ended (`offset`,
+on a line boundary) and the hash of everything up to there. When the file
+changes, the bytes before that offset are hashed again:
+
+- same hash: earlier rows were not touched, so only the bytes after the
+  offset are parsed and cleaned, and merged into the existing frame
+- different hash, different header or a shorter file: earlier rows were
+  rewritten, so the dataset is rebuilt from scratch
+
+Invoices are deduplicated on INVOICENUMBER (the first occurrence wins), on
+full builds and appends alike, so re-exported rows are not counted twice.
+A row only counts as a duplicate if its date and amount match as well: a
+sale can be returned in several parts, and each partial return carries the
+same '-R' number.
+
+The state (offset, hash, header) lives on the dataset and in the snapshot
+metadata, so appends keep working across restarts. So does the sorted set of
+row keys the deduplication checks new rows against (8 bytes per row, stored
+next to the snapshot): it is extended with each append instead of being
+rehashed from the whole frame.
+"""
+
+import csv
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from dataset_cache import HASH_BLOCK_SIZE
+from instrumentation import get_logger
+from sales_index import SORT_COLUMNS
+from sales_pipeline import concat_chunks, read_clean_csv
+
+logger = get_logger('ingest')
+
+
+def _read_header(path):
+    with open(path, 'rb') as f:
+        return f.readline()
+
+
+def _ends_with_newline(path, size):
+    if size == 0:
+        return False
+    with open(path, 'rb') as f:
+        f.seek(size - 1)
+        return f.read(1) == b'\n'
+
+
+def prefix_digest(path, length):
+    """Hash of the first `length` bytes of a file (same short form as `hash_file`)"""
+    digest = hashlib.sha256()
+    remaining = length
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            block = f.read(min(HASH_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()[:16]
+
+
+def ingest_state(path, digest, size):
+    """
+    What the next append needs to know about the file a dataset was built from,
+    or None if the file does not end on a complete line (it may still be written)
+    """
+    if not _ends_with_newline(path, size):
+        return None
+    return {
+        'offset': size,
+        'digest': digest,
+        'header': _read_header(path).decode('utf-8', errors='replace'),
+    }
+
+
+def append_check(state, path, size):
+    """None if the file at `path` only grew since `state` was taken, else why it cannot be appended"""
+    if not state:
+        return 'no ingest state for the current dataset'
+    if size < state['offset']:
+        return 'file shrank'
+    if _read_header(path).decode('utf-8', errors='replace') != state['header']:
+        return 'header changed'
+    if prefix_digest(path, state['offset']) != state['digest']:
+        return 'earlier rows were rewritten'
+    return None
+
+
+def read_appended_rows(path, state):
+    """Cleaned rows from the bytes after the stored offset"""
+    names = next(csv.reader([state['header']]))
+    with open(path, 'rb') as f:
+        f.seek(state['offset'])
+        return read_clean_csv(f, names=names)
+
+
+DEDUPE_COLUMNS = ['INVOICENUMBER', 'Date', 'NETREVENUEAMOUNT']
+
+
+def invoice_keys(df):
+    """One 64-bit hash per row of (INVOICENUMBER, Date, NETREVENUEAMOUNT)"""
+    return pd.util.hash_pandas_object(df[DEDUPE_COLUMNS], index=False)
+
+
+def key_set(df):
+    """Sorted array of the distinct invoice keys of a frame's rows"""
+    return np.unique(invoice_keys(df).to_numpy())
+
+
+def _in_key_set(keys, known):
+    """Mask of the `keys` found in the sorted `known` array (binary search per key)"""
+    if not len(known):
+        return np.zeros(len(keys), dtype=bool)
+    found = np.searchsorted(known, keys)
+    return known[np.minimum(found, len(known) - 1)] == keys
+
+
+def dedupe_invoices(df, known=None):
+    """
+    Drop invoices already seen, earlier in `df` or in `known` (the key set of
+    the rows already in the dataset). Returns (rows, dropped, key set of the
+    rows kept plus `known`).
+
+    Only the new rows are hashed: the existing rows' keys are looked up by
+    binary search and the new keys merged in, so an append never rehashes
+    the whole dataset.
+    """
+    keys = invoice_keys(df)
+    duplicated = keys.duplicated(keep='first').to_numpy()
+    keys = keys.to_numpy()
+    if known is not None:
+        duplicated = duplicated | _in_key_set(keys, known)
+    kept = np.sort(keys[~duplicated])
+    if known is not None:
+        kept = np.insert(known, np.searchsorted(known, kept), kept)
+    if not duplicated.any():
+        return df, 0, kept
+    return df[~duplicated], int(duplicated.sum()), kept
+
+
+def append_sorted(frame, new_rows):
+    """
+    `frame` (sorted by Date, LOCATIONNAME) with `new_rows` merged in, in the same
+    order a full build would give. Rows dated before the earliest new row keep
+    their positions; only the rows from there on are re-sorted. Returns
+    (combined frame, boundary position).
+    """
+    first_new = new_rows['Date'].min()
+    boundary = int(np.searchsorted(frame['Date'].to_numpy(), np.datetime64(first_new), side='left'))
+    # Shallow copies: concat_chunks widens categories in place
+    tail = concat_chunks([frame.iloc[boundary:].copy(deep=False), new_rows.copy(deep=False)])
+    tail = tail.sort_values(SORT_COLUMNS, kind='stable', ignore_index=True)
+    combined = concat_chunks([frame.iloc[:boundary].copy(deep=False), tail])
+    combined.attrs = {}
+    return combined, boundary
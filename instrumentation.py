@@ -0,0 +1,216 @@
+"""
+Logging and timing instrumentation for the API.
+
+- `get_logger(name)` returns a leveled logger. `configure_logging()` sends
+  every record to stdout, either as text with `key=value` fields or as one
+  JSON object per line (`LOG_FORMAT=json`). The level comes from `LOG_LEVEL`
+  (default INFO). Structured fields are passed with `extra={...}`.
+- Pipeline stages (download, parse, clean, derive, filter, aggregate,
+  serialize, ...) are timed with `timed(stage)` or a `Stopwatch`, and
+  request latencies with `observe_request()`. Both are kept as histograms
+  and rendered in the Prometheus text format by `render_prometheus()`.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LOGGER_NAME = 'pharmacy'
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4'
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Attributes every LogRecord has; anything else on a record came in through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+def _fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class TextFormatter(logging.Formatter):
+    """`time LEVEL logger message key=value ...`"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the `extra` fields at the top level"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **_fields(record),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=None, log_format=None):
+    """Attach the stdout handler to the package logger (once) and set its level"""
+    logger = logging.getLogger(LOGGER_NAME)
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    log_format = (log_format or os.getenv('LOG_FORMAT', 'text')).lower()
+    logger.setLevel(level)
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        logger.addHandler(handler)
+        logger.propagate = False
+    for handler in logger.handlers:
+        handler.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+    return logger
+
+
+def get_logger(name):
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram with labels"""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        labels = tuple(str(label) for label in labels)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0, 'max': 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['count'] += 1
+            series['sum'] += value
+            series['max'] = max(series['max'], value)
+
+    def summary(self):
+        """{labels: {'count', 'sum', 'max', 'mean'}} for JSON reports"""
+        with self._lock:
+            return {
+                labels: {
+                    'count': series['count'],
+                    'sum': round(series['sum'], 6),
+                    'max': round(series['max'], 6),
+                    'mean': round(series['sum'] / series['count'], 6) if series['count'] else None,
+                }
+                for labels, series in self._series.items()
+            }
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                label_text = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+                for bound, count in zip(self.buckets, series['buckets']):
+                    lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {series["count"]}')
+                lines.append(f"{self.name}_sum{{{label_text}}} {series['sum']:.6f}")
+                lines.append(f"{self.name}_count{{{label_text}}} {series['count']}")
+        return lines
+
+
+stage_seconds = Histogram('pharmacy_stage_seconds', 'Time spent in each data pipeline stage', ['stage'])
+request_seconds = Histogram(
+    'pharmacy_http_request_seconds',
+    'Time until the view returned its response (streamed bodies are timed in the serialize stage)',
+    ['endpoint', 'status'],
+)
+
+_log = get_logger('timing')
+
+
+def record_stage(stage, seconds, **fields):
+    stage_seconds.observe((stage,), seconds)
+    if _log.isEnabledFor(logging.DEBUG):
+        _log.debug("Stage finished", extra={'stage': stage, 'seconds': round(seconds, 4), **fields})
+
+
+@contextmanager
+def timed(stage, **fields):
+    """Time a block as one run of `stage`"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started, **fields)
+
+
+class Stopwatch:
+    """Accumulates time across several `with` blocks and iterator steps, e.g. per chunk"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds += time.perf_counter() - self._started
+
+    def iterate(self, iterable):
+        """Yield from `iterable`, counting only the time spent producing each item"""
+        iterator = iter(iterable)
+        while True:
+            with self:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+
+def timed_iter(stage, chunks):
+    """Pass a generator through, recording the time spent producing it as one run of `stage`"""
+    stopwatch = Stopwatch()
+    try:
+        yield from stopwatch.iterate(chunks)
+    finally:
+        record_stage(stage, stopwatch.seconds)
+
+
+def observe_request(endpoint, status, seconds):
+    request_seconds.observe((endpoint or 'unmatched', status), seconds)
+
+
+def _metric_lines(name, metric_type, help_text, samples):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return lines
+
+
+def render_prometheus(metrics=()):
+    """
+    Stage and request histograms plus `metrics`, an iterable of
+    (name, type, help, [(labels, value), ...]) for gauges and counters
+    """
+    lines = stage_seconds.render() + request_seconds.render()
+    for name, metric_type, help_text, samples in metrics:
+        samples = [(labels, value) for labels, value in samples if value is not None]
+        if samples:
+            lines += _metric_lines(name, metric_type, help_text, samples)
+    return '\n'.join(lines) + '\n'
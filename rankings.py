@@ -0,0 +1,115 @@
+"""
+Top / bottom N rankings of pharmacists, locations and days.
+
+Rankings are computed from the rollup cube (day x location x pharmacist), so
+a ranking groups a few thousand pre-aggregated rows rather than the raw
+sales. Only the first N are ordered: `np.argpartition` finds the N-th best
+value, every row at least that good (ties on the boundary included) becomes
+a candidate, and only the candidates are sorted. Ties on the ranked metric
+are broken by a second metric, then by name (or date).
+"""
+
+import numpy as np
+import pandas as pd
+
+from analytics import BREAKDOWN_DIMENSIONS as DIMENSIONS, filter_sales
+
+METRICS = ['revenue', 'transactions', 'averageBasket', 'returnRate']
+ORDERS = ('top', 'bottom')
+MAX_N = 1000
+SUMMED = ['revenue', 'grossSales', 'returns', 'transactions', 'salesTransactions', 'returnTransactions']
+
+
+def ranking_table(cube, dimension):
+    """One row per pharmacist / location / day with summed and derived metrics"""
+    table = cube[SUMMED].groupby(cube[DIMENSIONS[dimension]], observed=True).sum()
+    table = table[table['transactions'] > 0]
+    table['averageBasket'] = table['grossSales'] / table['salesTransactions'].where(table['salesTransactions'] > 0)
+    table['returnRate'] = table['returnTransactions'] / table['transactions']
+    return table
+
+
+def select_ranked(values, tiebreak, keys, n, ascending=False):
+    """
+    Positions of the first `n` rows ordered by `values`, then `tiebreak`
+    (same direction), then `keys` ascending, without sorting every row.
+    Returns (positions, ranks) where tied values share the same rank.
+    """
+    sign = 1.0 if ascending else -1.0
+    scores = sign * values
+    if n < len(scores):
+        # Everything scoring at most the n-th best score is a candidate, so ties at the cut stay in
+        threshold = scores[np.argpartition(scores, n - 1)[n - 1]]
+        candidates = np.flatnonzero(scores <= threshold)
+    else:
+        candidates = np.arange(len(scores))
+
+    # lexsort sorts by the last key first
+    order = np.lexsort((keys[candidates], sign * tiebreak[candidates], scores[candidates]))
+    chosen = candidates[order][:n]
+    # Competition ranking: 1 + the number of rows with a strictly better score
+    ranks = np.searchsorted(np.sort(scores[candidates]), scores[chosen], side='left') + 1
+    return chosen, ranks
+
+
+def rank(cube, dimension='pharmacist', metric='revenue', n=10, order='top', tiebreak=None,
+         years=None, months=None, locations=None, min_transactions=0):
+    """Top or bottom `n` rows of a dimension by `metric`, for the dashboard filters"""
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown dimension '{dimension}'; use one of: {', '.join(DIMENSIONS)}")
+    tiebreak = tiebreak or ('transactions' if metric == 'revenue' else 'revenue')
+    for name in (metric, tiebreak):
+        if name not in METRICS:
+            raise ValueError(f"Unknown metric '{name}'; use one of: {', '.join(METRICS)}")
+    if order not in ORDERS:
+        raise ValueError("order must be 'top' or 'bottom'")
+    if not 1 <= n <= MAX_N:
+        raise ValueError(f"n must be between 1 and {MAX_N}")
+
+    table = ranking_table(filter_sales(cube, years, months, locations), dimension)
+    if min_transactions:
+        table = table[table['transactions'] >= min_transactions]
+    # Rows without a value for the metric (e.g. no sales, so no basket) are not ranked
+    table = table[table[metric].notna()]
+
+    keys = table.index.to_numpy()
+    if dimension == 'day':
+        keys = keys.astype('datetime64[ns]').astype('int64')
+    else:
+        keys = keys.astype(str)
+    positions, ranks = select_ranked(
+        table[metric].to_numpy(dtype='float64'),
+        table[tiebreak].fillna(0).to_numpy(dtype='float64'),
+        keys,
+        n,
+        ascending=order == 'bottom',
+    )
+
+    results = []
+    for position, place in zip(positions, ranks):
+        row = table.iloc[position]
+        key = table.index[position]
+        entry = {'rank': int(place)}
+        if dimension == 'day':
+            entry.update({'date': key.strftime('%Y-%m-%d'), 'dayName': key.strftime('%A')})
+        else:
+            entry['name'] = str(key)
+        entry.update({
+            'revenue': round(float(row['revenue']), 2),
+            'transactions': int(row['transactions']),
+            'averageBasket': round(float(row['averageBasket']), 2) if pd.notna(row['averageBasket']) else None,
+            'returnRate': round(float(row['returnRate']), 4),
+            'returns': round(float(row['returns']), 2),
+            'returnTransactions': int(row['returnTransactions']),
+        })
+        results.append(entry)
+
+    return {
+        'dimension': dimension,
+        'metric': metric,
+        'order': order,
+        'n': n,
+        'tiebreak': tiebreak,
+        'ranked': int(len(table)),
+        'results': results,
+    }
@@ -0,0 +1,191 @@
+"""
+HTTP response cache for the data endpoints.
+
+Responses are keyed on (endpoint, normalized query parameters, dataset
+version, negotiated wire format, content encoding). Because the key changes whenever the dataset
+does, entries never have to be invalidated: old versions simply fall out of
+the LRU. The same key gives the response's ETag, so a conditional GET is
+answered with 304 before the view runs at all.
+
+Serialized (already compressed) bodies are kept in a bounded LRU that evicts
+by total size. Streamed responses keep streaming; their chunks are collected
+on the way out and stored once the stream completes.
+"""
+
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+from compression import choose_encoding, compress_response
+from streaming import negotiate_format
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Headers that are recomputed for every response instead of being replayed
+SKIPPED_HEADERS = {'content-type', 'content-length', 'etag', 'last-modified', 'cache-control', 'set-cookie'}
+
+
+def normalized_params(args):
+    """Query parameters in a canonical order, so `?a=1&b=2` and `?b=2&a=1` share an entry"""
+    return tuple(sorted((key, tuple(sorted(values))) for key, values in args.lists()))
+
+
+def cache_key(endpoint, args, version, wire_format, encoding):
+    return (endpoint, normalized_params(args), version, wire_format, encoding or 'identity')
+
+
+def etag_for(key):
+    return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()[:20]
+
+
+class CachedBody:
+    def __init__(self, body, content_type, headers):
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers
+
+    @property
+    def size(self):
+        return len(self.body)
+
+
+class ResponseCache:
+    """Size-bounded LRU of serialized response bodies with hit/miss/304 counters"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_entry_bytes=None):
+        self.max_bytes = max_bytes
+        # A single huge export should not flush everything else out of the cache
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 4
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'not_modified': 0,
+            'stores': 0,
+            'evictions': 0,
+            'too_large': 0,
+        }
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def put(self, key, entry):
+        if entry.size > self.max_entry_bytes:
+            self._count('too_large')
+            return False
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._stats['stores'] += 1
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self._stats['evictions'] += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        # One consistent view of the counters, taken under the lock that guards them
+        with self._lock:
+            stats = dict(self._stats)
+            entries, size = len(self._entries), self._bytes
+        lookups = stats['hits'] + stats['misses']
+        return {
+            **stats,
+            'hit_rate': round(stats['hits'] / lookups, 4) if lookups else None,
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+        }
+
+    def _collect(self, key, chunks, content_type, headers):
+        """Pass a streamed body through, storing it once it completed within the size limit"""
+        collected, size = [], 0
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if collected is not None:
+                size += len(chunk)
+                if size > self.max_entry_bytes:
+                    self._count('too_large')
+                    collected = None
+                else:
+                    collected.append(chunk)
+            yield chunk
+        if collected is not None:
+            self.put(key, CachedBody(b''.join(collected), content_type, headers))
+
+    def cached(self, get_dataset):
+        """
+        Decorator for GET views whose output depends only on the query string and
+        the dataset returned by `get_dataset()` (which must expose `version` and
+        `loaded_at`)
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                try:
+                    dataset = get_dataset()
+                except Exception:
+                    # Let the view report the load failure the way it always has
+                    return view(*args, **kwargs)
+                key = cache_key(request.endpoint, request.args, dataset.version,
+                                negotiate_format(request), choose_encoding(request.accept_encodings))
+                etag = etag_for(key)
+
+                if request.if_none_match.contains(etag):
+                    self._count('not_modified')
+                    return self._finish(Response(status=304), etag, dataset)
+
+                entry = self.get(key)
+                if entry is not None:
+                    response = Response(entry.body, content_type=entry.content_type, headers=entry.headers)
+                    return self._finish(response, etag, dataset)
+
+                response = view(*args, **kwargs)
+                if not isinstance(response, Response) or response.status_code != 200:
+                    return response
+
+                # Compress here rather than in the after_request hook so the stored body is the final one
+                response = compress_response(request, response)
+                headers = [(name, value) for name, value in response.headers.items()
+                           if name.lower() not in SKIPPED_HEADERS]
+                if response.is_streamed:
+                    response.response = self._collect(key, response.response, response.content_type, headers)
+                else:
+                    self.put(key, CachedBody(response.get_data(), response.content_type, headers))
+                return self._finish(response, etag, dataset)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _finish(response, etag, dataset):
+        response.set_etag(etag)
+        # The wire format can be negotiated with the Accept header
+        response.vary.add('Accept')
+        response.last_modified = dataset.loaded_at
+        # Clients may keep the body but must revalidate it (cheaply, with If-None-Match)
+        response.cache_control.no_cache = True
+        return response
@@ -0,0 +1,198 @@
+"""
+Returns analysis: every '-R' invoice linked to the sale it returns.
+
+A return reuses the invoice number of its sale with the '-R' marker
+appended, so returns are matched to sales with a hash join: the sale invoice
+numbers are put in a hash index once, and each return's base number is
+looked up in it. A sale can be returned in several parts; each part is
+matched to the same sale.
+
+Matched returns are attributed to the sale (its day, location and
+pharmacist), so a return rate answers "what share of these sales came
+back". Like the rollup cube, the result is a day x location x pharmacist
+table of summable measures (sales, returned sales, return count and amount,
+days to return and a days-to-return histogram), built once per dataset
+version, and every breakdown is a group-by over it.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+from analytics import BREAKDOWN_DIMENSIONS as DIMENSIONS, filter_sales
+from rollup import CUBE_KEYS
+from sales_pipeline import RETURN_MARKER, return_mask
+
+# Lower bounds (in days) of the days-to-return histogram buckets
+DAYS_TO_RETURN_BUCKETS = [0, 1, 8, 31, 91]
+BUCKET_LABELS = ['sameDay', '1-7', '8-30', '31-90', '91+']
+BUCKET_COLUMNS = [f'days_{label}' for label in BUCKET_LABELS]
+SUMMED = ['sales', 'grossSales', 'returnedSales', 'returns', 'returnedAmount', 'daysToReturn'] + BUCKET_COLUMNS
+
+
+def original_invoice_numbers(return_numbers):
+    """Invoice number of the sale each return belongs to (the part before the last '-R')"""
+    # A greedy group stops at the last marker; one vectorized regex replace instead of rpartition's frame
+    return return_numbers.str.replace(f"(?s)^(.*){re.escape(RETURN_MARKER)}.*$", r'\1', regex=True)
+
+
+def _is_in(values, value_set):
+    """Mask of the strings in `values` that are in `value_set` (Arrow's hash lookup when available)"""
+    if HAS_PYARROW:
+        return pc.is_in(pa.chunked_array(values), value_set=pa.chunked_array(value_set)).to_numpy(zero_copy_only=False)
+    return values.isin(value_set).to_numpy()
+
+
+def match_returns(df):
+    """
+    Hash join of return rows to sale rows on the invoice number.
+    Returns (sale positions, return positions, and for each return the
+    position of its sale in `df`, or -1 when no sale has its number).
+    """
+    numbers = df['INVOICENUMBER'].astype(str)
+    is_return = return_mask(numbers)
+    sale_positions = np.flatnonzero(~is_return)
+    return_positions = np.flatnonzero(is_return)
+
+    originals = original_invoice_numbers(numbers.iloc[return_positions])
+    # Only the few sales some return points at are indexed: probing every sale number against
+    # the (small) set of returned numbers is much cheaper than hashing all sale numbers
+    indexed_positions = sale_positions[_is_in(numbers.iloc[sale_positions], originals)]
+    # Built from the string column directly; going through an object array is slower
+    index = pd.Index(numbers.iloc[indexed_positions])
+    if not index.is_unique:
+        # A repeated sale number joins to its first row
+        first = ~index.duplicated(keep='first')
+        index, indexed_positions = index[first], indexed_positions[first]
+    found = index.get_indexer(originals)
+    matched = np.where(found >= 0, indexed_positions[np.maximum(found, 0)], -1)
+    return sale_positions, return_positions, matched
+
+
+def _returns_cube(df):
+    """Per-sale-cell measures and the match counts for the whole frame"""
+    sale_positions, return_positions, matched = match_returns(df)
+    dates = df['Date'].to_numpy()
+    amounts = df['NETREVENUEAMOUNT'].to_numpy(dtype='float64')
+
+    sales = df[CUBE_KEYS].iloc[sale_positions].reset_index(drop=True)
+    sales['sales'] = 1
+    sales['grossSales'] = amounts[sale_positions]
+    sales = sales.groupby(CUBE_KEYS, observed=True, sort=True, dropna=False).sum()
+
+    found = matched >= 0
+    originals = matched[found]
+    returned = df[CUBE_KEYS].iloc[originals].reset_index(drop=True)
+    # A return dated before its sale counts as a same-day return
+    days = np.maximum((dates[return_positions[found]] - dates[originals]) // np.timedelta64(1, 'D'), 0)
+    # A sale returned in several parts is one returned sale
+    returned['returnedSales'] = (~pd.Index(originals).duplicated()).astype(int)
+    returned['returns'] = 1
+    returned['returnedAmount'] = -amounts[return_positions[found]]
+    returned['daysToReturn'] = days
+    bucket = np.digitize(days, DAYS_TO_RETURN_BUCKETS) - 1
+    for position, column in enumerate(BUCKET_COLUMNS):
+        returned[column] = (bucket == position).astype(int)
+    returned = returned.groupby(CUBE_KEYS, observed=True, sort=True, dropna=False).sum()
+
+    # Every returned sale's cell is in the sales table, so a left join keeps all of them
+    cube = sales.join(returned, how='left').fillna(0).reset_index()
+    for column in SUMMED:
+        if column not in ('grossSales', 'returnedAmount'):
+            cube[column] = cube[column].astype('int32')
+    cube['Year'] = cube['Date'].dt.year.astype('int16')
+    cube['Month'] = cube['Date'].dt.month.astype('int8')
+    for column in ('LOCATIONNAME', 'PHARMACISTNAME'):
+        cube[column] = cube[column].astype('category')
+
+    unmatched = return_positions[~found]
+    counts = {
+        'returns': int(len(return_positions)),
+        'matched': int(found.sum()),
+        'unmatched': int(len(unmatched)),
+        'unmatchedAmount': round(abs(float(amounts[unmatched].sum())), 2),
+    }
+    return cube, counts
+
+
+def _with_rates(table):
+    """Summed measures plus return rates and average days to return"""
+    table = table.copy()
+    table['returnRate'] = table['returnedSales'] / table['sales'].where(table['sales'] > 0)
+    table['amountReturnRate'] = table['returnedAmount'] / table['grossSales'].where(table['grossSales'] > 0)
+    table['averageDaysToReturn'] = table['daysToReturn'] / table['returns'].where(table['returns'] > 0)
+    return table
+
+
+def _describe(row):
+    """JSON-friendly measures of one summed row"""
+    def rounded(value, digits):
+        return round(float(value), digits) if pd.notna(value) else None
+
+    return {
+        'sales': int(row['sales']),
+        'grossSales': round(float(row['grossSales']), 2),
+        'returnedSales': int(row['returnedSales']),
+        'returns': int(row['returns']),
+        'returnedAmount': round(float(row['returnedAmount']), 2),
+        'returnRate': rounded(row['returnRate'], 4),
+        'amountReturnRate': rounded(row['amountReturnRate'], 4),
+        'averageDaysToReturn': rounded(row['averageDaysToReturn'], 2),
+    }
+
+
+class ReturnsAnalysis:
+    """Returns matched to their sales for one dataset version"""
+
+    def __init__(self, cube, counts):
+        self.cube = cube
+        self.counts = counts
+
+    @classmethod
+    def build(cls, df):
+        return cls(*_returns_cube(df))
+
+    def breakdown(self, dimension='pharmacist', years=None, months=None, locations=None):
+        """
+        Return rates, amounts and days to return of the sales made by each
+        pharmacist / location / day, for the dashboard filters
+        """
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension '{dimension}'; use one of: {', '.join(DIMENSIONS)}")
+        rows = filter_sales(self.cube, years, months, locations)
+
+        totals = _with_rates(rows[SUMMED].sum().to_frame().T).iloc[0]
+        summary = _describe(totals)
+        summary['daysToReturn'] = {label: int(totals[column]) for label, column in zip(BUCKET_LABELS, BUCKET_COLUMNS)}
+
+        table = _with_rates(rows[SUMMED].groupby(rows[DIMENSIONS[dimension]], observed=True).sum())
+        if dimension != 'day':
+            table = table.sort_values(['returnedAmount', 'returns'], ascending=False, kind='stable')
+        results = []
+        for key, row in table.to_dict('index').items():
+            entry = {'date': key.strftime('%Y-%m-%d')} if dimension == 'day' else {'name': str(key)}
+            entry.update(_describe(row))
+            results.append(entry)
+
+        return {
+            'dimension': dimension,
+            'summary': summary,
+            # Whole dataset, not filtered: returns without a sale have no sale day, location or pharmacist
+            'matching': self.counts,
+            'results': results,
+        }
+
+    def info(self):
+        return {
+            'rows': int(len(self.cube)),
+            **self.counts,
+            'memory_bytes': int(self.cube.memory_usage(deep=True).sum()),
+        }
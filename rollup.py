@@ -0,0 +1,110 @@
+"""
+Materialized day x location x pharmacist rollup of the cleaned sales data.
+
+The dashboard views only need daily granularity, so the cube keeps one row
+per (Date, LOCATIONNAME, PHARMACISTNAME) with summed measures (net revenue,
+gross sales, returns, transaction counts and the cash / credit payment split).
+That is a few thousand rows instead of hundreds of thousands, and any filtered
+aggregate can be answered from it.
+
+When a new version of the source only appended days, the cube is updated by
+aggregating just the rows from the last covered day onwards.
+
+The cube stays sorted by Date (a full build groups with sort=True, an
+incremental update only appends later days), which the date-range
+time series relies on.
+"""
+
+import numpy as np
+import pandas as pd
+
+from analytics import MEASURES, aggregate_measures, filter_sales, measure_frame
+
+CUBE_KEYS = ['Date', 'LOCATIONNAME', 'PHARMACISTNAME']
+
+
+def _rollup(df):
+    """Aggregate cleaned rows to cube granularity with compact dtypes"""
+    measures = measure_frame(df)
+    cube = measures.groupby(CUBE_KEYS, observed=True, sort=True, dropna=False)[MEASURES].sum().reset_index()
+    cube['Year'] = cube['Date'].dt.year.astype('int16')
+    cube['Month'] = cube['Date'].dt.month.astype('int8')
+    for column in ('LOCATIONNAME', 'PHARMACISTNAME'):
+        cube[column] = cube[column].astype('category')
+    for column in ('transactions', 'salesTransactions', 'returnTransactions'):
+        cube[column] = cube[column].astype('int32')
+    return cube
+
+
+class RollupCube:
+    """Pre-aggregated sales cube built from one dataset version"""
+
+    def __init__(self, cube, max_date, settled_rows, settled_revenue, source_rows):
+        self.cube = cube
+        # Rows dated before max_date are "settled"; the last day may still grow
+        self.max_date = max_date
+        self.settled_rows = settled_rows
+        self.settled_revenue = settled_revenue
+        self.source_rows = source_rows
+        self.incremental = False
+
+    @classmethod
+    def build(cls, df):
+        max_date = df['Date'].max() if len(df) else None
+        settled = df['Date'] < max_date if max_date is not None else np.zeros(0, dtype=bool)
+        return cls(
+            _rollup(df),
+            max_date,
+            int(settled.sum()),
+            float(df.loc[settled, 'NETREVENUEAMOUNT'].sum()),
+            len(df),
+        )
+
+    def _only_appended(self, df):
+        """True if df contains exactly our settled rows plus rows on/after max_date"""
+        if self.max_date is None or len(df) < self.source_rows:
+            return False
+        settled = df['Date'] < self.max_date
+        if int(settled.sum()) != self.settled_rows:
+            return False
+        return bool(np.isclose(df.loc[settled, 'NETREVENUEAMOUNT'].sum(), self.settled_revenue, rtol=0, atol=0.005))
+
+    def updated(self, df):
+        """
+        Return a cube for the new frame `df`, reusing this one when the source
+        only gained rows from the last covered day onwards
+        """
+        if not self._only_appended(df):
+            return RollupCube.build(df)
+
+        new_rows = df[df['Date'] >= self.max_date]
+        kept = self.cube[self.cube['Date'] < self.max_date]
+        fresh = _rollup(new_rows)
+        cube = pd.concat([kept, fresh], ignore_index=True)
+        for column in ('LOCATIONNAME', 'PHARMACISTNAME'):
+            cube[column] = cube[column].astype('category')
+
+        new_max = df['Date'].max()
+        settled = new_rows['Date'] < new_max
+        result = RollupCube(
+            cube,
+            new_max,
+            self.settled_rows + int(settled.sum()),
+            self.settled_revenue + float(new_rows.loc[settled, 'NETREVENUEAMOUNT'].sum()),
+            len(df),
+        )
+        result.incremental = True
+        return result
+
+    def aggregate(self, years=None, months=None, locations=None):
+        """Dashboard summary tables for the given filters, answered from the cube"""
+        return aggregate_measures(filter_sales(self.cube, years, months, locations))
+
+    def info(self):
+        return {
+            'rows': int(len(self.cube)),
+            'source_rows': int(self.source_rows),
+            'max_date': self.max_date.strftime('%Y-%m-%d') if self.max_date is not None else None,
+            'memory_bytes': int(self.cube.memory_usage(deep=True).sum()),
+            'incremental': self.incremental,
+        }
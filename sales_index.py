@@ -0,0 +1,126 @@
+"""
+Partition index over the cleaned sales frame.
+
+The cached frame is sorted by (Date, LOCATIONNAME). The index keeps, for every
+(year, month, location) partition, the sorted row positions that belong to it,
+so a filtered query only touches the partitions it selects instead of scanning
+the whole frame with `isin`.
+
+Pages are addressed with a keyset cursor (the position of the last row that
+was returned): each partition is binary-searched for the cursor and only the
+next `limit` rows are merged, so page 1000 costs the same as page 1.
+"""
+
+import copy
+
+import numpy as np
+import pandas as pd
+
+SORT_COLUMNS = ['Date', 'LOCATIONNAME']
+
+
+def sort_for_index(df):
+    """Order the frame the way the index and cursors expect"""
+    return df.sort_values(SORT_COLUMNS, kind='stable', ignore_index=True)
+
+
+class PartitionIndex:
+    """Row positions of a (Date, LOCATIONNAME)-sorted frame, grouped by year, month and location"""
+
+    def __init__(self, df):
+        locations = df['LOCATIONNAME'].astype('category')
+        self.locations = list(locations.cat.categories)
+        location_codes = locations.cat.codes.to_numpy()
+        years = df['Year'].to_numpy()
+        months = df['Month'].to_numpy()
+
+        keys = pd.DataFrame({'year': years, 'month': months, 'location': location_codes})
+        self.partitions = {}
+        for (year, month, location), positions in keys.groupby(['year', 'month', 'location'], sort=True).indices.items():
+            name = self.locations[location] if location >= 0 else None
+            self.partitions[(int(year), int(month), name)] = positions.astype('int32')
+        self.rows = len(df)
+
+    def appended(self, df, boundary):
+        """
+        Index for `df`, whose first `boundary` rows are the first `boundary` rows
+        this index was built from: positions before the boundary are kept and
+        only the rows after it are indexed
+        """
+        tail = PartitionIndex(df.iloc[boundary:])
+        index = copy.copy(self)
+        index.partitions = {}
+        for key, positions in self.partitions.items():
+            kept = positions[:np.searchsorted(positions, boundary, side='left')]
+            if len(kept):
+                index.partitions[key] = kept
+        for key, positions in tail.partitions.items():
+            shifted = positions + np.int32(boundary)
+            index.partitions[key] = np.concatenate([index.partitions[key], shifted]) if key in index.partitions else shifted
+        index.locations = sorted(set(self.locations) | set(tail.locations))
+        index.rows = len(df)
+        return index
+
+    def select(self, years=None, months=None, locations=None):
+        """Partitions matching the filters, as a list of sorted position arrays"""
+        years = set(years) if years else None
+        months = set(months) if months else None
+        locations = set(locations) if locations else None
+        return [
+            positions
+            for (year, month, location), positions in self.partitions.items()
+            if (years is None or year in years)
+            and (months is None or month in months)
+            and (locations is None or location in locations)
+        ]
+
+    @staticmethod
+    def count(parts):
+        return int(sum(len(positions) for positions in parts))
+
+    @staticmethod
+    def count_after(parts, after):
+        """Number of selected rows positioned after `after`"""
+        return int(sum(len(positions) - np.searchsorted(positions, after, side='right') for positions in parts))
+
+    @staticmethod
+    def page_after(parts, after, limit):
+        """The first `limit` positions greater than `after` across all partitions, in frame order"""
+        candidates = []
+        for positions in parts:
+            start = np.searchsorted(positions, after, side='right')
+            if start < len(positions):
+                candidates.append(positions[start:start + limit])
+        if not candidates:
+            return np.empty(0, dtype='int32')
+        merged = np.concatenate(candidates)
+        if len(merged) > limit:
+            merged = np.partition(merged, limit - 1)[:limit]
+        return np.sort(merged)
+
+    @staticmethod
+    def page_offset(parts, offset, limit):
+        """Offset pagination over the selected partitions (kept for older clients)"""
+        if not parts:
+            return np.empty(0, dtype='int32')
+        return np.sort(np.concatenate(parts))[offset:offset + limit]
+
+    def info(self):
+        return {
+            'partitions': len(self.partitions),
+            'rows': int(self.rows),
+            'memory_bytes': int(sum(positions.nbytes for positions in self.partitions.values())),
+        }
+
+
+def encode_cursor(version, position):
+    return f"{version}.{int(position)}"
+
+
+def decode_cursor(cursor):
+    """(dataset version, position) encoded in a cursor; raises ValueError if it is malformed"""
+    cursor_version, _, position = cursor.rpartition('.')
+    # Row positions are int64 at most; anything larger was not made by encode_cursor
+    if not cursor_version or not position.isascii() or not position.isdigit() or len(position) > 18:
+        raise ValueError("Malformed cursor; use the next_cursor of the previous page")
+    return cursor_version, int(position)
@@ -0,0 +1,295 @@
+"""
+Cleaning pipeline for the raw sales CSV.
+
+Shared by the API and the verification scripts so every code path applies the
+same rules: returns ('-R' invoices) are negated, INVOICEDATE (DD/MM/YYYY) is
+parsed into Date/Year/Month, and rows with unusable dates or revenue are
+dropped. Every step is vectorized; there are no per-row Python callbacks.
+"""
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import Stopwatch, record_stage
+
+RETURN_MARKER = '-R'
+INVOICE_DATE_FORMAT = '%d/%m/%Y'
+# Reasonable range for a single pharmacy transaction
+REVENUE_LIMIT = 1_000_000
+
+
+def return_mask(invoice_numbers):
+    """Boolean mask of return invoices (invoice number contains '-R')"""
+    return invoice_numbers.astype(str).str.contains(RETURN_MARKER, na=False, regex=False).to_numpy()
+
+
+def signed_revenue(df):
+    """NETREVENUEAMOUNT as numbers, negated for return invoices"""
+    amount = pd.to_numeric(df['NETREVENUEAMOUNT'], errors='coerce').to_numpy(dtype='float64')
+    return np.where(return_mask(df['INVOICENUMBER']), -amount, amount)
+
+
+# Formats tried in order; each one only sees the strings the previous ones could not parse.
+# None is a per-string parse without a format, reading ambiguous dates day first.
+INVOICE_DATE_FORMATS = [
+    ('dd/mm/yyyy', INVOICE_DATE_FORMAT),
+    ('iso8601', 'ISO8601'),
+    ('dayfirst', None),
+]
+# Past this many distinct strings the parse table is cut back to the strings of the current parse
+MAX_DATE_TABLE_ENTRIES = 500_000
+
+
+def _parse_with(strings, date_format):
+    if date_format is None:
+        return pd.to_datetime(strings, format='mixed', dayfirst=True, errors='coerce')
+    return pd.to_datetime(strings, format=date_format, errors='coerce')
+
+
+class InvoiceDateParser:
+    """
+    Parses each distinct INVOICEDATE string once. A multi-year file has a few
+    thousand distinct dates across hundreds of thousands of rows, so the rows
+    are factorized, only strings not seen before are parsed (format by format),
+    and the results are mapped back to the rows through the factor codes. The
+    parse table is kept across chunks and reloads.
+    """
+
+    def __init__(self, formats=INVOICE_DATE_FORMATS, max_entries=MAX_DATE_TABLE_ENTRIES):
+        self.formats = formats
+        self.max_entries = max_entries
+        # Raw string -> parsed date and the index of the format that parsed it (len(formats): none did)
+        self._table = pd.DataFrame({'date': pd.Series(dtype='datetime64[us]'), 'format': pd.Series(dtype='int8')})
+
+    def _learn(self, strings):
+        strings = pd.Series(strings, dtype=object)
+        dates = pd.Series(pd.NaT, index=strings.index, dtype='datetime64[us]')
+        formats = np.full(len(strings), len(self.formats), dtype='int8')
+        pending = np.ones(len(strings), dtype=bool)
+        for position, (_, date_format) in enumerate(self.formats):
+            if not pending.any():
+                break
+            parsed = _parse_with(strings[pending], date_format)
+            ok = parsed.notna().to_numpy()
+            rows = np.flatnonzero(pending)[ok]
+            dates.iloc[rows] = parsed[ok].to_numpy()
+            formats[rows] = position
+            pending[rows] = False
+
+        learned = pd.DataFrame({'date': dates.to_numpy(), 'format': formats}, index=pd.Index(strings, dtype=object))
+        self._table = pd.concat([self._table, learned]) if len(self._table) else learned
+
+    def parse(self, raw_dates, counts=None):
+        """
+        Dates for a Series of raw strings (NaT where no format matched). Row
+        counts per format are added to the `counts` dict when one is passed.
+        """
+        codes, uniques = pd.factorize(raw_dates)
+        uniques = pd.Index(uniques, dtype=object)
+        known = self._table.index.isin(uniques)
+        unseen = uniques[~uniques.isin(self._table.index)]
+        if len(unseen):
+            if len(self._table) + len(unseen) > self.max_entries:
+                # Over the cap: keep only the strings this call still needs
+                self._table = self._table[known]
+            self._learn(unseen)
+        table = self._table.reindex(uniques)
+
+        # Missing values have code -1, which picks the trailing NaT / "missing" slot
+        dates = np.append(table['date'].to_numpy(), np.datetime64('NaT'))
+        formats = np.append(table['format'].to_numpy(dtype='int8'), -1)
+        if counts is not None:
+            self._count(formats[codes], counts, learned=len(unseen))
+        return pd.Series(dates[codes], index=raw_dates.index, name=raw_dates.name)
+
+    def _count(self, row_formats, counts, learned):
+        by_format = np.bincount(row_formats[row_formats >= 0], minlength=len(self.formats) + 1)
+        parsed = counts.setdefault('parsed', {})
+        failed = counts.setdefault('failed', {})
+        remaining = int(by_format.sum())
+        for position, (name, _) in enumerate(self.formats):
+            parsed[name] = parsed.get(name, 0) + int(by_format[position])
+            # Rows this format was tried on and could not parse
+            remaining -= int(by_format[position])
+            failed[name] = failed.get(name, 0) + remaining
+        counts['unparseable'] = counts.get('unparseable', 0) + int(by_format[-1])
+        counts['missing'] = counts.get('missing', 0) + int((row_formats < 0).sum())
+        counts['rows'] = counts.get('rows', 0) + len(row_formats)
+        counts['learned'] = counts.get('learned', 0) + learned
+        counts['table_size'] = len(self._table)
+
+
+_invoice_date_parser = InvoiceDateParser()
+
+
+def parse_invoice_dates(raw_dates, counts=None):
+    """
+    Parse INVOICEDATE strings (DD/MM/YYYY, then ISO 8601, then day-first
+    without a format), each distinct string once. Unparseable values become NaT.
+    """
+    return _invoice_date_parser.parse(raw_dates, counts)
+
+
+def merge_date_counts(counts_list):
+    """Sum the per-format counts of several parses (e.g. one per source file)"""
+    merged = {}
+    for counts in counts_list:
+        for key, value in (counts or {}).items():
+            if isinstance(value, dict):
+                target = merged.setdefault(key, {})
+                for name, count in value.items():
+                    target[name] = target.get(name, 0) + count
+            elif key == 'table_size':
+                merged[key] = max(merged.get(key, 0), value)
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def clean_sales_data(df, date_counts=None):
+    """
+    Apply the dashboard's cleaning rules to a raw sales frame and return a new
+    frame with signed NETREVENUEAMOUNT plus Date, Year and Month columns
+    """
+    df = df.copy()
+    df['NETREVENUEAMOUNT'] = signed_revenue(df)
+    df['Date'] = parse_invoice_dates(df['INVOICEDATE'], date_counts)
+
+    valid = (
+        df['Date'].notna().to_numpy()
+        & np.isfinite(df['NETREVENUEAMOUNT'].to_numpy())
+        & (np.abs(df['NETREVENUEAMOUNT'].to_numpy()) <= REVENUE_LIMIT)
+    )
+    df = df[valid].reset_index(drop=True)
+
+    df['Year'] = df['Date'].dt.year.astype(int)
+    df['Month'] = df['Date'].dt.month.astype(int)
+    return df
+
+
+# Rows parsed per chunk when streaming a CSV into the cleaned dataset
+CSV_CHUNK_ROWS = 100_000
+
+# Columns the dashboard uses; anything else in the CSV is never parsed
+REQUIRED_COLUMNS = ['INVOICENUMBER', 'INVOICEDATE', 'NETREVENUEAMOUNT']
+OPTIONAL_COLUMNS = ['PHARMACISTNAME', 'LOCATIONNAME', 'CASHREVENUE', 'CREDITREVENUE']
+USED_COLUMNS = REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+
+# Repetitive text columns stored as categoricals
+CATEGORICAL_COLUMNS = ['LOCATIONNAME', 'PHARMACISTNAME']
+# Money stays float64: float32 cannot hold two-decimal amounts exactly
+PAYMENT_COLUMNS = ['CASHREVENUE', 'CREDITREVENUE']
+
+# Types applied while parsing; numeric columns are coerced after parsing so a
+# stray non-numeric value becomes NaN instead of failing the whole load
+PARSE_DTYPES = {
+    'INVOICENUMBER': str,
+    'INVOICEDATE': str,
+    'PHARMACISTNAME': 'category',
+    'LOCATIONNAME': 'category',
+}
+
+
+def compact_frame(df):
+    """
+    Downcast a cleaned frame: categorical names, numeric payment columns,
+    small Year/Month integers, and no raw INVOICEDATE once Date is derived.
+    A name column missing from the CSV becomes an all-null categorical, so
+    every breakdown can group by it.
+    """
+    for column in CATEGORICAL_COLUMNS:
+        if column not in df:
+            df[column] = pd.Categorical.from_codes(np.full(len(df), -1), categories=pd.Index([], dtype=str))
+        elif not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    for column in PAYMENT_COLUMNS:
+        if column in df:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype('float64')
+    df['Year'] = df['Year'].astype('int16')
+    df['Month'] = df['Month'].astype('int8')
+    return df.drop(columns=['INVOICEDATE'])
+
+
+def concat_chunks(chunks):
+    """Concatenate cleaned chunks, unifying categoricals so they stay categorical"""
+    for column in CATEGORICAL_COLUMNS:
+        if not all(column in chunk for chunk in chunks):
+            continue
+        categories = pd.Index([])
+        for chunk in chunks:
+            categories = categories.union(chunk[column].cat.categories)
+        for chunk in chunks:
+            chunk[column] = chunk[column].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def read_clean_csv(source, chunksize=CSV_CHUNK_ROWS, names=None):
+    """
+    Parse a sales CSV (path or file object) in chunks, cleaning and downcasting
+    each chunk as it is read so the raw text frame never exists in full.
+    `names` gives the column names when the source has no header line (e.g.
+    the appended part of a file).
+    """
+    reader = pd.read_csv(
+        source,
+        chunksize=chunksize,
+        usecols=lambda column: column in USED_COLUMNS,
+        dtype=PARSE_DTYPES,
+        header=None if names else 'infer',
+        names=names,
+    )
+    chunks = []
+    date_counts = {}
+    parse, clean = Stopwatch(), Stopwatch()
+    for chunk in parse.iterate(reader):
+        missing = [column for column in REQUIRED_COLUMNS if column not in chunk]
+        if missing:
+            raise ValueError(f"Sales CSV is missing required columns: {', '.join(missing)}")
+        with clean:
+            chunks.append(compact_frame(clean_sales_data(chunk, date_counts)))
+    if not chunks:
+        raise ValueError("Sales CSV contains no rows")
+    with clean:
+        df = concat_chunks(chunks)
+    record_stage('parse', parse.seconds, chunks=len(chunks))
+    record_stage('clean', clean.seconds, rows=len(df))
+    # Travels with the frame, also back from a process pool worker
+    df.attrs['invoice_dates'] = date_counts
+    return df
+
+
+def memory_report(df, sample_rows=50_000):
+    """
+    Memory used by the compact frame, per column, next to an estimate of the
+    same rows in the naive representation (object strings including the raw
+    INVOICEDATE, int64 / float64 numbers), extrapolated from a sample
+    """
+    actual = df.memory_usage(deep=True)
+    sample = df.sample(min(sample_rows, len(df)), random_state=0) if len(df) else df
+    naive = pd.DataFrame(index=sample.index)
+    for column in sample.columns:
+        series = sample[column]
+        if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(series.dtype):
+            naive[column] = series.astype(object)
+        elif pd.api.types.is_integer_dtype(series.dtype):
+            naive[column] = series.astype('int64')
+        elif pd.api.types.is_float_dtype(series.dtype):
+            naive[column] = series.astype('float64')
+        else:
+            naive[column] = series
+    if 'Date' in sample:
+        naive['INVOICEDATE'] = sample['Date'].dt.strftime(INVOICE_DATE_FORMAT).astype(object)
+    scale = len(df) / len(sample) if len(sample) else 0
+    naive_bytes = int(naive.memory_usage(deep=True, index=False).sum() * scale)
+    compact_bytes = int(actual.sum())
+
+    return {
+        'rows': int(len(df)),
+        'bytes': compact_bytes,
+        'naive_bytes_estimate': naive_bytes,
+        'saved_ratio': round(1 - compact_bytes / naive_bytes, 3) if naive_bytes else None,
+        'columns': {
+            column: {'dtype': str(df[column].dtype), 'bytes': int(actual[column])}
+            for column in df.columns
+        },
+    }
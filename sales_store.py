@@ -0,0 +1,395 @@
+"""
+Query backends for the filtered, aggregate and metadata endpoints.
+
+Every backend answers the same three questions for a dataset version:
+- `metadata()`: the summary served by /api/sales-data-meta
+- `aggregate(years, months, locations)`: the dashboard tables of /api/aggregates
+- `filtered_page(...)`: one page of the rows matching the filters, in frame order
+
+`PandasStore` answers them from the in-memory frame, its partition index and
+the rollup cube. `SQLStore` loads the cleaned rows once per version into an
+embedded database file (SQLite, or DuckDB when the optional `duckdb` package
+is installed) with indexes on date, location and pharmacist, and pushes the
+filters and group-bys down as SQL. Row positions are stored with the rows, so
+keyset cursors mean the same thing in both backends.
+
+`DATASET_BACKEND` picks the backend (`pandas`, `sqlite` or `duckdb`); if the
+store cannot be built the pandas path is used instead.
+
+With a SQL store the database file is the dataset's copy of the rows: once a
+version is built and snapshotted, the in-memory frame is released and read
+back from the store (`read_frame()`) only when a caller needs all rows (the
+full export, the next append). The rollup and returns cubes are built while
+the frame is still loaded, and the partition index and in-memory metadata are
+not built at all. An incremental append copies the previous version's file
+and rewrites only the rows from the append boundary on.
+"""
+
+import glob
+import os
+import shutil
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from analytics import aggregate_measures
+from instrumentation import get_logger, timed
+from sales_pipeline import PAYMENT_COLUMNS, return_mask
+
+try:
+    import duckdb
+    HAS_DUCKDB = True
+except ImportError:
+    HAS_DUCKDB = False
+
+logger = get_logger('sales_store')
+
+BACKENDS = ('pandas', 'sqlite', 'duckdb')
+TABLE = 'sales'
+# Stores of older versions are kept for a while: requests pinned to them may still be running
+KEEP_VERSIONS = 2
+INSERT_CHUNK_ROWS = 50_000
+
+INDEXES = {
+    'idx_sales_date': ['Date'],
+    'idx_sales_location': ['LOCATIONNAME', 'Date'],
+    'idx_sales_pharmacist': ['PHARMACISTNAME', 'Date'],
+    'idx_sales_year_month': ['Year', 'Month'],
+}
+
+# Per-row measures of analytics.measure_frame, as SQL sums
+MEASURE_SQL = """
+    SUM(NETREVENUEAMOUNT) AS revenue,
+    SUM(CASE WHEN IS_RETURN = 0 THEN NETREVENUEAMOUNT ELSE 0 END) AS grossSales,
+    SUM(CASE WHEN IS_RETURN = 1 THEN -NETREVENUEAMOUNT ELSE 0 END) AS returns,
+    COUNT(*) AS transactions,
+    SUM(1 - IS_RETURN) AS salesTransactions,
+    SUM(IS_RETURN) AS returnTransactions,
+    SUM(COALESCE(CASHREVENUE, 0)) AS cash,
+    SUM(COALESCE(CREDITREVENUE, 0)) AS credit
+"""
+
+
+def configured_backend():
+    """Backend named by DATASET_BACKEND; duckdb degrades to sqlite when the package is missing"""
+    backend = os.getenv('DATASET_BACKEND', 'pandas').lower()
+    if backend not in BACKENDS:
+        logger.warning("Unknown DATASET_BACKEND, using pandas", extra={'backend': backend})
+        return 'pandas'
+    if backend == 'duckdb' and not HAS_DUCKDB:
+        logger.warning("DATASET_BACKEND=duckdb but duckdb is not installed, using sqlite")
+        return 'sqlite'
+    return backend
+
+
+class PandasStore:
+    """The in-memory path: partition index for pages, rollup cube for aggregates"""
+
+    backend = 'pandas'
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def metadata(self):
+        return self.dataset.metadata
+
+    def aggregate(self, years=None, months=None, locations=None):
+        return self.dataset.rollup.aggregate(years, months, locations)
+
+    def filtered_page(self, years, months, locations, limit, offset=0, after=None):
+        """(rows, total matching, position of the last row, more rows after it)"""
+        index = self.dataset.index
+        parts = index.select(years, months, locations)
+        total = index.count(parts)
+        positions = index.page_after(parts, after, limit) if after is not None else index.page_offset(parts, offset, limit)
+        last = int(positions[-1]) if len(positions) else None
+        has_more = last is not None and index.count_after(parts, last) > 0
+        return self.dataset.frame.take(positions), total, last, has_more
+
+    def info(self):
+        return {'backend': self.backend}
+
+
+def _store_columns(frame, start=0):
+    """The frame's columns as plain values a database can store: ISO date strings, no categoricals"""
+    columns = {'pos': np.arange(start, start + len(frame), dtype='int64')}
+    for name, column in frame.items():
+        if name == 'Date':
+            column = column.dt.strftime('%Y-%m-%d')
+        elif isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.astype(object)
+        columns[name] = column
+    columns['IS_RETURN'] = return_mask(frame['INVOICENUMBER']).astype('int8')
+    # MEASURE_SQL sums the payment columns, so a CSV without them stores NULLs
+    for name in PAYMENT_COLUMNS:
+        columns.setdefault(name, np.full(len(frame), np.nan))
+    return pd.DataFrame(columns)
+
+
+def _sql_type(column):
+    if pd.api.types.is_integer_dtype(column):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(column):
+        return 'REAL'
+    return 'TEXT'
+
+
+def _in_clause(column, values):
+    return f"{column} IN ({', '.join('?' for _ in values)})", list(values)
+
+
+class SQLStore:
+    """One dataset version in an embedded database file, queried with SQL"""
+
+    def __init__(self, path, backend, dtypes):
+        self.path = path
+        self.backend = backend
+        # Frame dtypes, in frame order (without the pos / IS_RETURN helpers), to read the frame back
+        self.dtypes = dtypes
+        self.columns = list(dtypes.index)
+        self._metadata = None
+
+    @classmethod
+    def build(cls, dataset, directory, backend='sqlite', previous=None):
+        """
+        Load `dataset` into `<directory>/sales-<version>.<backend>`, reusing the file if it exists.
+        After an append to `previous`, only the rows from the append boundary on are written.
+        """
+        os.makedirs(directory, exist_ok=True)
+        frame = dataset.frame
+        path = os.path.join(directory, f"{TABLE}-{dataset.version}.{backend}")
+        store = cls(path, backend, frame.dtypes)
+        if not os.path.exists(path):
+            # Built under a private name: several gunicorn workers may build the same version
+            building = f"{path}.{os.getpid()}.tmp"
+            appended = getattr(dataset, 'appended', None)
+            if store._extends(previous, appended):
+                with timed('store', backend=backend, rows=len(frame) - appended['boundary'], append=True):
+                    store._append(building, previous.path, frame, appended['boundary'])
+            else:
+                with timed('store', backend=backend, rows=len(frame)):
+                    store._load(building, frame)
+            os.replace(building, path)
+            logger.info("Dataset store built", extra={'backend': backend, 'path': path, 'rows': len(frame)})
+        store._metadata = store._query_metadata()
+        _prune(directory, backend, keep=path)
+        return store
+
+    def _connect(self, path=None, read_only=True):
+        path = path or self.path
+        if self.backend == 'duckdb':
+            return duckdb.connect(path, read_only=read_only)
+        if read_only:
+            return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        return sqlite3.connect(path)
+
+    def _extends(self, previous, appended):
+        """True if this version is `previous` plus appended rows, so its file can be copied and extended"""
+        return (
+            isinstance(previous, SQLStore) and previous.backend == self.backend and appended is not None
+            and os.path.basename(previous.path) == f"{TABLE}-{appended['previous_version']}.{self.backend}"
+            and previous.columns == self.columns and os.path.exists(previous.path)
+        )
+
+    def _open_for_writing(self, path):
+        con = self._connect(path, read_only=False)
+        if self.backend == 'sqlite':
+            # A private file that is deleted on failure: no journal or fsync needed while loading it
+            con.execute("PRAGMA journal_mode = OFF")
+            con.execute("PRAGMA synchronous = OFF")
+        return con
+
+    def _insert(self, con, table):
+        """Bulk-insert a `_store_columns` table inside the open transaction"""
+        if self.backend == 'duckdb':
+            # DuckDB scans the frame directly
+            con.register('incoming', table)
+            con.execute(f"INSERT INTO {TABLE} SELECT * FROM incoming")
+            con.unregister('incoming')
+            return
+        insert = f"INSERT INTO {TABLE} VALUES ({', '.join('?' for _ in table.columns)})"
+        for start in range(0, len(table), INSERT_CHUNK_ROWS):
+            chunk = table.iloc[start:start + INSERT_CHUNK_ROWS]
+            # Column by column to Python values (NULL for missing ones), zipped into row tuples
+            columns = []
+            for name in chunk.columns:
+                values = chunk[name].to_numpy(dtype=object)
+                columns.append(np.where(pd.isna(values), None, values))
+            con.executemany(insert, zip(*columns))
+
+    def _write(self, path, write):
+        con = self._open_for_writing(path)
+        try:
+            write(con)
+            con.commit()
+        except Exception:
+            con.close()
+            os.remove(path)
+            raise
+        con.close()
+
+    def _load(self, path, frame):
+        table = _store_columns(frame)
+        definitions = ', '.join(
+            f"{name} INTEGER PRIMARY KEY" if name == 'pos' else f"{name} {_sql_type(table[name])}"
+            for name in table.columns
+        )
+
+        def write(con):
+            con.execute(f"CREATE TABLE {TABLE} ({definitions})")
+            self._insert(con, table)
+            for name, columns in INDEXES.items():
+                con.execute(f"CREATE INDEX {name} ON {TABLE} ({', '.join(columns)})")
+        self._write(path, write)
+
+    def _append(self, path, previous_path, frame, boundary):
+        """The previous version's file with the rows from `boundary` on (re-sorted by the append) rewritten"""
+        shutil.copyfile(previous_path, path)
+        table = _store_columns(frame.iloc[boundary:], start=boundary)
+
+        def write(con):
+            con.execute(f"DELETE FROM {TABLE} WHERE pos >= ?", [boundary])
+            self._insert(con, table)
+        self._write(path, write)
+
+    def _fetch(self, sql, params=()):
+        con = self._connect()
+        try:
+            cursor = con.execute(sql, params)
+            rows = cursor.fetchall()
+            names = [description[0] for description in cursor.description]
+        finally:
+            con.close()
+        return pd.DataFrame.from_records(rows, columns=names)
+
+    def _scalar(self, sql, params=()):
+        return self._fetch(sql, params).iat[0, 0]
+
+    @staticmethod
+    def _where(years=None, months=None, locations=None):
+        clauses, params = [], []
+        for column, values in (('Year', years), ('Month', months), ('LOCATIONNAME', locations)):
+            if values:
+                clause, values = _in_clause(column, values)
+                clauses.append(clause)
+                params += values
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def _query_metadata(self):
+        """dataset_metadata() computed in SQL, once per version"""
+        totals = self._fetch(f"""
+            SELECT COUNT(*) AS total_rows, MIN(Date) AS min_date, MAX(Date) AS max_date,
+                   COUNT(DISTINCT Date) AS unique_days,
+                   SUM(NETREVENUEAMOUNT) AS total_revenue,
+                   SUM(CASE WHEN IS_RETURN = 0 THEN NETREVENUEAMOUNT ELSE 0 END) AS gross_sales,
+                   SUM(CASE WHEN IS_RETURN = 1 THEN -NETREVENUEAMOUNT ELSE 0 END) AS return_amount,
+                   SUM(IS_RETURN) AS total_returns
+            FROM {TABLE}
+        """).iloc[0]
+
+        def distinct(column):
+            values = self._fetch(f"SELECT DISTINCT {column} FROM {TABLE} WHERE {column} IS NOT NULL")[column]
+            return sorted(str(value) for value in values)
+
+        years = self._fetch(f"SELECT DISTINCT Year FROM {TABLE}")['Year']
+        locations = distinct('LOCATIONNAME')
+        total_rows = int(totals['total_rows'])
+        return {
+            'total_rows': total_rows,
+            'date_range': {'min': totals['min_date'], 'max': totals['max_date']},
+            'available_years': sorted((int(year) for year in years), reverse=True),
+            'locations': locations,
+            'sample_locations': locations,
+            'pharmacists': distinct('PHARMACISTNAME'),
+            'unique_days': int(totals['unique_days']),
+            'total_revenue': round(float(totals['total_revenue'] or 0), 2),
+            'gross_sales': round(float(totals['gross_sales'] or 0), 2),
+            'return_amount': round(float(totals['return_amount'] or 0), 2),
+            'total_returns': int(totals['total_returns'] or 0),
+            'sales_transactions': total_rows - int(totals['total_returns'] or 0),
+        }
+
+    def metadata(self):
+        return self._metadata
+
+    def aggregate(self, years=None, months=None, locations=None):
+        """Filter and group to day x location x pharmacist in SQL; only that small table comes back"""
+        where, params = self._where(years, months, locations)
+        cube = self._fetch(f"""
+            SELECT Date, LOCATIONNAME, PHARMACISTNAME, {MEASURE_SQL}
+            FROM {TABLE}{where}
+            GROUP BY Date, LOCATIONNAME, PHARMACISTNAME
+            ORDER BY Date
+        """, params)
+        cube['Date'] = pd.to_datetime(cube['Date'])
+        cube['Year'] = cube['Date'].dt.year
+        cube['Month'] = cube['Date'].dt.month
+        return aggregate_measures(cube)
+
+    def filtered_page(self, years, months, locations, limit, offset=0, after=None):
+        """(rows, total matching, position of the last row, more rows after it)"""
+        where, params = self._where(years, months, locations)
+        total = int(self._scalar(f"SELECT COUNT(*) FROM {TABLE}{where}", params))
+
+        columns = ', '.join(['pos'] + self.columns)
+        if after is not None:
+            keyset = f"{where} AND pos > ?" if where else " WHERE pos > ?"
+            rows = self._fetch(f"SELECT {columns} FROM {TABLE}{keyset} ORDER BY pos LIMIT ?", params + [after, limit])
+        else:
+            rows = self._fetch(f"SELECT {columns} FROM {TABLE}{where} ORDER BY pos LIMIT ? OFFSET ?",
+                               params + [limit, offset])
+
+        last = int(rows['pos'].iloc[-1]) if len(rows) else None
+        has_more = False
+        if last is not None:
+            keyset = f"{where} AND pos > ?" if where else " WHERE pos > ?"
+            has_more = bool(self._scalar(f"SELECT EXISTS (SELECT 1 FROM {TABLE}{keyset})", params + [last]))
+
+        rows = rows.set_index('pos', drop=True).rename_axis(None)
+        rows['Date'] = pd.to_datetime(rows['Date'])
+        return rows, total, last, has_more
+
+    def read_frame(self):
+        """All rows back as the cleaned frame, in frame order and with its dtypes"""
+        with timed('store_read', backend=self.backend):
+            frame = self._fetch(f"SELECT {', '.join(self.columns)} FROM {TABLE} ORDER BY pos")
+            for name, dtype in self.dtypes.items():
+                if name == 'Date':
+                    frame[name] = pd.to_datetime(frame[name])
+                elif isinstance(dtype, pd.CategoricalDtype):
+                    frame[name] = frame[name].astype('category')
+                else:
+                    frame[name] = frame[name].astype(dtype)
+        return frame
+
+    def info(self):
+        return {
+            'backend': self.backend,
+            'path': self.path,
+            'bytes': os.path.getsize(self.path) if os.path.exists(self.path) else None,
+        }
+
+
+def _prune(directory, backend, keep):
+    """Delete the store files of older versions, keeping the newest KEEP_VERSIONS"""
+    paths = sorted(glob.glob(os.path.join(directory, f"{TABLE}-*.{backend}")), key=os.path.getmtime, reverse=True)
+    for path in [path for path in paths if path != keep][KEEP_VERSIONS - 1:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def build_store(dataset, backend, directory, previous=None):
+    """
+    The query backend for `dataset`: SQL when configured and it builds, the pandas path otherwise.
+    `previous` is the store of the version `dataset` may have been appended to.
+    """
+    if backend == 'pandas':
+        return PandasStore(dataset)
+    try:
+        return SQLStore.build(dataset, directory, backend, previous)
+    except Exception:
+        logger.exception("Dataset store build failed, falling back to pandas", extra={'backend': backend})
+        return PandasStore(dataset)
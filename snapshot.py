@@ -0,0 +1,175 @@
+"""
+Typed columnar on-disk snapshot of the cleaned sales dataset.
+
+After a successful build the cleaned frame is written as Feather (Arrow IPC),
+together with a small JSON file holding the dataset version and the source
+validators (ETag / Last-Modified). On startup the snapshot is loaded instead of
+downloading and parsing the CSV; the first request then only has to confirm
+that the source did not change.
+
+Feather needs pyarrow. Without it the snapshot falls back to pandas' pickle
+format, which keeps the same dtypes but is slower and not portable.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import get_logger
+from sales_pipeline import CATEGORICAL_COLUMNS
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+logger = get_logger('snapshot')
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), '.data')
+SNAPSHOT_NAME = 'sales'
+# Bump whenever the cleaned frame's columns, dtypes or row order change
+SNAPSHOT_SCHEMA = 2
+
+
+def snapshot_dir():
+    return os.getenv('DATASET_SNAPSHOT_DIR', DEFAULT_SNAPSHOT_DIR)
+
+
+def _paths(directory=None):
+    directory = directory or snapshot_dir()
+    extension = 'feather' if HAS_PYARROW else 'pkl'
+    return (
+        os.path.join(directory, f"{SNAPSHOT_NAME}.{extension}"),
+        os.path.join(directory, f"{SNAPSHOT_NAME}.meta.json"),
+    )
+
+
+def _keys_path(directory=None):
+    return os.path.join(directory or snapshot_dir(), f"{SNAPSHOT_NAME}.keys.npy")
+
+
+def frame_path(directory, name):
+    """Path of a frame stored with `write_frame` (the extension follows the format)"""
+    return os.path.join(directory, f"{name}.{'feather' if HAS_PYARROW else 'pkl'}")
+
+
+def write_frame(frame, path):
+    """Write a frame (and its attrs) as Feather, or pickle without pyarrow, under a temporary name first"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if HAS_PYARROW:
+        frame.to_feather(tmp)
+    else:
+        frame.to_pickle(tmp)
+    os.replace(tmp, path)
+
+
+def read_frame(path):
+    return pd.read_feather(path) if HAS_PYARROW else pd.read_pickle(path)
+
+
+def apply_snapshot_types(df):
+    """Categoricals for repetitive names, datetime64 dates and float revenue"""
+    df = df.copy()
+    for column in CATEGORICAL_COLUMNS:
+        if column in df and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    df['Date'] = pd.to_datetime(df['Date'])
+    df['NETREVENUEAMOUNT'] = df['NETREVENUEAMOUNT'].astype('float64')
+    return df
+
+
+def write_snapshot(dataset, directory=None):
+    """Persist a Dataset; returns the data file path, or None if it could not be written"""
+    directory = directory or snapshot_dir()
+    data_path, meta_path = _paths(directory)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        frame = apply_snapshot_types(dataset.frame).reset_index(drop=True)
+
+        # Write to temporary names first so a crash never leaves a torn snapshot; per-process
+        # names so two processes writing at once never interleave
+        tmp_data, tmp_meta = f"{data_path}.{os.getpid()}.tmp", f"{meta_path}.{os.getpid()}.tmp"
+        keys_path = _keys_path(directory)
+        tmp_keys = f"{keys_path}.{os.getpid()}.tmp"
+        # The incremental ingest's dedupe key set, so appends after a restart do not rehash the frame
+        keys = getattr(dataset, 'invoice_keys', None)
+        if keys is not None:
+            with open(tmp_keys, 'wb') as f:
+                np.save(f, keys)
+        if HAS_PYARROW:
+            frame.to_feather(tmp_data)
+        else:
+            frame.to_pickle(tmp_data)
+        with open(tmp_meta, 'w') as f:
+            json.dump({
+                'version': dataset.version,
+                'source': dataset.source,
+                'etag': dataset.etag,
+                'last_modified': dataset.last_modified,
+                'files': dataset.files,
+                'ingest': getattr(dataset, 'ingest', None),
+                'invoice_keys': int(len(keys)) if keys is not None else None,
+                'rows': int(len(frame)),
+                'format': 'feather' if HAS_PYARROW else 'pickle',
+                'schema': SNAPSHOT_SCHEMA,
+                'written_at': time.time(),
+            }, f)
+        if keys is not None:
+            os.replace(tmp_keys, keys_path)
+        os.replace(tmp_data, data_path)
+        os.replace(tmp_meta, meta_path)
+        return data_path
+
+    except Exception as e:
+        logger.warning("Could not write dataset snapshot", extra={'directory': directory, 'error': str(e)})
+        return None
+
+
+def read_snapshot_meta(directory=None):
+    _, meta_path = _paths(directory)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def _load_keys(directory, meta):
+    """The stored dedupe key set, or None if there is none matching the snapshot"""
+    keys_path = _keys_path(directory)
+    if meta.get('invoice_keys') is None or not os.path.exists(keys_path):
+        return None
+    try:
+        keys = np.load(keys_path)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not read the snapshot's invoice keys", extra={'path': keys_path, 'error': str(e)})
+        return None
+    return keys if len(keys) == meta['invoice_keys'] else None
+
+
+def load_snapshot(directory=None):
+    """Return (frame, meta) for the stored snapshot, or None if there is no usable one"""
+    data_path, _ = _paths(directory)
+    try:
+        meta = read_snapshot_meta(directory)
+        if meta is None or not os.path.exists(data_path):
+            return None
+        if meta.get('schema') != SNAPSHOT_SCHEMA:
+            logger.info("Dataset snapshot was written by an older version, ignoring it")
+            return None
+        frame = pd.read_feather(data_path) if HAS_PYARROW else pd.read_pickle(data_path)
+        if len(frame) != meta.get('rows'):
+            logger.warning("Dataset snapshot is incomplete, ignoring it")
+            return None
+        keys = _load_keys(directory, meta)
+        if keys is not None:
+            # Picked up by the dataset's derive hook, like the ingest state
+            frame.attrs['invoice_keys'] = keys
+        return frame, meta
+
+    except Exception as e:
+        logger.warning("Could not read dataset snapshot", extra={'path': data_path, 'error': str(e)})
+        return None
@@ -0,0 +1,286 @@
+"""
+Where the sales CSVs come from: download helpers and multi-file sources.
+
+A multi-file source is a list of Google Drive URLs (one export per branch,
+say) or a local directory of CSVs (one per month, say) that together make up
+the dataset. On every refresh:
+
+- the files are fetched concurrently, each one conditionally: Drive files
+  with If-None-Match / If-Modified-Since, local files by mtime and size
+- files whose content hash was already parsed are not parsed again; the
+  others are parsed and cleaned in parallel in a process pool
+- the cleaned frames are concatenated into the shared dataset
+
+The cleaned frame of each file is kept on disk (next to the dataset
+snapshot, by content hash), not in memory: only the concatenated dataset
+stays resident, and unchanged files are read back from disk on the next
+build, also after a restart.
+
+Per-file validators travel with the dataset (`Dataset.files`), so a restored
+snapshot still knows which files it was built from.
+"""
+
+import hashlib
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import requests
+
+from dataset_cache import SourcePayload, hash_file
+from instrumentation import get_logger, timed
+from sales_pipeline import concat_chunks, merge_date_counts, read_clean_csv
+from snapshot import SNAPSHOT_SCHEMA, frame_path, read_frame, snapshot_dir, write_frame
+
+logger = get_logger('sources')
+
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+DOWNLOAD_TIMEOUT = 30
+MAX_DOWNLOAD_THREADS = 8
+
+
+def get_google_drive_download_url(share_url):
+    """
+    Convert a Google Drive share URL to a direct download URL
+    Supports both file/d/ and open?id= formats
+    """
+    if 'drive.google.com' not in share_url:
+        return share_url
+
+    # Extract file ID from different Google Drive URL formats
+    file_id = None
+
+    if '/file/d/' in share_url:
+        # Format: https://drive.google.com/file/d/FILE_ID/view?usp=sharing
+        file_id = share_url.split('/file/d/')[1].split('/')[0]
+    elif 'open?id=' in share_url:
+        # Format: https://drive.google.com/open?id=FILE_ID
+        file_id = share_url.split('open?id=')[1].split('&')[0]
+    elif 'id=' in share_url:
+        # Format: https://drive.google.com/uc?id=FILE_ID
+        file_id = share_url.split('id=')[1].split('&')[0]
+
+    if file_id:
+        return f"https://drive.google.com/uc?export=download&id={file_id}"
+
+    return share_url
+
+
+def download_to_spool(response):
+    """
+    Stream a download into a temporary file in fixed-size chunks, hashing it on the way,
+    so the whole file is never held in memory. Returns (path, digest, size).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(prefix='sales-', suffix='.csv', delete=False) as spool:
+        try:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                spool.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        except Exception:
+            spool.close()
+            os.remove(spool.name)
+            raise
+    return spool.name, digest.hexdigest()[:16], size
+
+
+def parse_csv_urls(value):
+    """Drive URLs from a comma / whitespace separated setting"""
+    return [url for url in value.replace(',', ' ').split() if url] if value else []
+
+
+class SourceFile:
+    """One file of a multi-file source, as seen by the latest fetch"""
+
+    def __init__(self, name, digest=None, etag=None, last_modified=None, path=None, temporary=False,
+                 not_modified=False):
+        self.name = name
+        self.digest = digest
+        self.etag = etag
+        self.last_modified = last_modified
+        self.path = path
+        self.temporary = temporary
+        self.not_modified = not_modified
+
+    def validators(self):
+        return {'digest': self.digest, 'etag': self.etag, 'last_modified': self.last_modified}
+
+    def discard(self):
+        if self.temporary and self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+
+
+class MultiSourcePayload(SourcePayload):
+    """Fetch result of a multi-file source; `source_files` are sorted by name"""
+
+    def __init__(self, source, source_files, unchanged_listing):
+        super().__init__(None, source, files={f.name: f.validators() for f in source_files})
+        self.source_files = source_files
+        self.unchanged_listing = unchanged_listing
+        self.digest = hashlib.sha256(
+            '\n'.join(f"{f.name}:{f.digest}" for f in source_files).encode('utf-8')
+        ).hexdigest()[:16]
+
+    @property
+    def not_modified(self):
+        return self.unchanged_listing and all(f.not_modified for f in self.source_files)
+
+    def discard(self):
+        for source_file in self.source_files:
+            source_file.discard()
+
+
+def _process_pool_context():
+    # Forking a process that runs threads (request workers, the refresher) is unsafe
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def _run_all(pool, calls):
+    """Results of `calls` ((function, *args) tuples) run in `pool`; on failure the spools already
+    downloaded are removed before the error is raised"""
+    futures = [pool.submit(*call) for call in calls]
+    try:
+        return [future.result() for future in futures]
+    except Exception:
+        for future in futures:
+            if not future.cancel() and future.exception() is None:
+                future.result().discard()
+        raise
+
+
+class MultiSource:
+    """
+    A dataset made of several CSV files: Drive URLs (`urls`) or every *.csv in
+    `directory`. `fetch` and `build` plug into DatasetCache. Cleaned per-file
+    frames are cached in `cache_dir` (default: `source-files` in the snapshot
+    directory).
+    """
+
+    def __init__(self, urls=None, directory=None, workers=None, label=None, cache_dir=None):
+        self.urls = list(urls or [])
+        self.directory = directory
+        self.workers = workers or os.cpu_count() or 1
+        self.label = label or ('Google Drive (multiple files)' if self.urls else 'Local CSV directory')
+        self.cache_dir = cache_dir or os.path.join(snapshot_dir(), 'source-files')
+
+    def describe(self):
+        return {'type': 'urls' if self.urls else 'directory', 'files': self.urls or self.directory,
+                'workers': self.workers}
+
+    def _locations(self):
+        if self.urls:
+            return [(url, get_google_drive_download_url(url)) for url in self.urls]
+        names = sorted(name for name in os.listdir(self.directory) if name.lower().endswith('.csv'))
+        if not names:
+            raise FileNotFoundError(f"No CSV files in {self.directory}")
+        return [(name, os.path.join(self.directory, name)) for name in names]
+
+    def _download(self, name, url, previous):
+        headers = {}
+        if previous:
+            if previous.get('etag'):
+                headers['If-None-Match'] = previous['etag']
+            if previous.get('last_modified'):
+                headers['If-Modified-Since'] = previous['last_modified']
+
+        with requests.get(url, headers=headers, timeout=DOWNLOAD_TIMEOUT, stream=True) as response:
+            if response.status_code == 304:
+                return SourceFile(name, previous['digest'], previous.get('etag'), previous.get('last_modified'),
+                                  not_modified=True)
+            response.raise_for_status()
+            path, digest, size = download_to_spool(response)
+        logger.info("Downloaded source file", extra={'file': name, 'bytes': size})
+        return SourceFile(name, digest, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                          path=path, temporary=True)
+
+    def _stat(self, name, path, previous):
+        stat = os.stat(path)
+        signature = f"{stat.st_mtime_ns}-{stat.st_size}"
+        if previous and previous.get('last_modified') == signature:
+            return SourceFile(name, previous['digest'], last_modified=signature, path=path, not_modified=True)
+        return SourceFile(name, hash_file(path), last_modified=signature, path=path)
+
+    def _fetch_one(self, name, location, previous):
+        if self.urls:
+            return self._download(name, location, previous)
+        return self._stat(name, location, previous)
+
+    def fetch(self, validators=None):
+        validators = validators or {}
+        previous = (validators.get('files') or {}) if validators.get('source') == self.label else {}
+        locations = self._locations()
+
+        with timed('download', files=len(locations)):
+            with ThreadPoolExecutor(max_workers=min(MAX_DOWNLOAD_THREADS, len(locations))) as pool:
+                source_files = _run_all(pool, [(self._fetch_one, name, location, previous.get(name))
+                                               for name, location in locations])
+
+        source_files.sort(key=lambda f: f.name)
+        unchanged_listing = set(previous) == {f.name for f in source_files}
+        return MultiSourcePayload(self.label, source_files, unchanged_listing)
+
+    def _parse(self, paths):
+        """Cleaned frames for `paths`, in parallel when there is more than one file and core"""
+        workers = min(self.workers, len(paths))
+        if workers <= 1:
+            return [read_clean_csv(path) for path in paths]
+        with timed('parse', files=len(paths), workers=workers):
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_process_pool_context()) as pool:
+                return list(pool.map(read_clean_csv, paths))
+
+    def _cached(self, digest):
+        """Where the cleaned frame of the file with this content hash is kept"""
+        return frame_path(self.cache_dir, f"{digest}.v{SNAPSHOT_SCHEMA}")
+
+    def _refetch(self, source_files):
+        """Download files in full again, concurrently (they were not modified, but their frames are gone)"""
+        with timed('download', files=len(source_files)):
+            with ThreadPoolExecutor(max_workers=min(MAX_DOWNLOAD_THREADS, len(source_files))) as pool:
+                fresh = _run_all(pool, [(self._download, f.name, get_google_drive_download_url(f.name), None)
+                                        for f in source_files])
+        for source_file, download in zip(source_files, fresh):
+            source_file.path, source_file.temporary, source_file.digest = download.path, True, download.digest
+
+    def _store(self, frames):
+        """Keep the new per-file frames on disk and drop those of files no longer in the dataset"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for digest, frame in frames.items():
+                write_frame(frame, self._cached(digest))
+        except OSError as e:
+            # Not fatal: those files are parsed again on the next build
+            logger.warning("Could not cache parsed source files", extra={'directory': self.cache_dir, 'error': str(e)})
+
+    def _prune(self, digests):
+        keep = {os.path.basename(self._cached(digest)) for digest in digests}
+        for name in os.listdir(self.cache_dir) if os.path.isdir(self.cache_dir) else []:
+            # Temporary names belong to a write in progress
+            if name not in keep and not name.endswith('.tmp'):
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def build(self, payload):
+        """Concatenate the cleaned frames of every file, parsing only files not parsed before"""
+        missing = [f for f in payload.source_files if not os.path.exists(self._cached(f.digest))]
+        # Unchanged files whose frame is not cached (e.g. the cache was cleared) have to be fetched in full
+        refetch = [f for f in missing if f.path is None]
+        if refetch:
+            self._refetch(refetch)
+
+        paths = [f.path for f in missing]
+        parsed = dict(zip((f.digest for f in missing), self._parse(paths))) if missing else {}
+        self._store(parsed)
+        frames = [parsed[f.digest] if f.digest in parsed else read_frame(self._cached(f.digest))
+                  for f in payload.source_files]
+        self._prune(f.digest for f in payload.source_files)
+        payload.files = {f.name: f.validators() for f in payload.source_files}
+        logger.info("Multi-file source built", extra={'files': len(frames), 'parsed': len(missing),
+                                                       'reused': len(frames) - len(missing)})
+        with timed('concat'):
+            df = concat_chunks(frames)
+        df.attrs['invoice_dates'] = merge_date_counts(frame.attrs.get('invoice_dates') for frame in frames)
+        return df
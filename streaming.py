@@ -0,0 +1,149 @@
+"""
+Streaming serialization of DataFrames for large API responses.
+
+Rows are serialized a chunk at a time from a generator, so the first bytes go
+out as soon as the first chunk is ready and the server never holds the whole
+JSON document in memory. Supported layouts:
+
+- a JSON array (`[{...},{...}]`), byte-compatible with `to_json(orient='records')`,
+  or with a buffered `jsonify(df.to_dict('records'))` when the app's encoder
+  is passed as `dumps`
+- NDJSON, one JSON object per line (`application/x-ndjson`)
+- columnar JSON: one array per column, with repetitive text columns
+  dictionary-encoded as integer codes plus a list of distinct values
+- an Arrow IPC stream (`application/vnd.apache.arrow.stream`), which needs
+  the optional `pyarrow` package
+"""
+
+import io
+import json
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+STREAM_CHUNK_ROWS = 5000
+NDJSON_MIMETYPE = 'application/x-ndjson'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+
+def negotiate_format(request):
+    """
+    Response layout the client asked for: 'arrow', 'columnar', 'ndjson' or
+    'json', from ?format= / ?layout= or the Accept header
+    """
+    requested = request.args.get('format')
+    if requested in ('arrow', 'ndjson', 'columnar'):
+        return requested
+    if request.args.get('layout') == 'columnar':
+        return 'columnar'
+    best = request.accept_mimetypes.best
+    if best == ARROW_MIMETYPE:
+        return 'arrow'
+    if best == NDJSON_MIMETYPE:
+        return 'ndjson'
+    return 'json'
+
+
+def _chunks(df, chunk_rows, transform=None):
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        yield transform(chunk) if transform is not None else chunk
+
+
+def _records_json(chunk, dumps, **to_json_kwargs):
+    """A chunk as a JSON array of records: `to_json`, or `dumps` over `to_dict('records')`"""
+    if dumps is not None:
+        return dumps(chunk.to_dict('records'))
+    return chunk.to_json(orient='records', **to_json_kwargs)
+
+
+def iter_json_array(df, chunk_rows=STREAM_CHUNK_ROWS, transform=None, dumps=None, **to_json_kwargs):
+    """
+    Yield a JSON array of records, one chunk of rows at a time. `dumps` (a
+    compact JSON encoder) replaces `to_json` for the values
+    """
+    yield '['
+    first = True
+    for chunk in _chunks(df, chunk_rows, transform):
+        body = _records_json(chunk, dumps, **to_json_kwargs)[1:-1]
+        if not body:
+            continue
+        yield body if first else ',' + body
+        first = False
+    yield ']'
+
+
+def iter_ndjson(df, chunk_rows=STREAM_CHUNK_ROWS, transform=None, dumps=None, **to_json_kwargs):
+    """Yield newline-delimited JSON records, one chunk of rows at a time"""
+    for chunk in _chunks(df, chunk_rows, transform):
+        if not len(chunk):
+            continue
+        if dumps is not None:
+            yield ''.join(dumps(record) + '\n' for record in chunk.to_dict('records'))
+        else:
+            yield chunk.to_json(orient='records', lines=True, **to_json_kwargs).rstrip('\n') + '\n'
+
+
+def iter_json_object(prefix_fields, array_field, df, chunk_rows=STREAM_CHUNK_ROWS, transform=None, dumps=None,
+                     **to_json_kwargs):
+    """
+    Yield `{"<field>": ..., "<array_field>": [records]}` with the small fields
+    first, so they can be read before the records finish streaming
+    """
+    encode = dumps or json.dumps
+    yield '{'
+    for name, value in prefix_fields.items():
+        yield f"{encode(name)}:{encode(value)},"
+    yield f"{encode(array_field)}:"
+    yield from iter_json_array(df, chunk_rows, transform, dumps, **to_json_kwargs)
+    yield '}'
+
+
+def _json_values(series):
+    """Column values as JSON-safe Python objects (NaN -> null, dates -> epoch ms)"""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        millis = (series - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)
+        return millis.astype('Int64').astype(object).where(series.notna(), None).tolist()
+    if series.hasnans:
+        return series.astype(object).where(series.notna(), None).tolist()
+    return series.tolist()
+
+
+def iter_columnar_json(df, dictionary_columns=()):
+    """
+    Yield `{"rows": n, "columns": {name: [values]}, "dictionaries": {name: [distinct]}}`,
+    one column at a time. Dictionary-encoded columns hold integer codes into
+    their dictionary, with -1 for missing values.
+    """
+    dictionaries = {}
+    yield f'{{"rows":{len(df)},"columns":{{'
+    for i, column in enumerate(df.columns):
+        series = df[column]
+        if column in dictionary_columns:
+            categorical = series.astype('category')
+            dictionaries[column] = categorical.cat.categories.tolist()
+            values = categorical.cat.codes.tolist()
+        else:
+            values = _json_values(series)
+        yield ('' if i == 0 else ',') + json.dumps(column) + ':' + json.dumps(values, separators=(',', ':'))
+    yield '},"dictionaries":' + json.dumps(dictionaries, separators=(',', ':')) + '}'
+
+
+def iter_arrow_ipc(df, chunk_rows=STREAM_CHUNK_ROWS):
+    """Yield an Arrow IPC stream, one record batch per chunk of rows"""
+    if not HAS_PYARROW:
+        raise RuntimeError("Arrow output requires the pyarrow package")
+    schema = pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for chunk in _chunks(df, chunk_rows):
+            writer.write_batch(pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
@@ -0,0 +1,148 @@
+import os
+import tempfile
+
+import pandas as pd
+import pytest
+
+os.environ.setdefault('DATASET_SNAPSHOT_DIR', tempfile.mkdtemp(prefix='test-snapshot-'))
+
+import app as server  # noqa: E402
+
+SALES_CSV = """INVOICENUMBER,INVOICEDATE,NETREVENUEAMOUNT,PHARMACISTNAME,LOCATIONNAME,CASHREVENUE,CREDITREVENUE
+A-1,01/01/2024,120.0,Dr. Sara,Albustan pharmacy,120.0,0.0
+A-2,01/01/2024,80.5,Dr. Ahmed,Hittin Pharmacy,0.0,80.5
+A-3,02/01/2024,45.25,Dr. Huda,Hittin Pharmacy,45.25,0.0
+A-1-R,05/01/2024,-20.0,Dr. Sara,Albustan pharmacy,-20.0,0.0
+A-4,14/02/2024,300.0,Dr. Ahmed,Albustan pharmacy,100.0,200.0
+A-5,29/02/2024,15.75,Dr. Huda,Albustan pharmacy,15.75,0.0
+A-6,03/03/2024,60.0,Dr. Sara,Hittin Pharmacy,0.0,60.0
+B-1,02/01/2025,210.0,Dr. Sara,Albustan pharmacy,210.0,0.0
+B-2,15/01/2025,99.99,Dr. Huda,Hittin Pharmacy,0.0,99.99
+B-2-R,16/01/2025,-9.99,Dr. Huda,Hittin Pharmacy,0.0,-9.99
+B-3,10/02/2025,50.0,Dr. Ahmed,Hittin Pharmacy,50.0,0.0
+B-4,11/02/2025,75.0,Dr. Ahmed,Albustan pharmacy,75.0,0.0
+"""
+
+
+@pytest.fixture(scope='module')
+def client():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sales.csv')
+        with open(path, 'w') as f:
+            f.write(SALES_CSV)
+        server.GOOGLE_DRIVE_CSV_URL = None
+        server.multi_source = None
+        server.LOCAL_CSV_PATH = path
+        server.sales_cache.invalidate(drop=True)
+        yield server.app.test_client()
+        server.sales_cache.invalidate(drop=True)
+
+
+@pytest.fixture
+def sales(client):
+    """The cleaned rows with the measures spelled out, for computing expected answers with plain pandas"""
+    frame = server.sales_cache.get().frame
+    is_return = frame['INVOICENUMBER'].str.contains('-R', regex=False)
+    return frame.assign(
+        revenue=frame['NETREVENUEAMOUNT'],
+        returns=(-frame['NETREVENUEAMOUNT']).where(is_return, 0.0),
+        transactions=1,
+        returnTransactions=is_return.astype(int),
+    )
+
+
+def test_rankings_match_a_pandas_group_by(client, sales):
+    for metric, order in (('revenue', 'top'), ('transactions', 'bottom')):
+        result = client.get(f'/api/rankings?dimension=pharmacist&metric={metric}&order={order}&n=2&years=2024')
+        assert result.status_code == 200
+
+        table = sales[sales['Year'] == 2024].groupby('PHARMACISTNAME', observed=True)[['revenue', 'transactions']].sum()
+        tiebreak = 'transactions' if metric == 'revenue' else 'revenue'
+        expected = table.reset_index().sort_values(
+            [metric, tiebreak, 'PHARMACISTNAME'], ascending=[order == 'bottom', order == 'bottom', True]).head(2)
+        ranked = result.get_json()['results']
+        assert [row['name'] for row in ranked] == expected['PHARMACISTNAME'].tolist()
+        assert [row['revenue'] for row in ranked] == expected['revenue'].round(2).tolist()
+
+
+def test_day_rankings_report_returns_per_day(client, sales):
+    ranked = client.get('/api/rankings?dimension=day&metric=returnRate&n=1').get_json()['results'][0]
+
+    daily = sales.groupby('Date')[['transactions', 'returnTransactions', 'returns']].sum()
+    rates = (daily['returnTransactions'] / daily['transactions']).sort_values(ascending=False, kind='stable')
+    best = rates.index[0]
+    assert ranked['date'] == best.strftime('%Y-%m-%d')
+    assert ranked['returnRate'] == round(rates.iloc[0], 4)
+    assert ranked['returns'] == round(daily.loc[best, 'returns'], 2)
+
+
+def test_timeseries_matches_a_pandas_resample(client, sales):
+    result = client.get('/api/timeseries?start=2024-01-01&end=2024-04-30&granularity=month&locations=Albustan pharmacy')
+    assert result.status_code == 200
+
+    rows = sales[(sales['LOCATIONNAME'] == 'Albustan pharmacy') & (sales['Date'] <= '2024-04-30')]
+    monthly = rows.set_index('Date')[['revenue', 'transactions']].resample('MS').sum()
+    monthly = monthly.reindex(pd.date_range('2024-01-01', '2024-04-01', freq='MS'), fill_value=0)
+    series = result.get_json()['series']
+    # Months without sales are kept, with zeros
+    assert [point['period'] for point in series] == monthly.index.strftime('%Y-%m-%d').tolist()
+    assert [point['revenue'] for point in series] == monthly['revenue'].round(2).tolist()
+    assert [point['transactions'] for point in series] == monthly['transactions'].tolist()
+    assert result.get_json()['totals']['revenue'] == round(rows['revenue'].sum(), 2)
+
+
+def test_compare_matches_per_year_pandas_totals(client, sales):
+    result = client.get('/api/compare?periods=2024,2025&months=1&months=2')
+    assert result.status_code == 200
+    periods = result.get_json()['periods']
+
+    for period, year in zip(periods, (2024, 2025)):
+        rows = sales[(sales['Year'] == year) & sales['Month'].isin([1, 2])]
+        summary = period['summary']
+        assert summary['totalRevenue'] == round(rows['revenue'].sum(), 2)
+        assert summary['totalTransactions'] == len(rows)
+        assert summary['totalReturns'] == round(rows['returns'].sum(), 2)
+        assert summary['uniqueDays'] == rows['Date'].nunique()
+        by_location = rows.groupby('LOCATIONNAME', observed=True)['revenue'].sum().sort_values(ascending=False)
+        assert [(row['location'], row['revenue']) for row in period['locationStats']] == list(
+            zip(by_location.index, by_location.round(2)))
+        daily = rows.groupby('Date')['revenue'].sum()
+        assert period['topDaySales']['date'] == daily.idxmax().strftime('%Y-%m-%d')
+
+    baseline, current = (period['summary']['totalRevenue'] for period in periods)
+    assert result.get_json()['changes'][0]['totalRevenue'] == round((current - baseline) / abs(baseline) * 100, 2)
+
+
+def test_repeated_request_is_served_from_the_response_cache(client):
+    query = '/api/rankings?dimension=location&n=3'
+    first = client.get(query)
+    before = server.response_cache.stats()
+
+    again = client.get(query)
+    after = server.response_cache.stats()
+    assert again.get_data() == first.get_data()
+    assert again.headers['ETag'] == first.headers['ETag']
+    assert (after['hits'], after['misses']) == (before['hits'] + 1, before['misses'])
+
+    revalidated = client.get(query, headers={'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.get_data() == b''
+    assert server.response_cache.stats()['not_modified'] == after['not_modified'] + 1
+
+
+def test_cursor_pages_cover_the_filtered_rows_once(client, sales):
+    query = '/api/sales-data-filtered?years=2024&locations=Hittin Pharmacy&locations=Albustan pharmacy&limit=2'
+    numbers, cursor = [], None
+    while True:
+        page = client.get(query + (f'&cursor={cursor}' if cursor else '')).get_json()
+        numbers += [row['INVOICENUMBER'] for row in page['data']]
+        cursor = page['metadata']['next_cursor']
+        if cursor is None:
+            break
+
+    expected = sales[sales['Year'] == 2024]
+    assert page['metadata']['total_filtered'] == len(expected)
+    assert numbers == expected['INVOICENUMBER'].tolist()
+    # Offset paging walks the same rows
+    offset_page = client.get(query.replace('limit=2', 'limit=3') + '&offset=2').get_json()['data']
+    assert [row['INVOICENUMBER'] for row in offset_page] == numbers[2:5]
@@ -0,0 +1,104 @@
+import io
+import os
+import tempfile
+
+import pandas as pd
+
+os.environ.setdefault('DATASET_SNAPSHOT_DIR', tempfile.mkdtemp(prefix='test-snapshot-'))
+
+import app as server  # noqa: E402
+from dataset_cache import Dataset  # noqa: E402
+from ingest import append_sorted  # noqa: E402
+from sales_index import sort_for_index  # noqa: E402
+from sales_pipeline import read_clean_csv  # noqa: E402
+from sales_store import SQLStore  # noqa: E402
+
+SALES_CSV = """INVOICENUMBER,INVOICEDATE,NETREVENUEAMOUNT,PHARMACISTNAME,LOCATIONNAME,CASHREVENUE,CREDITREVENUE
+INV-1,01/01/2024,151.13,Dr. Sara,Albustan pharmacy,151.13,0.0
+INV-2,01/01/2024,97.89,Dr. Ahmed,Hittin Pharmacy,0.0,97.89
+INV-1-R,03/01/2024,20.5,Dr. Sara,Albustan pharmacy,20.5,0.0
+INV-3,2024-02-10,1e3,,Hittin Pharmacy,,
+INV-5,11/02/2024,40.0,Dr. Sara,Hittin Pharmacy,0.0,40.0
+INV-4,15/03/2025,12.345,Dr. Ahmed,Albustan pharmacy,12.345,0.0
+"""
+APPENDED_CSV = """INVOICENUMBER,INVOICEDATE,NETREVENUEAMOUNT,PHARMACISTNAME,LOCATIONNAME,CASHREVENUE,CREDITREVENUE
+INV-6,10/02/2024,8.5,Dr. Ahmed,Albustan pharmacy,8.5,0.0
+INV-7,20/03/2025,30.0,Dr. Sara,Hittin Pharmacy,0.0,30.0
+"""
+FILTERS = [
+    (None, None, None),
+    ([2024], None, None),
+    ([2024], [1, 2], None),
+    (None, None, ['Hittin Pharmacy']),
+    ([2025], None, ['Albustan pharmacy']),
+    ([2023], None, None),
+]
+
+
+def clean(csv):
+    return sort_for_index(read_clean_csv(io.StringIO(csv)))
+
+
+def build(frame, version, backend, monkeypatch, store_dir, previous=None):
+    monkeypatch.setattr(server, 'DATASET_BACKEND', backend)
+    monkeypatch.setattr(server, 'DATASET_STORE_DIR', store_dir)
+    dataset = Dataset(frame, version, 'Local CSV')
+    server.derive_dataset_structures(dataset, previous)
+    return dataset
+
+
+def pages(store, filters, limit=2):
+    """Every matching row, fetched page by page with keyset cursors"""
+    rows, after = [], None
+    while True:
+        page, total, last, has_more = store.filtered_page(*filters, limit, after=after)
+        rows.append(page)
+        if not has_more:
+            return pd.concat(rows), total
+        after = last
+
+
+def assert_same_answers(sql, pandas):
+    assert sql.store.metadata() == pandas.store.metadata()
+    for filters in FILTERS:
+        assert sql.store.aggregate(*filters) == pandas.store.aggregate(*filters), filters
+        sql_rows, sql_total = pages(sql.store, filters)
+        pandas_rows, pandas_total = pages(pandas.store, filters)
+        assert sql_total == pandas_total == len(pandas_rows), filters
+        pd.testing.assert_frame_equal(sql_rows.astype(object), pandas_rows.astype(object), check_dtype=False,
+                                      check_index_type=False)
+
+
+def test_sqlite_store_answers_like_pandas(monkeypatch, tmp_path):
+    frame = clean(SALES_CSV)
+    sql = build(frame, 'v1', 'sqlite', monkeypatch, str(tmp_path))
+    pandas = build(frame, 'v1', 'pandas', monkeypatch, str(tmp_path))
+
+    assert isinstance(sql.store, SQLStore)
+    assert_same_answers(sql, pandas)
+    # Offset pages agree as well
+    for offset in range(4):
+        assert (sql.store.filtered_page(None, None, None, 2, offset=offset)[0].index.tolist()
+                == pandas.store.filtered_page(None, None, None, 2, offset=offset)[0].index.tolist())
+
+
+def test_sqlite_store_holds_the_rows_and_is_extended_on_append(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, 'write_snapshot', lambda dataset: None)
+    frame = clean(SALES_CSV)
+    first = build(frame, 'v1', 'sqlite', monkeypatch, str(tmp_path))
+    server.persist_dataset(first)
+
+    # Released after the snapshot, and read back with the same rows and dtypes
+    assert not first.frame_resident
+    pd.testing.assert_frame_equal(first.frame, frame, check_categorical=False)
+
+    combined, boundary = append_sorted(first.frame, clean(APPENDED_CSV))
+    combined.attrs['appended'] = {'previous_version': 'v1', 'boundary': boundary, 'rows': 2, 'duplicates': 0}
+    loads = []
+    monkeypatch.setattr(SQLStore, '_load', lambda self, path, frame: loads.append(path))
+    appended = build(combined, 'v2', 'sqlite', monkeypatch, str(tmp_path), previous=first)
+
+    # Only the re-sorted tail was written, into a copy of v1's file
+    assert loads == [] and 0 < boundary < len(frame)
+    pd.testing.assert_frame_equal(appended.store.read_frame(), combined, check_categorical=False)
+    assert_same_answers(appended, build(combined, 'v2', 'pandas', monkeypatch, str(tmp_path)))
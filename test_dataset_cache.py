@@ -0,0 +1,36 @@
+import threading
+
+import pandas as pd
+
+from dataset_cache import DatasetCache, SourcePayload
+
+
+def test_concurrent_loads_share_one_build():
+    release = threading.Event()
+    builds = []
+
+    def build(payload):
+        builds.append(payload.version())
+        release.wait(5)
+        return pd.DataFrame({'NETREVENUEAMOUNT': [1.0, 2.0]})
+
+    cache = DatasetCache(lambda validators: SourcePayload(b'sales', 'test'), build)
+    results = []
+    callers = [threading.Thread(target=lambda: results.append(cache.get())) for _ in range(4)]
+    for caller in callers:
+        caller.start()
+    # Every caller has joined the load that is still building before it is allowed to finish
+    for _ in range(500):
+        if cache.stats()['joined_loads'] == 3:
+            break
+        threading.Event().wait(0.01)
+    release.set()
+    for caller in callers:
+        caller.join(5)
+
+    assert len(builds) == 1
+    assert len(results) == 4 and all(dataset is results[0] for dataset in results)
+    stats = cache.stats()
+    assert (stats['builds'], stats['joined_loads'], stats['rows']) == (1, 3, 2)
+    # Fresh within the TTL: served without another fetch
+    assert cache.get() is results[0] and len(builds) == 1
@@ -0,0 +1,38 @@
+import pandas as pd
+
+from returns import ReturnsAnalysis, match_returns
+from sales_pipeline import clean_sales_data
+
+
+def sales(numbers, dates, amounts):
+    return clean_sales_data(pd.DataFrame({
+        'INVOICENUMBER': numbers,
+        'INVOICEDATE': dates,
+        'NETREVENUEAMOUNT': amounts,
+        'PHARMACISTNAME': ['Dr. Sara'] * len(numbers),
+        'LOCATIONNAME': ['Albustan pharmacy'] * len(numbers),
+    }))
+
+
+def test_dataset_without_returns():
+    analysis = ReturnsAnalysis.build(sales(['A', 'B'], ['01/01/2024', '02/01/2024'], [10.0, 5.0]))
+
+    assert analysis.counts == {'returns': 0, 'matched': 0, 'unmatched': 0, 'unmatchedAmount': 0.0}
+    assert analysis.breakdown()['summary']['returnRate'] == 0.0
+
+
+def test_returns_join_to_the_first_sale_with_their_number():
+    df = sales(
+        ['A', 'B', 'A', 'A-R', 'A-R', 'C-R', 'B-R-R'],
+        ['01/01/2024', '01/01/2024', '02/01/2024', '05/01/2024', '06/01/2024', '07/01/2024', '08/01/2024'],
+        [10.0, 5.0, 7.0, 4.0, 1.0, 2.0, 3.0],
+    )
+    numbers = df['INVOICENUMBER'].tolist()
+
+    sale_positions, return_positions, matched = match_returns(df)
+
+    assert [numbers[p] for p in sale_positions] == ['A', 'B', 'A']
+    # Both parts of A's return go to its first row; C has no sale; 'B-R-R' returns 'B-R', not a sale
+    assert matched.tolist() == [numbers.index('A'), numbers.index('A'), -1, -1]
+    counts = ReturnsAnalysis.build(df).counts
+    assert (counts['matched'], counts['unmatched'], counts['unmatchedAmount']) == (2, 2, 5.0)
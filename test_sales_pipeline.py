@@ -0,0 +1,102 @@
+import pandas as pd
+
+import io
+
+import numpy as np
+
+from analytics import dataset_metadata
+from ingest import append_sorted, dedupe_invoices, key_set
+from rollup import RollupCube
+from returns import ReturnsAnalysis
+from sales_index import PartitionIndex, sort_for_index
+from sales_pipeline import InvoiceDateParser, clean_sales_data, read_clean_csv
+
+
+def test_parse_past_table_cap_keeps_known_dates():
+    parser = InvoiceDateParser(max_entries=5)
+    parser.parse(pd.Series(['01/01/2024', '02/01/2024', '03/01/2024']))
+
+    counts = {}
+    dates = parser.parse(pd.Series(['01/01/2024', '04/01/2024', '05/01/2024', '06/01/2024']), counts)
+
+    assert dates.tolist() == [pd.Timestamp(f'2024-01-0{day}') for day in (1, 4, 5, 6)]
+    assert counts['parsed']['dd/mm/yyyy'] == 4
+    assert counts['unparseable'] == 0
+    assert counts['table_size'] <= 5
+
+
+def test_parse_after_cap_still_learns_new_strings():
+    parser = InvoiceDateParser(max_entries=2)
+    for day in range(1, 10):
+        raw = pd.Series([f'0{day}/02/2024', '2024-03-01', 'not a date'])
+        dates = parser.parse(raw)
+        assert dates.iloc[0] == pd.Timestamp(f'2024-02-0{day}')
+        assert dates.iloc[1] == pd.Timestamp('2024-03-01')
+        assert pd.isna(dates.iloc[2])
+
+
+def test_returns_are_the_return_invoices_in_every_summary():
+    # A zero-amount return and a return recorded with a negative amount
+    df = clean_sales_data(pd.DataFrame({
+        'INVOICENUMBER': ['A', 'B', 'A-R', 'C-R'],
+        'INVOICEDATE': ['01/01/2024'] * 4,
+        'NETREVENUEAMOUNT': [10.0, 5.0, 0.0, -3.0],
+        'PHARMACISTNAME': ['Dr. Sara'] * 4,
+        'LOCATIONNAME': ['Albustan pharmacy'] * 4,
+    }))
+
+    summary = RollupCube.build(df).aggregate()['summary']
+    metadata = dataset_metadata(df)
+    assert summary['returnTransactions'] == metadata['total_returns'] == 2
+    assert summary['salesTransactions'] == metadata['sales_transactions'] == 2
+    assert summary['grossSales'] == metadata['gross_sales'] == 15.0
+
+
+def test_dedupe_against_known_keys_extends_them():
+    def rows(numbers, amounts):
+        return pd.DataFrame({
+            'INVOICENUMBER': numbers,
+            'Date': pd.to_datetime(['2024-01-01'] * len(numbers)),
+            'NETREVENUEAMOUNT': amounts,
+        })
+
+    existing = rows(['A', 'B', 'B-R'], [10.0, 5.0, -1.0])
+    # Re-exported A and B-R, a second partial return of B, and a repeated new invoice
+    appended = rows(['A', 'B-R', 'B-R', 'C', 'C'], [10.0, -1.0, -2.0, 7.0, 7.0])
+
+    kept, dropped, keys = dedupe_invoices(appended, key_set(existing))
+
+    assert kept['INVOICENUMBER'].tolist() == ['B-R', 'C']
+    assert dropped == 3
+    assert np.array_equal(keys, key_set(pd.concat([existing, kept])))
+
+
+def test_csv_without_name_columns_still_rolls_up():
+    df = read_clean_csv(io.StringIO("INVOICENUMBER,INVOICEDATE,NETREVENUEAMOUNT\nA,01/01/2024,10\nA-R,02/01/2024,4\n"))
+
+    assert df['LOCATIONNAME'].isna().all() and df['PHARMACISTNAME'].isna().all()
+    summary = RollupCube.build(df).aggregate()['summary']
+    assert summary['totalRevenue'] == 6.0
+    assert ReturnsAnalysis.build(df).counts['matched'] == 1
+
+
+def test_appended_rollup_and_index_match_a_full_build():
+    header = "INVOICENUMBER,INVOICEDATE,NETREVENUEAMOUNT,PHARMACISTNAME,LOCATIONNAME\n"
+    existing = sort_for_index(read_clean_csv(io.StringIO(header + (
+        "A,01/01/2024,10,Dr. Sara,Albustan\nB,01/01/2024,5,Dr. Ahmed,Hittin\n"
+        "C,03/02/2024,7,Dr. Sara,Hittin\nC-R,04/02/2024,-2,Dr. Sara,Hittin\n"))))
+    cube, index = RollupCube.build(existing), PartitionIndex(existing)
+
+    # From the last day on the cube is extended; an earlier row makes it rebuild. Either way it matches.
+    for rows, incremental in (("D,04/02/2024,3,Dr. Ahmed,Albustan\nE,05/03/2024,8,Dr. Huda,Albustan\n", True),
+                              ("F,02/01/2024,4,Dr. Huda,Hittin\n", False)):
+        combined, boundary = append_sorted(existing, read_clean_csv(io.StringIO(header + rows)))
+        updated = cube.updated(combined)
+
+        assert updated.incremental == incremental
+        assert updated.aggregate() == RollupCube.build(combined).aggregate()
+        assert updated.aggregate([2024], [2], ['Hittin']) == RollupCube.build(combined).aggregate([2024], [2], ['Hittin'])
+        full = PartitionIndex(combined)
+        appended = index.appended(combined, boundary)
+        assert appended.partitions.keys() == full.partitions.keys()
+        assert all(np.array_equal(appended.partitions[key], full.partitions[key]) for key in full.partitions)
@@ -0,0 +1,51 @@
+import os
+
+import pandas as pd
+
+from sources import MultiSource
+
+HEADER = "INVOICENUMBER,INVOICEDATE,NETREVENUEAMOUNT,PHARMACISTNAME,LOCATIONNAME,CASHREVENUE,CREDITREVENUE\n"
+JANUARY = HEADER + "J-1,01/01/2024,10,Dr. Sara,Albustan pharmacy,10,0\nJ-1-R,02/01/2024,4,Dr. Sara,Albustan pharmacy,4,0\n"
+FEBRUARY = HEADER + "F-1,01/02/2024,7.5,Dr. Ahmed,Hittin Pharmacy,0,7.5\n"
+
+
+def write(directory, name, text):
+    with open(os.path.join(directory, name), 'w') as f:
+        f.write(text)
+
+
+def build(source, validators=None):
+    payload = source.fetch(validators)
+    df = source.build(payload)
+    return df, {'source': payload.source, 'files': payload.files}
+
+
+def test_directory_source_parses_only_changed_files(tmp_path, monkeypatch):
+    directory, cache = tmp_path / 'csv', tmp_path / 'cache'
+    directory.mkdir()
+    write(directory, '2024-01.csv', JANUARY)
+    write(directory, '2024-02.csv', FEBRUARY)
+    source = MultiSource(directory=str(directory), workers=1, cache_dir=str(cache))
+    parsed = []
+    parse = source._parse
+    monkeypatch.setattr(source, '_parse', lambda paths: parsed.append(len(paths)) or parse(paths))
+
+    df, validators = build(source)
+    assert df['INVOICENUMBER'].tolist() == ['J-1', 'J-1-R', 'F-1']
+    assert df['NETREVENUEAMOUNT'].sum() == 10 - 4 + 7.5
+    assert len(os.listdir(cache)) == 2
+
+    write(directory, '2024-02.csv', FEBRUARY + "F-2,03/02/2024,2,Dr. Ahmed,Hittin Pharmacy,2,0\n")
+    df, validators = build(source, validators)
+    expected = pd.concat([pd.read_csv(directory / name) for name in ('2024-01.csv', '2024-02.csv')])
+    assert df['INVOICENUMBER'].tolist() == expected['INVOICENUMBER'].tolist()
+    assert parsed == [2, 1]
+    # The frame of the old February file is gone from the cache
+    assert len(os.listdir(cache)) == 2
+
+    # A new process (no frames in memory) reuses the cached frames
+    restarted = MultiSource(directory=str(directory), workers=1, cache_dir=str(cache))
+    monkeypatch.setattr(restarted, '_parse', lambda paths: parsed.append(len(paths)) or parse(paths))
+    again, _ = build(restarted, validators)
+    assert parsed == [2, 1]
+    pd.testing.assert_frame_equal(again, df)
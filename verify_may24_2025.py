@@ -7,19 +7,20 @@ import pandas as pd
 import sys
 import os
 
+from sales_pipeline import clean_sales_data, return_mask
+
 def main():
     try:
         # Load the CSV file
         csv_path = os.path.join(os.path.dirname(__file__), 'sales.csv')
         print(f"Loading data from: {csv_path}")
         
-        df = pd.read_csv(csv_path)
+        df = pd.read_csv(csv_path, dtype={'INVOICENUMBER': str, 'INVOICEDATE': str})
         print(f"Loaded {len(df)} total records")
         
-        # Convert date column
-        df['Date'] = pd.to_datetime(df['INVOICEDATE'], format='%d/%m/%Y', errors='coerce')
-        df.dropna(subset=['Date'], inplace=True)
-        print(f"After date parsing: {len(df)} records")
+        # Same cleaning as the API: returns negated, dates parsed, unusable dates / amounts dropped
+        df = clean_sales_data(df)
+        print(f"After cleaning: {len(df)} records")
         
         # Filter for May 24, 2025
         target_date = pd.to_datetime('2025-05-24')
@@ -33,22 +34,19 @@ def main():
         # Apply the same logic as backend: negate returns
         print("\n=== BACKEND LOGIC (what frontend receives) ===")
         may24_processed = may24_data.copy()
-        return_mask = may24_processed['INVOICENUMBER'].astype(str).str.contains('-R', na=False)
-        returns_count = return_mask.sum()
+        is_return = return_mask(may24_processed['INVOICENUMBER'])
+        returns_count = is_return.sum()
         print(f"Return transactions found: {returns_count}")
         
-        # Apply backend logic: negate return amounts
-        may24_processed['ProcessedAmount'] = may24_processed.apply(
-            lambda row: -row['NETREVENUEAMOUNT'] if '-R' in str(row['INVOICENUMBER']) else row['NETREVENUEAMOUNT'], 
-            axis=1
-        )
+        # Cleaning already negated the return amounts
+        may24_processed['ProcessedAmount'] = may24_processed['NETREVENUEAMOUNT']
         
-        # Calculate net total (what frontend should see)
+        # Calculate net total (what frontend should see); returns are the '-R' invoices, as in the API
         net_revenue = may24_processed['ProcessedAmount'].sum()
-        sales_transactions = (may24_processed['ProcessedAmount'] > 0).sum()
-        return_transactions = (may24_processed['ProcessedAmount'] < 0).sum()
-        gross_sales = may24_processed[may24_processed['ProcessedAmount'] > 0]['ProcessedAmount'].sum()
-        total_returns = may24_processed[may24_processed['ProcessedAmount'] < 0]['ProcessedAmount'].abs().sum()
+        sales_transactions = (~is_return).sum()
+        return_transactions = returns_count
+        gross_sales = may24_processed['ProcessedAmount'][~is_return].sum()
+        total_returns = -may24_processed['ProcessedAmount'][is_return].sum()
         
         print(f"Net Revenue (what frontend should show): {net_revenue:,.2f} ﷼")
         print(f"Gross Sales: {gross_sales:,.2f} ﷼")
@@ -59,7 +57,7 @@ def main():
         
         # Show sample transactions
         print(f"\n=== Sample Transactions ===")
-        sample = may24_processed[['INVOICENUMBER', 'NETREVENUEAMOUNT', 'ProcessedAmount']].head(10)
+        sample = may24_processed[['INVOICENUMBER', 'ProcessedAmount']].head(10)
         print(sample.to_string(index=False))
         
         print(f"\n=== VERIFICATION ===")